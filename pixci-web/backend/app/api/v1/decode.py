@@ -1,9 +1,10 @@
 """Decode endpoints - PXVG to Image"""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
-from app.models.schemas import DecodeRequest, DecodeResponse, ErrorResponse
-from app.services.file_service import file_service
+from app.models.schemas import DecodeRequest, DecodeResponse, ErrorResponse, LiveDecodeResponse
 from app.services.pixci_service import pixci_service
 from app.core.logging import get_logger
 from app.core.exceptions import PixCIException
@@ -31,25 +32,15 @@ async def decode_pxvg(request: DecodeRequest):
     
     Returns base64 encoded PNG image and metadata.
     """
-    pxvg_path = None
-    output_path = None
-    
     try:
-        # Save PXVG code to temporary file
-        pxvg_path = file_service.create_temp_file(request.pxvg_code, "pxvg.xml")
-        
-        # Create output path for PNG
-        output_path = file_service.temp_dir / f"{pxvg_path.stem}.png"
-        
-        # Decode PXVG to image
-        width, height = pixci_service.decode_from_pxvg(
-            pxvg_path=pxvg_path,
-            output_path=output_path,
+        # Decode PXVG to image in memory (no temp files)
+        png, width, height = pixci_service.decode_from_pxvg(
+            pxvg_code=request.pxvg_code,
             scale=request.scale
         )
         
         # Convert image to base64
-        image_base64 = pixci_service.image_to_base64(output_path)
+        image_base64 = pixci_service.bytes_to_base64(png)
         
         logger.info(f"Successfully decoded PXVG to {width}x{height} image")
         
@@ -67,9 +58,44 @@ async def decode_pxvg(request: DecodeRequest):
     except Exception as e:
         logger.error(f"Unexpected error during decoding: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    finally:
-        # Cleanup temporary files
-        if pxvg_path:
-            file_service.cleanup_file(pxvg_path)
-        if output_path:
-            file_service.cleanup_file(output_path)
+
+
+@router.websocket("/live")
+async def decode_pxvg_live(websocket: WebSocket):
+    """
+    Live preview for an editor: send each version of the document as
+    `{"pxvg_code": ..., "scale": ...}` and receive a LiveDecodeResponse
+    (or `{"detail": ...}` on error).
+    
+    The connection keeps an incremental render session, so only layers
+    (frames) that changed since the previous message are rasterized again.
+    """
+    await websocket.accept()
+    session = pixci_service.create_render_session()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                # Malformed JSON or a non-object payload also raises ValidationError
+                request = DecodeRequest.model_validate_json(message)
+                image_base64, width, height, stats = await run_in_threadpool(
+                    pixci_service.render_live, session, request.pxvg_code, request.scale
+                )
+            except ValidationError as e:
+                await websocket.send_json({"detail": str(e)})
+                continue
+            except PixCIException as e:
+                await websocket.send_json({"detail": e.detail})
+                continue
+            
+            response = LiveDecodeResponse(
+                image_base64=image_base64,
+                width=width,
+                height=height,
+                scaled_width=width * request.scale,
+                scaled_height=height * request.scale,
+                render=stats
+            )
+            await websocket.send_json(response.model_dump())
+    except WebSocketDisconnect:
+        logger.info("Live decode session closed")
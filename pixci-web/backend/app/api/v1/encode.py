@@ -1,4 +1,6 @@
 """Encode endpoints - Image to PXVG"""
+from typing import Optional
+
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
 
@@ -23,7 +25,10 @@ logger = get_logger(__name__)
 async def encode_image(
     file: UploadFile = File(..., description="Image file to encode (PNG, JPG, GIF)"),
     block_size: int = Form(default=1, ge=1, le=16, description="Block size for pixel grouping"),
-    auto_detect: bool = Form(default=False, description="Auto-detect optimal block size")
+    auto_detect: bool = Form(default=False, description="Auto-detect optimal block size"),
+    cost_metric: str = Form(default="bytes", pattern="^(bytes|tokens)$", description="Cost model for tag selection: 'bytes' or 'tokens'"),
+    budget: Optional[int] = Form(default=None, ge=1, description="Lossy mode: maximum output size in budget_unit"),
+    budget_unit: str = Form(default="bytes", pattern="^(bytes|tokens|tags)$", description="Budget unit: 'bytes', 'tokens' or 'tags'")
 ):
     """
     Encode an image to PXVG format
@@ -33,6 +38,10 @@ async def encode_image(
     - **file**: Image file (PNG, JPG, GIF)
     - **block_size**: Size of pixel blocks (1-16)
     - **auto_detect**: Automatically detect optimal block size
+    - **cost_metric**: Minimize output size in 'bytes' or estimated LLM 'tokens'
+    - **budget**: Optional size limit; the image is simplified (similar colors merged,
+      isolated pixels and small details absorbed) until the output fits
+    - **budget_unit**: Unit of the budget: 'bytes', 'tokens' or 'tags'
     
     Returns PXVG XML code and metadata.
     """
@@ -47,11 +56,16 @@ async def encode_image(
         output_path = file_service.temp_dir / f"{image_path.stem}.pxvg.xml"
         
         # Encode to PXVG
+        stats = {}
         grid_w, grid_h, num_colors, final_block_size = pixci_service.encode_to_pxvg(
             image_path=image_path,
             output_path=output_path,
             block_size=block_size,
-            auto_detect=auto_detect
+            auto_detect=auto_detect,
+            cost_metric=cost_metric,
+            budget=budget,
+            budget_unit=budget_unit,
+            stats=stats
         )
         
         # Read generated PXVG code
@@ -65,7 +79,11 @@ async def encode_image(
             grid_width=grid_w,
             grid_height=grid_h,
             num_colors=num_colors,
-            block_size=final_block_size
+            block_size=final_block_size,
+            within_budget=stats.get("within_budget"),
+            changed_pixels=stats.get("changed_pixels"),
+            pixel_error=stats.get("pixel_error"),
+            mean_delta=stats.get("mean_delta")
         )
         
     except PixCIException as e:
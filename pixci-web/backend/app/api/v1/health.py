@@ -1,6 +1,7 @@
 """Health check endpoint"""
 from fastapi import APIRouter
 from app.models.schemas import HealthResponse
+from app.services.pixci_service import pixci_service
 from app import __version__
 
 router = APIRouter()
@@ -13,9 +14,11 @@ async def health_check():
     Health check endpoint
     
     Supports both GET and HEAD requests for monitoring tools
-    Returns service status and version information
+    Returns service status, version information, encode cache and render plan cache counters
     """
     return HealthResponse(
         status="healthy",
-        version=__version__
+        version=__version__,
+        encode_cache=pixci_service.cache_stats(),
+        render_plan_cache=pixci_service.plan_cache_stats()
     )
@@ -28,6 +28,13 @@ class Settings(BaseSettings):
     # Processing Configuration
     MAX_IMAGE_DIMENSION: int = Field(default=512, description="Maximum image dimension")
     DEFAULT_BLOCK_SIZE: int = Field(default=1, description="Default block size for encoding")
+    POSTPROCESS_WORKERS: int = Field(default=1, description="Workers for tiled postprocessing (1 = serial)")
+    
+    # Encode Cache Configuration
+    ENCODE_CACHE_ENTRIES: int = Field(default=256, description="Max encode results kept in memory (0 = disabled)")
+    ENCODE_CACHE_MAX_BYTES: int = Field(default=67108864, description="Max size of cached results in memory (64MB)")
+    ENCODE_CACHE_DIR: str = Field(default="", description="On-disk encode cache directory (empty = memory only)")
+    ENCODE_CACHE_DISK_MAX_BYTES: int = Field(default=268435456, description="Max size of the on-disk cache (256MB)")
     
     @property
     def cors_origins_list(self) -> List[str]:
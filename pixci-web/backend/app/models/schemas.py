@@ -3,10 +3,32 @@ from typing import Optional
 from pydantic import BaseModel, Field, validator
 
 
+class CacheStats(BaseModel):
+    """Encode cache counters"""
+    hits: int = Field(description="Total cache hits (memory + disk)")
+    memory_hits: int = Field(description="Hits served from memory")
+    disk_hits: int = Field(description="Hits served from the on-disk tier")
+    misses: int = Field(description="Cache misses (full encodes)")
+    evictions: int = Field(description="Entries evicted from memory or disk")
+    entries: int = Field(description="Entries currently in memory")
+    memory_bytes: int = Field(description="Size of cached results in memory")
+    disk_enabled: bool = Field(description="Whether the on-disk tier is enabled")
+
+
+class PlanCacheStats(BaseModel):
+    """Compiled PXVG render plan cache counters"""
+    hits: int = Field(description="Decodes that reused a compiled plan")
+    misses: int = Field(description="Documents parsed and compiled")
+    evictions: int = Field(description="Plans evicted (LRU)")
+    entries: int = Field(description="Plans currently cached")
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str = Field(default="healthy", description="Service status")
     version: str = Field(description="Application version")
+    encode_cache: Optional[CacheStats] = Field(default=None, description="Encode cache counters (null when disabled)")
+    render_plan_cache: Optional[PlanCacheStats] = Field(default=None, description="Compiled PXVG render plan cache counters")
 
 
 class EncodeRequest(BaseModel):
@@ -30,6 +52,10 @@ class EncodeResponse(BaseModel):
     grid_height: int = Field(description="Grid height in blocks")
     num_colors: int = Field(description="Number of unique colors")
     block_size: int = Field(description="Block size used")
+    within_budget: Optional[bool] = Field(default=None, description="Lossy mode: whether the output fits the budget")
+    changed_pixels: Optional[int] = Field(default=None, description="Lossy mode: pixels changed by simplification")
+    pixel_error: Optional[float] = Field(default=None, description="Lossy mode: percentage of pixels changed")
+    mean_delta: Optional[float] = Field(default=None, description="Lossy mode: mean RGBA distance per pixel")
     
     class Config:
         json_schema_extra = {
@@ -86,6 +112,18 @@ class DecodeResponse(BaseModel):
         }
 
 
+class LiveRenderStats(BaseModel):
+    """Work done by one incremental re-render (counted in layers, or frames for animations)"""
+    reused: int = Field(description="Unchanged, served from the session's buffers")
+    resumed: int = Field(description="Only elements appended since the last render were drawn")
+    rendered: int = Field(description="Rasterized from scratch")
+
+
+class LiveDecodeResponse(DecodeResponse):
+    """Response message of the live decode WebSocket"""
+    render: LiveRenderStats = Field(description="Incremental render counters")
+
+
 class ErrorResponse(BaseModel):
     """Error response model"""
     detail: str = Field(description="Error message")
@@ -1,8 +1,9 @@
 """PixCI encoding/decoding service"""
+import io
 import sys
 import base64
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 from PIL import Image
 
 from app.core.config import settings
@@ -15,8 +16,11 @@ logger = get_logger(__name__)
 sys.path.insert(0, str(Path(__file__).parent.parent.parent.parent.parent))
 
 try:
-    from pixci.core.pxvg_engine import encode_pxvg, decode_pxvg
+    from pixci.core.pxvg_engine import encode_pxvg, decode_pxvg_to_bytes
     from pixci.core.smart_encoder import smart_encode_pxvg
+    from pixci.core.encode_cache import EncodeCache, encode_cached
+    from pixci.core.render_plan import default_plan_cache
+    from pixci.core.render_session import RenderSession
 except ImportError as e:
     logger.error(f"Failed to import pixci modules: {e}")
     raise
@@ -25,6 +29,25 @@ except ImportError as e:
 class PixCIService:
     """Service for PixCI operations"""
     
+    def __init__(self):
+        # Content-addressed cache: re-uploads of the same pixels skip encoding
+        self.encode_cache = None
+        if settings.ENCODE_CACHE_ENTRIES > 0:
+            self.encode_cache = EncodeCache(
+                max_entries=settings.ENCODE_CACHE_ENTRIES,
+                max_bytes=settings.ENCODE_CACHE_MAX_BYTES,
+                disk_dir=settings.ENCODE_CACHE_DIR or None,
+                disk_max_bytes=settings.ENCODE_CACHE_DISK_MAX_BYTES
+            )
+    
+    def cache_stats(self) -> Optional[dict]:
+        """Encode cache counters (None when the cache is disabled)"""
+        return self.encode_cache.stats() if self.encode_cache else None
+    
+    def plan_cache_stats(self) -> dict:
+        """Compiled render plan counters (decode re-uses plans by document content)"""
+        return default_plan_cache().stats()
+    
     def validate_image(self, image_path: Path) -> None:
         """Validate image dimensions and format"""
         try:
@@ -50,11 +73,18 @@ class PixCIService:
         image_path: Path, 
         output_path: Path,
         block_size: int = 1,
-        auto_detect: bool = False
+        auto_detect: bool = False,
+        cost_metric: str = "bytes",
+        budget: Optional[int] = None,
+        budget_unit: str = "bytes",
+        stats: Optional[dict] = None
     ) -> Tuple[int, int, int, int]:
         """
         Encode image to PXVG format
         
+        With a budget the encoder simplifies the image until the document fits
+        (lossy); the introduced pixel error is written to `stats`.
+        
         Returns:
             Tuple of (grid_width, grid_height, num_colors, final_block_size)
         """
@@ -63,13 +93,22 @@ class PixCIService:
             
             logger.info(f"Encoding image: {image_path}, block_size={block_size}, auto={auto_detect}")
             
-            # Use smart encoder for better optimization
-            result = smart_encode_pxvg(
-                image_path=image_path,
-                output_path=output_path,
-                block_size=block_size,
-                auto_detect=auto_detect
-            )
+            options = dict(cost_metric=cost_metric, budget=budget, budget_unit=budget_unit)
+            if self.encode_cache is not None:
+                result = encode_cached(
+                    "pxvg", image_path, output_path, block_size, auto_detect,
+                    cache=self.encode_cache, stats=stats, **options
+                )
+            else:
+                # Use smart encoder for better optimization
+                result = smart_encode_pxvg(
+                    image_path=image_path,
+                    output_path=output_path,
+                    block_size=block_size,
+                    auto_detect=auto_detect,
+                    stats=stats,
+                    **options
+                )
             
             logger.info(f"Encoding successful: grid={result[0]}x{result[1]}, colors={result[2]}")
             return result
@@ -80,32 +119,66 @@ class PixCIService:
     
     def decode_from_pxvg(
         self,
-        pxvg_path: Path,
-        output_path: Path,
+        pxvg_code: str,
         scale: int = 1
-    ) -> Tuple[int, int]:
+    ) -> Tuple[bytes, int, int]:
         """
-        Decode PXVG to image
+        Decode PXVG code to PNG bytes in memory (compiled render plans are
+        cached by content, so re-decoding the same document only re-runs the
+        drawing ops)
         
         Returns:
-            Tuple of (width, height)
+            Tuple of (PNG bytes - image or spritesheet, width, height)
         """
         try:
-            logger.info(f"Decoding PXVG: {pxvg_path}, scale={scale}")
+            logger.info(f"Decoding PXVG: {len(pxvg_code)} chars, scale={scale}")
             
-            result = decode_pxvg(
-                text_path=pxvg_path,
-                output_path=output_path,
-                scale=scale
+            png = decode_pxvg_to_bytes(
+                pxvg_code,
+                fmt="png",
+                scale=scale,
+                workers=settings.POSTPROCESS_WORKERS
             )
+            with Image.open(io.BytesIO(png)) as img:
+                width, height = img.width // scale, img.height // scale
             
-            logger.info(f"Decoding successful: {result[0]}x{result[1]}")
-            return result
+            logger.info(f"Decoding successful: {width}x{height}")
+            return png, width, height
             
         except Exception as e:
             logger.error(f"Decoding failed: {e}")
             raise DecodingException(f"Failed to decode PXVG: {str(e)}")
     
+    def create_render_session(self) -> "RenderSession":
+        """New incremental decoder session (one per live editor connection)"""
+        return RenderSession(workers=settings.POSTPROCESS_WORKERS)
+    
+    def render_live(self, session: "RenderSession", pxvg_code: str, scale: int = 1) -> Tuple[str, int, int, dict]:
+        """
+        Re-render a new version of the document in a live session; only changed
+        layers (frames) are rasterized again
+        
+        Returns:
+            Tuple of (base64 PNG - image or spritesheet, width, height, render stats)
+        """
+        try:
+            result = session.render(pxvg_code)
+            img = result.image()
+            if scale > 1:
+                img = img.resize((img.width * scale, img.height * scale), Image.NEAREST)
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG")
+            image_base64 = self.bytes_to_base64(buffer.getvalue())
+            width, height = img.width // scale, img.height // scale
+            return image_base64, width, height, result.stats
+        except Exception as e:
+            logger.error(f"Live decoding failed: {e}")
+            raise DecodingException(f"Failed to decode PXVG: {str(e)}")
+    
+    def bytes_to_base64(self, data: bytes) -> str:
+        """Encode in-memory image bytes as base64 string"""
+        return base64.b64encode(data).decode('utf-8')
+    
     def image_to_base64(self, image_path: Path) -> str:
         """Convert image to base64 string"""
         try:
@@ -2,7 +2,10 @@ from .core.canvas import Canvas
 from .core.animation import Animation
 from .core.grid_engine import encode_image, decode_text, init_canvas
 from .core.code_engine import encode_code
-from .core.pxvg_engine import encode_pxvg, decode_pxvg
+from .core.pxvg_engine import encode_pxvg, encode_pxvg_animation, decode_pxvg, decode_pxvg_to_canvas, decode_pxvg_to_bytes
+from .core.pxvg_stream import decode_pxvg_stream
+from .core.render_session import RenderSession
+from .core.pxvb import pxvg_to_pxvb, pxvb_to_pxvg, load_pxvb
 from .core.prompts import SYSTEM_PROMPT, AI_CODE_SYSTEM_PROMPT, AI_PXVG_SYSTEM_PROMPT, AI_PXVG_ANIMATION_PROMPT, init_code_canvas
 from .core.mixins.color import _OFFLINE_PALETTES as BUILTIN_PALETTES
 
@@ -12,8 +15,16 @@ __all__ = [
     "encode_image",
     "encode_code",
     "encode_pxvg",
+    "encode_pxvg_animation",
     "decode_text",
     "decode_pxvg",
+    "decode_pxvg_to_canvas",
+    "decode_pxvg_to_bytes",
+    "decode_pxvg_stream",
+    "RenderSession",
+    "pxvg_to_pxvb",
+    "pxvb_to_pxvg",
+    "load_pxvb",
     "init_canvas",
     "init_code_canvas",
     "SYSTEM_PROMPT",
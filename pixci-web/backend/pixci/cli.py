@@ -3,10 +3,20 @@ from rich.console import Console
 from pathlib import Path
 from typing import Optional
 from .core.grid_engine import encode_image, encode_code, decode_text, init_canvas, init_code_canvas
-from .core.pxvg_engine import encode_pxvg, decode_pxvg
+from .core.pxvg_engine import encode_pxvg, encode_pxvg_animation, decode_pxvg
+from .core.pxvg_stream import decode_pxvg_stream
+from .core.pxvb import convert_pxvg_file
+from .core.analysis import encode_all
+from .core.encode_cache import EncodeCache, default_cache, encode_cached
 from .core.geo3d.encoder import encode_texture_to_pxvg
 from .core.geo3d.decoder import decode_pxvg_to_texture
 
+def _is_animated(image_path: Path) -> bool:
+    """GIF/APNG có nhiều hơn một frame."""
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return getattr(img, "n_frames", 1) > 1
+
 app = typer.Typer(
     help="PixCI: Công cụ CLI chuyển đổi Ảnh Pixel sang Text cho LLMs.",
     add_completion=False
@@ -17,18 +27,57 @@ console = Console()
 def encode(
     image_path: Path = typer.Argument(..., help="Đường dẫn file ảnh đầu vào"),
     output: Path = typer.Option(..., "-o", "--output", help="Đường dẫn file text đầu ra"),
-    form: str = typer.Option("grid", "-f", "--format", help="Định dạng đầu ra: 'grid', 'code' hoặc 'pxvg' (mặc định: grid)"),
+    form: str = typer.Option("grid", "-f", "--format", help="Định dạng đầu ra: 'grid', 'code', 'pxvg' hoặc 'all' (cả ba, phân tích ảnh một lần) (mặc định: grid)"),
     auto: bool = typer.Option(False, "--auto", help="Tự động phát hiện kích thước block"),
-    block_size: int = typer.Option(1, "--block-size", help="Chỉ định kích thước block thủ công")
+    block_size: int = typer.Option(1, "--block-size", help="Chỉ định kích thước block thủ công"),
+    rect_mode: str = typer.Option("fast", "--rect-mode", help="Chế độ phân rã hình chữ nhật: 'fast' hoặc 'quality' (ít thẻ hơn, chậm hơn)"),
+    cost_metric: str = typer.Option("bytes", "--cost-metric", help="PXVG: chọn thẻ tối ưu theo 'bytes' hoặc 'tokens' (ước lượng token LLM)"),
+    frame_size: Optional[str] = typer.Option(None, "--frame-size", help="PXVG animation: kích thước frame của spritesheet (VD: 32x32). GIF nhiều frame được nhận tự động"),
+    budget: Optional[int] = typer.Option(None, "--budget", help="PXVG lossy: ngân sách tối đa; vượt thì gộp màu gần nhau, bỏ chi tiết nhỏ tới khi vừa"),
+    budget_unit: str = typer.Option("bytes", "--budget-unit", help="Đơn vị ngân sách: 'bytes', 'tokens' hoặc 'tags' (số thẻ vẽ)"),
+    compact: bool = typer.Option(False, "--compact", help="Code: gom run thành chuỗi RLE và pixel lẻ theo màu (script ngắn, chạy nhanh)"),
+    workers: int = typer.Option(1, "--workers", help="Code/PXVG: số process phân rã song song theo băng ngang (ảnh/atlas lớn)"),
+    cache_dir: Optional[Path] = typer.Option(None, "--cache-dir", help="Thư mục cache kết quả encode theo nội dung ảnh (mặc định: biến môi trường PIXCI_CACHE_DIR)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Không dùng cache, luôn encode lại")
 ):
     """Chuyển đổi file ảnh thành dạng file text của PixCI."""
     try:
+        stats = {}
+        if form.lower() == "pxvg" and (frame_size or _is_animated(image_path)):
+            size = tuple(map(int, frame_size.lower().split("x"))) if frame_size else None
+            grid_w, grid_h, num_colors, num_frames = encode_pxvg_animation(
+                image_path, output, size, block_size, auto, rect_mode, cost_metric, stats=stats)
+            console.print(f"[green]Đã encode thành công {image_path} sang {output}[/green]")
+            console.print(f"Kích thước frame: {grid_w}x{grid_h}, Số màu duy nhất: {num_colors}, "
+                          f"Số frame: {num_frames} ({stats['unique_frames']} frame khác nhau)")
+            console.print(f"{stats['defs']} group trong defs, {stats['bytes']} bytes, ~{stats['tokens']} tokens")
+            return
+        if form.lower() == "all":
+            results = encode_all(image_path, output, block_size, auto, rect_mode, cost_metric, stats, workers)
+            grid_w, grid_h, num_colors, final_block_size = results["pxvg"][1]
+            console.print(f"[green]Đã encode thành công {image_path} sang "
+                          f"{', '.join(str(path) for path, _ in results.values())}[/green]")
+            console.print(f"Kích thước lưới: {grid_w}x{grid_h}, Số màu duy nhất: {num_colors}, Block size: {final_block_size}")
+            console.print(f"PXVG: {stats['elements']} phần tử, {stats['bytes']} bytes, ~{stats['tokens']} tokens")
+            return
         if form.lower() == "code":
-            grid_w, grid_h, num_colors, final_block_size = encode_code(image_path, output, block_size, auto)
+            options = {"rect_mode": rect_mode, "compact": compact, "workers": workers}
         elif form.lower() == "pxvg":
-            grid_w, grid_h, num_colors, final_block_size = encode_pxvg(image_path, output, block_size, auto)
+            options = {"rect_mode": rect_mode, "cost_metric": cost_metric, "budget": budget, "budget_unit": budget_unit,
+                       "workers": workers}
+        else:
+            form, options = "grid", {}
+        if no_cache:
+            if form.lower() == "code":
+                grid_w, grid_h, num_colors, final_block_size = encode_code(image_path, output, block_size, auto, stats=stats, **options)
+            elif form.lower() == "pxvg":
+                grid_w, grid_h, num_colors, final_block_size = encode_pxvg(image_path, output, block_size, auto, stats=stats, **options)
+            else:
+                grid_w, grid_h, num_colors, final_block_size = encode_image(image_path, output, block_size, auto)
         else:
-            grid_w, grid_h, num_colors, final_block_size = encode_image(image_path, output, block_size, auto)
+            cache = EncodeCache(disk_dir=cache_dir) if cache_dir else default_cache()
+            grid_w, grid_h, num_colors, final_block_size = encode_cached(form.lower(), image_path, output, block_size, auto,
+                                                                         cache, stats, **options)
         
         if auto:
             console.print(f"[green]Kích thước block tự động phát hiện: {final_block_size}[/green]")
@@ -38,22 +87,97 @@ def encode(
             
         console.print(f"[green]Đã encode thành công {image_path} sang {output}[/green]")
         console.print(f"Kích thước lưới: {grid_w}x{grid_h}, Số màu duy nhất: {num_colors}")
+        if stats.get("cached"):
+            console.print("[cyan]Dùng kết quả từ cache (ảnh và tuỳ chọn không đổi)[/cyan]")
+        if "tags" in stats:
+            console.print(f"Số thẻ: {stats['tags']} (rect {stats['rects']}, row {stats['rows']}, dot {stats['dots']}), "
+                          f"phân rã mất {stats['time_ms']} ms"
+                          + (f" ({stats['bands']} băng song song)" if "bands" in stats else ""))
+        if "bytes" in stats:
+            console.print(f"Plan: {stats['plan']}, {stats['elements']} phần tử, "
+                          f"{stats['bytes']} bytes, ~{stats['tokens']} tokens")
+        if "budget" in stats:
+            color = "green" if stats["within_budget"] else "yellow"
+            console.print(f"[{color}]Ngân sách: {stats['budget_cost']}/{stats['budget']} {stats['budget_unit']} "
+                          f"(mức lossy {stats['lossy_level']}), sai số: {stats['changed_pixels']} pixel "
+                          f"({stats['pixel_error']}%), lệch RGBA trung bình {stats['mean_delta']}[/{color}]")
         
     except Exception as e:
         console.print(f"[red]Lỗi trong quá trình encode: {str(e)}[/red]")
         raise typer.Exit(code=1)
 
+@app.command()
+def encode_batch(
+    source: str = typer.Argument(..., help="Thư mục ảnh hoặc glob pattern (VD: 'assets/**/*.png')"),
+    output_dir: Path = typer.Option(..., "-o", "--output", help="Thư mục đầu ra"),
+    form: str = typer.Option("pxvg", "-f", "--format", help="Định dạng đầu ra: 'grid', 'code', 'pxvg' hoặc 'all' (mặc định: pxvg)"),
+    auto: bool = typer.Option(False, "--auto", help="Tự động phát hiện kích thước block"),
+    block_size: int = typer.Option(1, "--block-size", help="Chỉ định kích thước block thủ công"),
+    rect_mode: str = typer.Option("fast", "--rect-mode", help="Chế độ phân rã hình chữ nhật: 'fast' hoặc 'quality'"),
+    cost_metric: str = typer.Option("bytes", "--cost-metric", help="PXVG: chọn thẻ tối ưu theo 'bytes' hoặc 'tokens'"),
+    compact: bool = typer.Option(False, "--compact", help="Code: gom run thành chuỗi RLE và pixel lẻ theo màu"),
+    workers: Optional[int] = typer.Option(None, "--workers", help="Số process song song (mặc định: số CPU, 1 = tuần tự)"),
+    recursive: bool = typer.Option(False, "-r", "--recursive", help="Quét cả thư mục con (và '**' trong glob)"),
+    summary: Optional[Path] = typer.Option(None, "--summary", help="File JSON tổng kết (mặc định: <output>/batch_summary.json)")
+):
+    """Encode cả thư mục ảnh trong một lần chạy, chia việc cho nhiều process."""
+    import json
+    from rich.progress import Progress, BarColumn, MofNCompleteColumn, TimeElapsedColumn
+    from .core.batch import collect_inputs, encode_batch as run_batch
+
+    inputs = collect_inputs(source, recursive)
+    if not inputs:
+        console.print(f"[red]Không tìm thấy ảnh nào trong {source}[/red]")
+        raise typer.Exit(code=1)
+
+    try:
+        with Progress("[progress.description]{task.description}", BarColumn(), MofNCompleteColumn(),
+                      TimeElapsedColumn(), console=console) as progress:
+            task = progress.add_task(f"Encode {len(inputs)} ảnh", total=len(inputs))
+
+            def on_result(record: dict):
+                if not record["ok"]:
+                    progress.console.print(f"[red]Lỗi {record['input']}: {record['error']}[/red]")
+                progress.advance(task)
+
+            result = run_batch(inputs, output_dir, form.lower(), block_size, auto, rect_mode, cost_metric,
+                               compact, workers, on_result)
+    except Exception as e:
+        console.print(f"[red]Lỗi trong quá trình encode batch: {str(e)}[/red]")
+        raise typer.Exit(code=1)
+
+    summary = summary or Path(output_dir) / "batch_summary.json"
+    with open(summary, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    color = "green" if result["failed"] == 0 else "yellow"
+    console.print(f"[{color}]Xong {result['ok']}/{result['source_count']} file "
+                  f"({result['failed']} lỗi) trong {result['elapsed_ms'] / 1000:.2f}s "
+                  f"với {result['workers']} worker[/{color}]")
+    for collision in result["collisions"]:
+        console.print(f"[yellow]Trùng tên output: {collision['input']} → {collision['output_base']}.*[/yellow]")
+    console.print(f"Tổng kết: {summary}")
+    if result["failed"]:
+        raise typer.Exit(code=1)
+
 @app.command()
 def decode(
     text_path: Path = typer.Argument(..., help="Đường dẫn file text do AI tạo"),
     output: Path = typer.Option(..., "-o", "--output", help="Đường dẫn file ảnh đầu ra (.png)"),
-    scale: int = typer.Option(1, "--scale", help="Phóng to ảnh đầu ra (Thuật toán Nearest Neighbor)")
+    scale: int = typer.Option(1, "--scale", help="Phóng to ảnh đầu ra (Thuật toán Nearest Neighbor)"),
+    workers: int = typer.Option(1, "--workers", help="Số worker: ảnh tĩnh chạy postprocess theo tile, animation render các frame song song (1 = tuần tự)"),
+    stream: bool = typer.Option(False, "--stream", help="PXVG: đọc và vẽ theo luồng, bộ nhớ không tăng theo độ dài tài liệu")
 ):
     """Chuyển đổi file text của PixCI ngược lại thành file ảnh."""
     try:
         # Tự động nhận diện định dạng dựa trên đuôi file hoặc nội dung
-        if text_path.suffix.lower() in [".pxvg", ".xml"]:
-            width, height = decode_pxvg(text_path, output, scale)
+        if text_path.suffix.lower() == ".pxvb":
+            width, height = decode_pxvg(text_path, output, scale, workers=workers)
+        elif text_path.suffix.lower() in [".pxvg", ".xml"]:
+            if stream:
+                width, height = decode_pxvg_stream(text_path, output, scale, workers=workers)
+            else:
+                width, height = decode_pxvg(text_path, output, scale, workers=workers)
         else:
             width, height = decode_text(text_path, output, scale)
             
@@ -64,6 +188,20 @@ def decode(
         console.print(f"[red]Lỗi trong quá trình decode: {str(e)}[/red]")
         raise typer.Exit(code=1)
 
+@app.command()
+def convert(
+    input_path: Path = typer.Argument(..., help="File nguồn: .pxvg/.xml (XML) hoặc .pxvb (nhị phân)"),
+    output: Path = typer.Option(..., "-o", "--output", help="File đầu ra (.pxvb hoặc .pxvg)")
+):
+    """Chuyển đổi không mất mát giữa PXVG (XML) và PXVB (nhị phân gọn, nạp không cần parse)."""
+    try:
+        in_size, out_size = convert_pxvg_file(input_path, output)
+        console.print(f"[green]Đã chuyển đổi thành công sang file {output}[/green]")
+        console.print(f"Kích thước: {in_size:,} bytes → {out_size:,} bytes ({out_size / max(in_size, 1):.1%})")
+    except Exception as e:
+        console.print(f"[red]Lỗi trong quá trình chuyển đổi: {str(e)}[/red]")
+        raise typer.Exit(code=1)
+
 @app.command()
 def init(
     size: str = typer.Option("16x16", "--size", help="Kích thước lưới (rộng x cao, VD: 16x16)"),
@@ -165,5 +303,18 @@ def geo_merge(
         console.print(f"[red]Lỗi: {str(e)}[/red]")
         raise typer.Exit(code=1)
 
+@app.command()
+def bench_tags(
+    elements: int = typer.Option(10000, "-n", "--elements", help="Số phần tử của tài liệu tổng hợp"),
+    repeat: int = typer.Option(5, "--repeat", help="Số lần đo (lấy lần nhanh nhất)")
+):
+    """Micro-benchmark: số phần tử/giây khi biên dịch và vẽ thẻ PXVG."""
+    from .core.benchmark import benchmark_tags
+    result = benchmark_tags(elements, repeat)
+    console.print(f"Tài liệu {result['elements']} phần tử")
+    console.print(f"Biên dịch: {result['compile_ms']} ms ({result['compile_eps']:,} phần tử/giây)")
+    console.print(f"Vẽ: {result['execute_ms']} ms ({result['execute_eps']:,} phần tử/giây)")
+    console.print(f"[green]Tổng: {result['total_eps']:,} phần tử/giây[/green]")
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,137 @@
+"""
+analysis.py - Phân tích ảnh một lần, dùng chung cho mọi định dạng output.
+
+ImageAnalysis giải mã ảnh (RGBA) đúng một lần; block size, lưới chỉ số màu,
+palette và phân rã rect/row/dot được tính lười và nhớ lại. encode_image,
+encode_code và smart_encode_pxvg đều nhận tham số `analysis` để dùng chung,
+encode_all() ghi cả ba định dạng trong một lượt.
+"""
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .decompose import Decomposition, decompose
+
+# Định dạng → đuôi file của encode_all (grid và code khác đuôi để không đè nhau)
+ALL_FORMATS = {"grid": ".txt", "code": ".py", "pxvg": ".pxvg.xml"}
+
+
+class ImageAnalysis:
+    """Ảnh đã giải mã + các bước phân tích được nhớ lại.
+
+    Args:
+        image: đường dẫn ảnh hoặc PIL Image
+        block_size: kích thước block khi không auto_detect
+        auto_detect: tự phát hiện block size và gốc lưới (detect_grid)
+    """
+
+    def __init__(self, image: Union[str, Path, Image.Image], block_size: int = 1, auto_detect: bool = True):
+        if isinstance(image, Image.Image):
+            self.name = Path(getattr(image, "filename", "") or "image").name
+            self.image = image.convert("RGBA")
+        else:
+            self.name = Path(image).name
+            with Image.open(image) as img:
+                self.image = img.convert("RGBA")
+        self._block_size = block_size
+        self.auto_detect = auto_detect
+        self._decompositions: Dict[Tuple[str, int], Decomposition] = {}
+
+    @cached_property
+    def grid_spec(self) -> Tuple[int, Tuple[int, int]]:
+        """(block_size, (ox, oy)) - detect_grid() chỉ chạy khi auto_detect."""
+        if not self.auto_detect:
+            return self._block_size, (0, 0)
+        from .code_engine import detect_grid
+        block_size, ox, oy = detect_grid(self.image)
+        return block_size, (ox, oy)
+
+    @property
+    def block_size(self) -> int:
+        return self.grid_spec[0]
+
+    @property
+    def offset(self) -> Tuple[int, int]:
+        return self.grid_spec[1]
+
+    @cached_property
+    def _index_grid(self) -> Tuple[int, int, np.ndarray, List[str]]:
+        from .code_engine import _build_index_grid
+        return _build_index_grid(self.image, self.block_size, self.offset)
+
+    @cached_property
+    def partial_grid(self) -> Tuple[np.ndarray, List[str]]:
+        """(index, colors) gồm cả block lẻ ở mép phải/dưới - lưới của định dạng grid text."""
+        from .code_engine import _build_index_grid
+        _, _, index, colors = _build_index_grid(self.image, self.block_size, self.offset, partial=True)
+        return index, colors
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(grid_w, grid_h)"""
+        return self._index_grid[0], self._index_grid[1]
+
+    @property
+    def index(self) -> np.ndarray:
+        """Lưới chỉ số màu [gh, gw], -1 = trong suốt. Không sửa tại chỗ (được dùng chung)."""
+        return self._index_grid[2]
+
+    @property
+    def colors(self) -> List[str]:
+        """Palette hex theo thứ tự xuất hiện (quét hàng, trái → phải)."""
+        return self._index_grid[3]
+
+    @cached_property
+    def keys(self) -> List[str]:
+        from .code_engine import _make_key
+        return [_make_key(i) for i in range(len(self.colors))]
+
+    def decomposition(self, rect_mode: str = "fast", workers: int = 1) -> Decomposition:
+        """Phân rã rect/row/dot, nhớ lại theo (rect_mode, workers).
+
+        workers > 1: phân rã song song theo băng ngang (xem decompose.py).
+        """
+        key = (rect_mode, workers)
+        if key not in self._decompositions:
+            self._decompositions[key] = decompose(self.index, rect_mode, workers)
+        return self._decompositions[key]
+
+
+def encode_all(image_path: Path, output_base: Path, block_size: int = 1, auto_detect: bool = True,
+               rect_mode: str = "fast", cost_metric: Optional[str] = "bytes",
+               stats: Optional[dict] = None,
+               workers: int = 1) -> Dict[str, Tuple[Path, Tuple[int, int, int, int]]]:
+    """Encode một ảnh sang grid, code và pxvg với một lần phân tích.
+
+    output_base: thư mục (file đặt theo tên ảnh) hoặc đường dẫn gốc không đuôi;
+    mỗi định dạng dùng đuôi trong ALL_FORMATS. workers > 1: phân rã song song
+    (code và pxvg dùng chung một lần phân rã).
+
+    Returns {format: (output_path, (grid_w, grid_h, num_colors, block_size))}.
+    """
+    from .code_engine import encode_code
+    from .grid_engine import encode_image
+    from .smart_encoder import smart_encode_pxvg
+
+    image_path, output_base = Path(image_path), Path(output_base)
+    if output_base.is_dir():
+        output_base = output_base / image_path.stem
+    elif output_base.suffix:
+        output_base = output_base.with_suffix("")
+    analysis = ImageAnalysis(image_path, block_size, auto_detect)
+
+    results = {}
+    for form, suffix in ALL_FORMATS.items():
+        out = output_base.with_name(output_base.name + suffix)
+        if form == "grid":
+            results[form] = (out, encode_image(image_path, out, block_size, auto_detect, analysis=analysis))
+        elif form == "code":
+            results[form] = (out, encode_code(image_path, out, block_size, auto_detect, rect_mode,
+                                              analysis=analysis, workers=workers))
+        else:
+            results[form] = (out, smart_encode_pxvg(image_path, out, block_size, auto_detect, rect_mode,
+                                                    stats, cost_metric, analysis=analysis, workers=workers))
+    return results
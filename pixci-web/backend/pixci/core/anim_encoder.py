@@ -0,0 +1,252 @@
+"""
+anim_encoder.py - Encode GIF / spritesheet thành một tài liệu PXVG <animation>.
+
+Mọi frame dùng chung một palette. Frame trùng nhau chỉ được encode một lần
+(group trong <defs>, gọi bằng <use>). Frame đầu tiên làm key frame: các frame
+sau được thử vẽ bằng <use ref="key"> dịch chuyển vài pixel + vá phần khác biệt,
+và lấy cách rẻ hơn so với vẽ độc lập.
+"""
+from math import gcd
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .pxvg_optimizer import (
+    COST_METRICS, ERASE_KEY, Defs, _cheapest, _layer_plans, _symmetry_plans,
+    defs_lines, estimate_tokens, plan_cost, render_elements, canvas_to_array,
+    expected_array, use_xml,
+)
+
+# Độ dịch tối đa (pixel, mỗi trục) khi so frame với key frame (nhún/bước chân)
+MAX_SHIFT = 2
+
+KEY_FRAME_ID = "key"
+DEFAULT_FPS = 10.0
+
+
+def load_frames(image_path: Path,
+                frame_size: Optional[Tuple[int, int]] = None) -> Tuple[List[Image.Image], Optional[float], Optional[int]]:
+    """Đọc các frame RGBA từ GIF (mọi frame) hoặc spritesheet (cắt theo frame_size).
+
+    Returns (frames, fps, columns): fps lấy từ duration của GIF, columns là số
+    cột của spritesheet (None nếu nguồn là GIF).
+    """
+    img = Image.open(image_path)
+    if frame_size is None:
+        frames, durations = [], []
+        for i in range(getattr(img, "n_frames", 1)):
+            img.seek(i)
+            frames.append(img.convert("RGBA"))
+            durations.append(img.info.get("duration", 0))
+        avg = sum(durations) / len(durations)
+        return frames, (1000.0 / avg if avg > 0 else None), None
+
+    fw, fh = frame_size
+    sheet = img.convert("RGBA")
+    columns, rows = sheet.width // fw, sheet.height // fh
+    if columns == 0 or rows == 0:
+        raise ValueError(f"Frame {fw}x{fh} lớn hơn spritesheet {sheet.width}x{sheet.height}")
+    frames = [
+        sheet.crop((c * fw, r * fh, (c + 1) * fw, (r + 1) * fh))
+        for r in range(rows) for c in range(columns)
+    ]
+    return frames, None, columns
+
+
+def _detect_common_grid(frames: List[Image.Image]) -> Tuple[int, Tuple[int, int]]:
+    """Block size chung (GCD) cho mọi frame; giữ offset nếu các frame thống nhất."""
+    from .code_engine import detect_grid
+
+    found = [detect_grid(f) for f in frames]
+    block_size = 0
+    for bs, _, _ in found:
+        block_size = gcd(block_size, bs)
+    offsets = {(ox % block_size, oy % block_size) for _, ox, oy in found}
+    return block_size, offsets.pop() if len(offsets) == 1 else (0, 0)
+
+
+def _shift(index: np.ndarray, dx: int, dy: int) -> np.ndarray:
+    """Dịch lưới (dx, dy) giống <use x=dx y=dy>: phần tràn bị cắt, chỗ trống = -1."""
+    gh, gw = index.shape
+    out = np.full_like(index, -1)
+    out[max(0, dy):min(gh, gh + dy), max(0, dx):min(gw, gw + dx)] = \
+        index[max(0, -dy):min(gh, gh - dy), max(0, -dx):min(gw, gw - dx)]
+    return out
+
+
+def _key_frame_plan(frame: np.ndarray, key: np.ndarray, keys: List[str],
+                    metric: str, rect_mode: str) -> List[str]:
+    """<use ref="key"> với độ dịch khớp nhiều nhất, rồi vá (kể cả xoá) phần còn lại."""
+    best = None
+    for dy in range(-MAX_SHIFT, MAX_SHIFT + 1):
+        for dx in range(-MAX_SHIFT, MAX_SHIFT + 1):
+            shifted = _shift(key, dx, dy)
+            mismatch = int((shifted != frame).sum())
+            if best is None or mismatch < best[0]:
+                best = (mismatch, dx, dy, shifted)
+    _, dx, dy, shifted = best
+
+    elements = [use_xml(KEY_FRAME_ID, dx, dy)]
+    diff = shifted != frame
+    if diff.any():
+        patch = np.where(diff, np.where(frame >= 0, frame, len(keys)), -1).astype(np.int32)
+        _, patches = _cheapest(_layer_plans(patch, keys + [ERASE_KEY], metric, rect_mode,
+                                            empty_canvas=False), metric)
+        elements += patches
+    return elements
+
+
+def _has_erase(elements: List[str]) -> bool:
+    return any(f'c="{ERASE_KEY}"' in e for e in elements)
+
+
+def _standalone_plan(frame: np.ndarray, keys: List[str], metric: str, rect_mode: str,
+                     allow_erase: bool = True) -> List[str]:
+    """Plan rẻ nhất để vẽ frame độc lập.
+
+    allow_erase=False cho nội dung group: group được vẽ trên canvas nháp rồi dán
+    phần không trong suốt, nên thẻ xoá (CLEAR) trong group sẽ mất tác dụng.
+    """
+    plans = (_layer_plans(frame, keys, metric, rect_mode, patterns=True)
+             + _symmetry_plans(frame, keys, metric, rect_mode))
+    if not allow_erase:
+        plans = [p for p in plans if not _has_erase(p[1])]
+    return _cheapest(plans, metric)[1]
+
+
+def _frame_matches(elements: List[str], defs: Defs, frame: np.ndarray,
+                   colors: List[str], keys: List[str]) -> bool:
+    gh, gw = frame.shape
+    canvas = render_elements(elements, gw, gh, dict(zip(keys, colors)), defs)
+    return bool(np.array_equal(canvas_to_array(canvas), expected_array(frame, colors)))
+
+
+def smart_encode_pxvg_animation(
+    image_path: Path,
+    output_path: Path,
+    frame_size: Optional[Tuple[int, int]] = None,
+    block_size: int = 1,
+    auto_detect: bool = True,
+    rect_mode: str = "fast",
+    cost_metric: str = "bytes",
+    fps: Optional[float] = None,
+    stats: Optional[dict] = None
+) -> Tuple[int, int, int, int]:
+    """
+    Encode GIF hoặc spritesheet thành PXVG <animation>.
+
+    Args:
+        image_path: GIF (mọi frame) hoặc spritesheet PNG
+        output_path: Đường dẫn PXVG output
+        frame_size: (w, h) của mỗi frame nếu input là spritesheet; None → đọc GIF
+        block_size: Kích thước block (1-16)
+        auto_detect: Tự động phát hiện block size chung cho mọi frame
+        rect_mode: 'fast' hoặc 'quality' (xem decompose.py)
+        cost_metric: 'bytes' hoặc 'tokens' (xem pxvg_optimizer.py)
+        fps: Ghi đè fps (mặc định lấy từ GIF, hoặc 10)
+        stats: dict tuỳ chọn, được điền số frame, frame duy nhất, bytes, tokens
+
+    Returns:
+        (grid_width, grid_height, num_colors, num_frames)
+    """
+    from .code_engine import _build_index_grid, _make_key
+
+    if cost_metric not in COST_METRICS:
+        raise ValueError(f"Cost metric không hợp lệ: '{cost_metric}'. Hỗ trợ: {', '.join(COST_METRICS)}")
+
+    frames, source_fps, columns = load_frames(image_path, frame_size)
+    fps = fps or source_fps or DEFAULT_FPS
+
+    offset = (0, 0)
+    if auto_detect:
+        block_size, offset = _detect_common_grid(frames)
+
+    # Lưới chỉ số màu của từng frame, ánh xạ về một palette chung
+    colors: List[str] = []
+    color_ids: Dict[str, int] = {}
+    indices: List[np.ndarray] = []
+    for frame in frames:
+        gw, gh, index, local_colors = _build_index_grid(frame, block_size, offset)
+        for c in local_colors:
+            if c not in color_ids:
+                color_ids[c] = len(colors)
+                colors.append(c)
+        remap = np.array([color_ids[c] for c in local_colors] + [-1], dtype=np.int32)
+        indices.append(remap[index])
+    keys = [_make_key(i) for i in range(len(colors))]
+
+    # Frame trùng nhau → cùng một plan
+    unique: Dict[bytes, int] = {}
+    order: List[int] = []
+    for index in indices:
+        order.append(unique.setdefault(index.tobytes(), len(unique)))
+    unique_frames = [indices[order.index(u)] for u in range(len(unique))]
+    repeats = [order.count(u) for u in range(len(unique))]
+
+    key = unique_frames[0]
+    plans: List[List[str]] = []
+    for u, frame in enumerate(unique_frames):
+        standalone = _standalone_plan(frame, keys, cost_metric, rect_mode)
+        candidates = [standalone]
+        if len(unique_frames) > 1:
+            candidates.append([use_xml(KEY_FRAME_ID, 0, 0)] if u == 0 else
+                              _key_frame_plan(frame, key, keys, cost_metric, rect_mode))
+        plans.append(min(candidates, key=lambda p: plan_cost(p, cost_metric)))
+
+    # Key frame chỉ vào <defs> khi có frame thực sự tham chiếu tới
+    key_ref = f'ref="{KEY_FRAME_ID}"'
+    defs: Defs = []
+    if any(key_ref in e for plan in plans[1:] for e in plan):
+        defs.append((KEY_FRAME_ID, _standalone_plan(key, keys, cost_metric, rect_mode, allow_erase=False)))
+    else:
+        plans[0] = _standalone_plan(key, keys, cost_metric, rect_mode)
+
+    # Frame lặp lại nhiều lần → group riêng (frame có thẻ xoá thì lặp lại inline)
+    frame_elements: List[List[str]] = []
+    for u, plan in enumerate(plans):
+        if repeats[u] > 1 and len(plan) > 1 and not _has_erase(plan):
+            gid = f"f{u}"
+            defs.append((gid, plan))
+            frame_elements.append([use_xml(gid, 0, 0)])
+        else:
+            frame_elements.append(plan)
+
+    # Kiểm chứng từng frame duy nhất; sai → vẽ độc lập trực tiếp
+    for u, frame in enumerate(unique_frames):
+        if not _frame_matches(frame_elements[u], defs, frame, colors, keys):
+            direct = _layer_plans(frame, keys, cost_metric, rect_mode)[0][1]
+            if not _frame_matches(direct, [], frame, colors, keys):
+                raise AssertionError(f"BUG: frame {u} không decode ra đúng ảnh gốc")
+            frame_elements[u] = direct
+
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             f'<pxvg w="{gw}" h="{gh}" xmlns="http://pixci.dev/pxvg">',
+             '  <palette>']
+    lines += [f'    <color k="{k}" hex="{c}" />' for k, c in zip(keys, colors)]
+    lines.append('  </palette>')
+    lines += defs_lines(defs)
+    columns_attr = f' columns="{columns}"' if columns else ''
+    lines.append(f'  <animation fps="{fps:g}"{columns_attr}>')
+    for i, u in enumerate(order):
+        lines.append(f'    <frame id="{i + 1}">')
+        lines += [f"      {e}" for e in frame_elements[u]]
+        lines.append('    </frame>')
+    lines.append('  </animation>')
+    lines.append('</pxvg>')
+    text = "\n".join(lines) + "\n"
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    if stats is not None:
+        stats.update({
+            "frames": len(frames),
+            "unique_frames": len(unique_frames),
+            "defs": len(defs),
+            "bytes": len(text.encode("utf-8")),
+            "tokens": estimate_tokens(text),
+        })
+
+    return (gw, gh, len(colors), len(frames))
@@ -3,6 +3,7 @@ from PIL import Image
 
 from .canvas import Canvas
 from .canvas_base import hex2rgba
+from .frame_pool import canvas_images
 
 class Animation:
     """
@@ -54,15 +55,7 @@ class Animation:
         spritesheet = Image.new("RGBA", (self.width * columns, self.height * rows), (0, 0, 0, 0))
         frames_list = []
         
-        for idx, frame in enumerate(self.frames):
-            frame.merge_all()
-            frame_img = Image.new("RGBA", (self.width, self.height))
-            pixels = frame_img.load()
-            flat = frame.flatten()
-            for x in range(self.width):
-                for y in range(self.height):
-                    pixels[x, y] = flat[x][y]
-                    
+        for idx, frame_img in enumerate(canvas_images(self.frames)):
             # Dán vào Spritesheet
             grid_x = idx % columns
             grid_y = idx // columns
@@ -0,0 +1,194 @@
+"""
+batch.py - Encode cả thư mục / glob ảnh trong một process, chia việc cho process pool.
+
+Mỗi file là một job độc lập: lỗi của một file được ghi vào kết quả của file đó
+chứ không dừng cả batch. Worker đi qua encode_cached() nên cache trên đĩa
+(PIXCI_CACHE_DIR) được dùng chung giữa các worker và các lần chạy.
+"""
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .analysis import ALL_FORMATS
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+BATCH_FORMATS = tuple(ALL_FORMATS) + ("all",)
+
+
+def collect_inputs(source: str, recursive: bool = False) -> List[Path]:
+    """Thư mục (mọi ảnh bên trong) hoặc glob pattern → danh sách ảnh đã sắp xếp."""
+    path = Path(source)
+    if path.is_dir():
+        pattern = "**/*" if recursive else "*"
+        files = [p for p in path.glob(pattern) if p.suffix.lower() in IMAGE_EXTENSIONS]
+    else:
+        files = [Path(p) for p in glob.glob(source, recursive=recursive)]
+        files = [p for p in files if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS]
+    return sorted(files)
+
+
+def output_bases(inputs: List[Path], output_dir: Path) -> Tuple[List[Path], List[dict]]:
+    """Đường dẫn output (chưa có đuôi) cho từng ảnh, giữ cấu trúc thư mục con.
+
+    Mỗi ảnh được đặt theo đường dẫn tương đối so với thư mục chung của các input
+    (quét đệ quy / glob không ghi đè các file cùng tên ở thư mục khác). Ảnh cùng
+    thư mục, cùng tên khác đuôi (a.png, a.gif) được đổi tên thành a_gif, ... và
+    được báo trong danh sách collisions thay vì ghi đè lên nhau.
+    """
+    if not inputs:
+        return [], []
+    root = Path(os.path.commonpath([str(p.parent.absolute()) for p in inputs]))
+    bases: List[Path] = []
+    collisions: List[dict] = []
+    taken = set()
+    for path in inputs:
+        rel = path.absolute().relative_to(root)
+        base = output_dir / rel.parent / rel.stem
+        if base in taken:
+            wanted = base
+            base = wanted.with_name(f"{rel.stem}_{path.suffix.lstrip('.').lower()}")
+            n = 2
+            while base in taken:
+                base = wanted.with_name(f"{rel.stem}_{path.suffix.lstrip('.').lower()}{n}")
+                n += 1
+            collisions.append({"input": str(path), "output_base": str(base), "conflicts_with": str(wanted)})
+        taken.add(base)
+        bases.append(base)
+    return bases, collisions
+
+
+def _is_animated(image_path: Path) -> bool:
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return getattr(img, "n_frames", 1) > 1
+
+
+def _encode_format(form: str, image_path: Path, out: Path, block_size: int, auto_detect: bool,
+                   options: dict, stats: dict, analysis=None) -> Tuple[int, int, int, Optional[int]]:
+    """Một định dạng: ảnh động sang pxvg qua encode_pxvg_animation, còn lại qua encode_cached."""
+    from .encode_cache import encode_cached
+
+    if form == "pxvg" and _is_animated(image_path):
+        from .pxvg_engine import encode_pxvg_animation
+        grid_w, grid_h, num_colors, _ = encode_pxvg_animation(
+            image_path, out, None, block_size, auto_detect, options.get("rect_mode", "fast"),
+            options.get("cost_metric", "bytes"), stats=stats)
+        return grid_w, grid_h, num_colors, None
+    return encode_cached(form, image_path, out, block_size, auto_detect, stats=stats, analysis=analysis, **options)
+
+
+def encode_one(image_path: Path, base: Path, form: str, block_size: int, auto_detect: bool,
+               options: dict) -> dict:
+    """Encode một file ra base + đuôi định dạng; luôn trả về bản ghi (có "error" nếu thất bại)."""
+    record = {"input": str(image_path), "format": form, "ok": False}
+    t0 = time.perf_counter()
+    try:
+        stats: dict = {}
+        base.parent.mkdir(parents=True, exist_ok=True)
+        if form == "all":
+            from .analysis import ImageAnalysis
+            # Mọi định dạng đi qua cache và dùng chung một lần phân tích (như encode_all)
+            analysis = ImageAnalysis(image_path, block_size, auto_detect)
+            results = {}
+            for sub, suffix in ALL_FORMATS.items():
+                out = base.with_name(base.name + suffix)
+                sub_options = _options_for(sub, options.get("rect_mode", "fast"),
+                                           options.get("cost_metric", "bytes"), False)
+                results[sub] = _encode_format(sub, image_path, out, block_size, auto_detect, sub_options,
+                                              stats if sub == "pxvg" else {}, analysis)
+                record.setdefault("output", []).append(str(out))
+            grid_w, grid_h, num_colors, final_block_size = results["pxvg"]
+        else:
+            out = base.with_name(base.name + ALL_FORMATS[form])
+            grid_w, grid_h, num_colors, final_block_size = _encode_format(
+                form, image_path, out, block_size, auto_detect, options, stats)
+            record["output"] = str(out)
+        record.update({
+            "ok": True,
+            "grid_width": grid_w,
+            "grid_height": grid_h,
+            "colors": num_colors,
+            "block_size": final_block_size,
+        })
+        for key in ("tags", "elements", "bytes", "tokens", "frames", "cached"):
+            if key in stats:
+                record[key] = stats[key]
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["time_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return record
+
+
+def _options_for(form: str, rect_mode: str, cost_metric: str, compact: bool) -> dict:
+    if form == "code":
+        return {"rect_mode": rect_mode, "compact": compact}
+    if form in ("pxvg", "all"):
+        return {"rect_mode": rect_mode, "cost_metric": cost_metric}
+    return {}
+
+
+def encode_batch(inputs: List[Path], output_dir: Path, form: str = "pxvg", block_size: int = 1,
+                 auto_detect: bool = True, rect_mode: str = "fast", cost_metric: str = "bytes",
+                 compact: bool = False, workers: Optional[int] = None,
+                 on_result: Optional[Callable[[dict], None]] = None) -> Dict[str, object]:
+    """Encode nhiều ảnh song song.
+
+    Args:
+        inputs: danh sách ảnh (xem collect_inputs)
+        output_dir: thư mục output (cấu trúc thư mục con theo output_bases, đuôi
+                    file theo ALL_FORMATS)
+        form: 'grid', 'code', 'pxvg' hoặc 'all'
+        workers: số process (None = số CPU, 1 = chạy tuần tự trong process hiện tại)
+        on_result: callback sau mỗi file (cập nhật progress bar)
+
+    Returns summary: {"files": [...bản ghi theo thứ tự input], "ok", "failed", "elapsed_ms",
+    "collisions": [...ảnh bị đổi tên vì trùng output], ...}
+    """
+    if form not in BATCH_FORMATS:
+        raise ValueError(f"Định dạng không hợp lệ: '{form}'. Hỗ trợ: {', '.join(BATCH_FORMATS)}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    bases, collisions = output_bases(inputs, output_dir)
+    options = _options_for(form, rect_mode, cost_metric, compact)
+    workers = workers or os.cpu_count() or 1
+
+    t0 = time.perf_counter()
+    records: List[Optional[dict]] = [None] * len(inputs)
+
+    def finish(i: int, record: dict):
+        records[i] = record
+        if on_result is not None:
+            on_result(record)
+
+    if workers <= 1 or len(inputs) <= 1:
+        for i, path in enumerate(inputs):
+            finish(i, encode_one(path, bases[i], form, block_size, auto_detect, options))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(inputs))) as pool:
+            futures = {
+                pool.submit(encode_one, path, bases[i], form, block_size, auto_detect, options): i
+                for i, path in enumerate(inputs)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:  # worker chết (BrokenProcessPool, ...)
+                    record = {"input": str(inputs[i]), "format": form, "ok": False,
+                              "error": f"{type(e).__name__}: {e}"}
+                finish(i, record)
+
+    ok = [r for r in records if r["ok"]]
+    return {
+        "source_count": len(inputs),
+        "ok": len(ok),
+        "failed": len(records) - len(ok),
+        "workers": workers,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "total_bytes": sum(r.get("bytes", 0) for r in ok),
+        "collisions": collisions,
+        "files": records,
+    }
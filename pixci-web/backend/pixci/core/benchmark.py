@@ -0,0 +1,64 @@
+"""
+benchmark.py - Micro-benchmark cho bước biên dịch và thực thi thẻ PXVG.
+
+Sinh một tài liệu tổng hợp N phần tử (trộn các thẻ hay gặp trong output của
+encoder và trong tài liệu do LLM viết), đo số phần tử/giây của compile_pxvg()
+(parse XML + chuyển kiểu) và của render_static() (thực thi op-list).
+"""
+import random
+import time
+from typing import Dict
+
+from .render_plan import compile_pxvg, render_static
+
+BENCH_SIZE = 128
+
+# (tỉ trọng, hàm sinh thẻ) - toạ độ nằm trong canvas BENCH_SIZE x BENCH_SIZE
+_TAG_MIX = (
+    (30, lambda r: f'<dots c="{r.choice("ABCD")}" pts="{" ".join(f"{r.randrange(128)},{r.randrange(128)}" for _ in range(4))}"/>'),
+    (25, lambda r: f'<row y="{r.randrange(128)}" x1="{r.randrange(64)}" x2="{r.randrange(64, 128)}" c="{r.choice("ABCD")}"/>'),
+    (20, lambda r: f'<rect x="{r.randrange(120)}" y="{r.randrange(120)}" w="{r.randint(1, 8)}" h="{r.randint(1, 8)}" c="{r.choice("ABCD")}"/>'),
+    (10, lambda r: f'<dot x="{r.randrange(128)}" y="{r.randrange(128)}" c="{r.choice("ABCD")}"/>'),
+    (5, lambda r: f'<line x1="{r.randrange(128)}" y1="{r.randrange(128)}" x2="{r.randrange(128)}" y2="{r.randrange(128)}" c="A"/>'),
+    (4, lambda r: f'<column x="{r.randrange(128)}" start-y="{r.randrange(64)}" end-y="{r.randrange(64, 128)}" color="B"/>'),
+    (3, lambda r: f'<circle cx="{r.randrange(128)}" cy="{r.randrange(128)}" r="{r.randint(1, 4)}" c="C"/>'),
+    (3, lambda r: f'<curve start="{r.randrange(128)},{r.randrange(128)}" ctrl="64,64" end="{r.randrange(128)},{r.randrange(128)}" t="1" c="D"/>'),
+)
+
+
+def synthetic_document(elements: int = 10000, seed: int = 1) -> str:
+    """Tài liệu PXVG một layer gồm `elements` thẻ vẽ (tất định theo seed)."""
+    rng = random.Random(seed)
+    weights = [w for w, _ in _TAG_MIX]
+    makers = [m for _, m in _TAG_MIX]
+    body = [rng.choices(makers, weights)[0](rng) for _ in range(elements)]
+    palette = "".join(f'<color k="{k}" hex="{hx}"/>' for k, hx in
+                      zip("ABCD", ("#E62E2D", "#2DE65A", "#2D6BE6", "#F2D24B")))
+    return (f'<pxvg w="{BENCH_SIZE}" h="{BENCH_SIZE}"><palette>{palette}</palette>'
+            f'<layer id="main">{"".join(body)}</layer></pxvg>')
+
+
+def benchmark_tags(elements: int = 10000, repeat: int = 5) -> Dict[str, float]:
+    """Đo compile và execute (lấy lần nhanh nhất trong `repeat` lần).
+
+    Returns {"elements", "compile_ms", "execute_ms", "compile_eps", "execute_eps", "total_eps"}
+    (eps = phần tử/giây).
+    """
+    doc = synthetic_document(elements).encode("utf-8")
+    compile_s = execute_s = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        plan = compile_pxvg(doc)
+        t1 = time.perf_counter()
+        render_static(plan)
+        t2 = time.perf_counter()
+        compile_s = min(compile_s, t1 - t0)
+        execute_s = min(execute_s, t2 - t1)
+    return {
+        "elements": elements,
+        "compile_ms": round(compile_s * 1000, 2),
+        "execute_ms": round(execute_s * 1000, 2),
+        "compile_eps": round(elements / compile_s),
+        "execute_eps": round(elements / execute_s),
+        "total_eps": round(elements / (compile_s + execute_s)),
+    }
@@ -2,9 +2,12 @@
 code_engine.py - Smart Image → Python Code encoder.
 Tối ưu output ngắn nhất có thể, đảm bảo 100% pixel-perfect.
 """
+import numpy as np
 from pathlib import Path
 from PIL import Image
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+
+from .analysis import ImageAnalysis
 
 
 def rgb2hex(r: int, g: int, b: int, a: int = 255) -> str:
@@ -27,60 +30,143 @@ def _make_key(idx: int) -> str:
     return _SINGLE_CHARS[idx2 // len(_SINGLE_CHARS)] + _SINGLE_CHARS[idx2 % len(_SINGLE_CHARS)]
 
 
-def _detect_block_size(img: Image.Image) -> int:
-    pixels = img.load()
+def _pack_rgba(img: Image.Image) -> np.ndarray:
+    """RGBA → mảng uint32 [h, w]. Mọi pixel alpha=0 được chuẩn hoá về 0."""
+    arr = np.ascontiguousarray(np.asarray(img.convert("RGBA"), dtype=np.uint8))
+    packed = arr.view(np.uint32)[..., 0]
+    return np.where(arr[..., 3] != 0, packed, np.uint32(0))
+
+
+def _axis_grid(boundaries: np.ndarray, length: int) -> Tuple[int, int]:
+    """Tính (block, offset) trên 1 trục từ vị trí các đường biên màu.
+
+    Khoảng cách giữa 2 biên liên tiếp luôn là bội số của block → lấy GCD.
+    Run đầu/cuối bị bỏ qua vì có thể bị cắt bởi viền lệch (offset).
+    Trả về (0, 0) nếu trục không có biên nào.
+    """
+    if boundaries.size == 0:
+        return 0, 0
+    gaps = np.diff(boundaries)
+    if gaps.size:
+        block = int(np.gcd.reduce(gaps))
+        return block, int(boundaries[0] % block)
+    # Chỉ có 1 biên: không phân biệt được viền lệch, coi như offset 0
+    block = int(np.gcd(boundaries[0], length - boundaries[0]))
+    return block, 0
+
+
+def _grid_fits(packed: np.ndarray, block: int, ox: int, oy: int) -> bool:
+    """Lưới (block, gốc) có tái tạo đúng ảnh không.
+
+    Mọi pixel trong một block phải bằng pixel góc trái trên của block, và phần
+    nằm ngoài các block đủ (viền lệch đầu, block lẻ cuối) phải trong suốt - nếu
+    không, lấy mẫu theo lưới này sẽ làm mất pixel.
+    """
+    h, w = packed.shape
+    gw, gh = (w - ox) // block, (h - oy) // block
+    if gw == 0 or gh == 0:
+        return False
+    inner = packed[oy:oy + gh * block, ox:ox + gw * block]
+    if np.count_nonzero(inner) != np.count_nonzero(packed):
+        return False
+    sample = inner[::block, ::block]
+    return bool((inner.reshape(gh, block, gw, block) == sample[:, None, :, None]).all())
+
+
+def detect_grid(img: Image.Image) -> Tuple[int, int, int]:
+    """Phát hiện kích thước block và gốc lưới của ảnh pixel art đã upscale.
+
+    Quét toàn bộ hàng/cột bằng array diff (không lấy mẫu), nên vẫn đúng với
+    sprite có viền lệch và chạy vài ms trên ảnh 2048². Ứng viên (block, gốc) chỉ
+    được nhận khi lấy mẫu theo nó tái tạo đúng ảnh (_grid_fits); không thì thử
+    các ước nhỏ hơn của block, cuối cùng là block 1.
+
+    Returns: (block_size, offset_x, offset_y)
+    """
     w, h = img.size
-    if w == 0:
-        return 1
-    min_run = w
-    for y in range(0, h, max(1, h // 10)):
-        cur = pixels[0, y]
-        run = 0
-        for x in range(w):
-            if pixels[x, y] == cur:
-                run += 1
-            else:
-                if run > 0: min_run = min(min_run, run)
-                cur = pixels[x, y]
-                run = 1
-        if run > 0: min_run = min(min_run, run)
-    for x in range(0, w, max(1, w // 10)):
-        cur = pixels[x, 0]
-        run = 0
-        for y in range(h):
-            if pixels[x, y] == cur:
-                run += 1
-            else:
-                if run > 0: min_run = min(min_run, run)
-                cur = pixels[x, y]
-                run = 1
-        if run > 0: min_run = min(min_run, run)
-    return max(1, min_run)
-
-
-def _build_grid(img: Image.Image, block_size: int):
-    """Returns (w, h, grid[y][x]=key|None, palette={hex: key})"""
+    if w == 0 or h == 0:
+        return 1, 0, 0
+    packed = _pack_rgba(img)
+    col_bounds = np.flatnonzero(np.any(packed[:, 1:] != packed[:, :-1], axis=0)) + 1
+    row_bounds = np.flatnonzero(np.any(packed[1:, :] != packed[:-1, :], axis=1)) + 1
+
+    bx, ox = _axis_grid(col_bounds, w)
+    by, oy = _axis_grid(row_bounds, h)
+
+    if bx == 0 and by == 0:
+        # Ảnh 1 màu: giữ hành vi cũ (run ngắn nhất = cạnh nhỏ nhất)
+        block = max(1, min(w, h))
+    elif bx == 0:
+        block = by
+    elif by == 0:
+        block = bx
+    else:
+        block = int(np.gcd(bx, by))
+    block = max(1, block)
+    for size in range(block, 1, -1):
+        if block % size == 0 and _grid_fits(packed, size, ox % size, oy % size):
+            return size, ox % size, oy % size
+    return 1, 0, 0
+
+
+def _detect_block_size(img: Image.Image) -> int:
+    return detect_grid(img)[0]
+
+
+def _build_index_grid(img: Image.Image, block_size: int,
+                      offset: Tuple[int, int] = (0, 0),
+                      partial: bool = False) -> Tuple[int, int, np.ndarray, List[str]]:
+    """Vectorized grid builder.
+
+    Pack RGBA thành uint32, lấy mẫu mỗi block bằng array slicing rồi dùng
+    np.unique (return_index/return_inverse) để map sang chỉ số palette.
+    `offset` là gốc lưới (ox, oy) do detect_grid() trả về. partial=True giữ cả
+    block lẻ ở mép phải/dưới (lấy mẫu pixel góc trái trên như block đủ).
+
+    Returns (w, h, index[gh, gw] int32 với -1 = trong suốt, colors[idx] = hex).
+    Thứ tự palette là thứ tự xuất hiện đầu tiên (quét hàng, trái → phải).
+    """
+    ox, oy = offset
     width, height = img.size
-    gw = width // block_size
-    gh = height // block_size
-    pixels = img.load()
-    
-    pal = {}
-    idx = 0
-    grid = []
-    for gy in range(gh):
-        row = []
-        for gx in range(gw):
-            r, g, b, a = pixels[gx * block_size, gy * block_size]
-            if a == 0:
-                row.append(None)
-            else:
-                hx = rgb2hex(r, g, b, a)
-                if hx not in pal:
-                    pal[hx] = _make_key(idx)
-                    idx += 1
-                row.append(pal[hx])
-        grid.append(row)
+    if partial:
+        gw = -(-max(0, width - ox) // block_size)
+        gh = -(-max(0, height - oy) // block_size)
+    else:
+        gw = max(0, width - ox) // block_size
+        gh = max(0, height - oy) // block_size
+    if gw == 0 or gh == 0:
+        return gw, gh, np.full((gh, gw), -1, dtype=np.int32), []
+
+    arr = np.asarray(img.convert("RGBA"), dtype=np.uint8)
+    sub = arr[oy:oy + gh * block_size:block_size, ox:ox + gw * block_size:block_size].astype(np.uint32)
+    packed = (sub[..., 0] << 24) | (sub[..., 1] << 16) | (sub[..., 2] << 8) | sub[..., 3]
+
+    flat = packed.ravel()
+    opaque = (sub[..., 3] != 0).ravel()
+    index = np.full(flat.shape, -1, dtype=np.int32)
+
+    values = flat[opaque]
+    if values.size:
+        uniq, first_idx, inverse = np.unique(values, return_index=True, return_inverse=True)
+        order = np.argsort(first_idx, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.size)
+        index[opaque] = rank[inverse.ravel()]
+        colors = [f"#{int(v):08X}" for v in uniq[order]]
+    else:
+        colors = []
+
+    return gw, gh, index.reshape(gh, gw), colors
+
+
+def _build_grid(img: Image.Image, block_size: int, offset: Tuple[int, int] = (0, 0)):
+    """Returns (w, h, grid[y][x]=key|None, palette={hex: key})"""
+    gw, gh, index, colors = _build_index_grid(img, block_size, offset)
+    keys = [_make_key(i) for i in range(len(colors))]
+    pal = dict(zip(colors, keys))
+    # Index -1 (trong suốt) trỏ vào phần tử cuối là None
+    lookup = np.array(keys + [None], dtype=object)
+    grid = lookup[index].tolist() if index.size else [[] for _ in range(gh)]
     return gw, gh, grid, pal
 
 
@@ -145,41 +231,82 @@ def _collect_all_runs(grid, gw, gh, used):
     return runs
 
 
-def encode_code(image_path, output_path, block_size: int = 1, auto_detect: bool = True) -> Tuple[int, int, int, int]:
+def _rle_rows(gh: int, runs) -> List[str]:
+    """Run (y, xs, xe, key) → mỗi hàng một dòng "key*n" cách nhau bởi dấu cách,
+    "." là khoảng bỏ qua. Hàng cuối không có run bị cắt bỏ."""
+    lines = [[] for _ in range(gh)]
+    cursor = [0] * gh
+    for y, xs, xe, key in sorted(runs):
+        if xs > cursor[y]:
+            gap = xs - cursor[y]
+            lines[y].append(f".*{gap}" if gap > 1 else ".")
+        n = xe - xs + 1
+        lines[y].append(f"{key}*{n}" if n > 1 else key)
+        cursor[y] = xe + 1
+    while lines and not lines[-1]:
+        lines.pop()
+    return [" ".join(parts) for parts in lines]
+
+
+def _write_compact_body(f, gh: int, multi_runs, single_pixels):
+    """Phần vẽ của script compact: một c.draw_rle cho mọi run, một c.set_pixels mỗi màu."""
+    rows = _rle_rows(gh, multi_runs)
+    if rows:
+        body = "\n".join(rows)
+        f.write(f'c.draw_rle("""{body}""")\n')
+    by_color = {}
+    for y, x, color in single_pixels:
+        by_color.setdefault(color, []).extend((x, y))
+    for color in sorted(by_color):
+        coords = ",".join(map(str, by_color[color]))
+        f.write(f'c.set_pixels("{coords}","{color}")\n')
+
+
+def encode_code(image_path, output_path, block_size: int = 1, auto_detect: bool = True,
+                rect_mode: str = "fast", stats: Optional[dict] = None,
+                compact: bool = False, analysis: Optional[ImageAnalysis] = None,
+                workers: int = 1) -> Tuple[int, int, int, int]:
     """Encode image to compact PixCI Python code. 100% pixel-perfect.
     
+    rect_mode: 'fast' hoặc 'quality' (xem decompose.py)
+    stats: nếu truyền dict vào sẽ được điền số rect/row/dot, tổng thẻ và thời gian phân rã
+    compact: gom run thành một chuỗi RLE (c.draw_rle) và dot theo màu (c.set_pixels)
+             thay vì mỗi pixel lẻ một dòng - script ngắn hơn và chạy nhanh hơn nhiều
+    analysis: ImageAnalysis dùng chung với các encoder khác (khi có thì bỏ qua
+              image_path/block_size/auto_detect)
+    workers: > 1 → phân rã song song theo băng ngang (ảnh lớn, xem decompose.py)
+    
     Returns: (grid_w, grid_h, num_colors, block_size)
     """
-    image_path = Path(image_path)
     output_path = Path(output_path)
-    img = Image.open(image_path).convert("RGBA")
-    
-    if auto_detect:
-        block_size = _detect_block_size(img)
-    
-    gw, gh, grid, palette = _build_grid(img, block_size)
+    if analysis is None:
+        analysis = ImageAnalysis(image_path, block_size, auto_detect)
+    block_size = analysis.block_size
+    gw, gh = analysis.size
+    index, colors, keys = analysis.index, analysis.colors, analysis.keys
+    palette = dict(zip(colors, keys))
     
     # Count total non-transparent pixels
-    total_px = sum(1 for y in range(gh) for x in range(gw) if grid[y][x] is not None)
-    
-    # Detect rects
-    rects, used = _find_best_rects(grid, gw, gh)
+    total_px = int((index >= 0).sum())
     
-    # Collect remaining as runs  
-    runs = _collect_all_runs(grid, gw, gh, used)
+    # Rects + remaining runs (histogram engine)
+    result = analysis.decomposition(rect_mode, workers)
+    rects = [(x0, y0, x1, y1, keys[c]) for x0, y0, x1, y1, c in result.rects]
+    # Single pixels: set_pixel is shorter than draw_rows for 1px
+    multi_runs = [(y, xs, xe, keys[c]) for y, xs, xe, c in result.rows]
+    single_pixels = [(y, x, keys[c]) for y, x, c in result.dots]
     
     # Verify pixel count
     rect_px = sum((x1-x0+1)*(y1-y0+1) for x0,y0,x1,y1,_ in rects)
-    run_px = sum(xe-xs+1 for _,xs,xe,_ in runs)
+    run_px = sum(xe-xs+1 for _,xs,xe,_ in multi_runs) + len(single_pixels)
     assert rect_px + run_px == total_px, f"BUG: {rect_px}+{run_px} != {total_px}"
     
-    # Separate single-pixel runs (set_pixel is shorter than draw_rows for 1px)
-    single_pixels = [(y, xs, c) for y, xs, xe, c in runs if xs == xe]
-    multi_runs = [(y, xs, xe, c) for y, xs, xe, c in runs if xs != xe]
+    if stats is not None:
+        stats.update(result.stats())
     
     # Write output
     with open(output_path, "w", encoding="utf-8") as f:
-        f.write(f"# {image_path.name} → {gw}x{gh}, {len(palette)} colors\n")
+        f.write(f"# {analysis.name} → {gw}x{gh}, {len(palette)} colors\n")
         f.write("import pixci\n")
         f.write(f"c = pixci.Canvas({gw}, {gh})\n")
         
@@ -195,18 +322,22 @@ def encode_code(image_path, output_path, block_size: int = 1, auto_detect: bool
         for x0, y0, x1, y1, color in rects:
             f.write(f'c.fill_rect(({x0},{y0}),({x1},{y1}),"{color}")\n')
         
-        # All multi-pixel runs in ONE draw_rows call
-        if multi_runs:
-            f.write("c.draw_rows([\n")
-            for y, xs, xe, color in multi_runs:
-                f.write(f'({y},{xs},{xe},"{color}"),')
-            f.write("])\n")
-        
-        # Single pixels - batch them
-        if single_pixels:
-            # Group consecutive singles into set_pixel calls
-            for y, x, color in single_pixels:
-                f.write(f'c.set_pixel(({x},{y}),"{color}")\n')
+        if compact:
+            # Runs → một chuỗi RLE, dots → một set_pixels mỗi màu
+            _write_compact_body(f, gh, multi_runs, single_pixels)
+        else:
+            # All multi-pixel runs in ONE draw_rows call
+            if multi_runs:
+                f.write("c.draw_rows([\n")
+                for y, xs, xe, color in multi_runs:
+                    f.write(f'({y},{xs},{xe},"{color}"),')
+                f.write("])\n")
+            
+            # Single pixels - batch them
+            if single_pixels:
+                # Group consecutive singles into set_pixel calls
+                for y, x, color in single_pixels:
+                    f.write(f'c.set_pixel(({x},{y}),"{color}")\n')
         
         f.write(f'c.save("{output_path.stem}.png",scale=10)\n')
     
@@ -0,0 +1,314 @@
+"""
+decompose.py - Phân rã lưới chỉ số màu thành rect + row + dot.
+
+Engine dùng kỹ thuật "largest rectangle in histogram": mỗi hàng cập nhật chiều
+cao cột cùng màu, một lượt stack sinh ra các hình chữ nhật cực đại kết thúc ở
+hàng đó. Các ứng viên được nhận theo diện tích giảm dần, lặp lại vài vòng trên
+phần còn trống. Phần còn lại được gom thành row (≥ 2 pixel) và dot (1 pixel).
+
+Ảnh lớn (atlas 1024²+) có thể phân rã song song: lưới được cắt thành các băng
+ngang, mỗi băng phân rã trong một worker process, sau đó ghép lại. Row không
+bao giờ vắt qua ranh giới băng ngang nên chỉ cần nối các rect/row chạm nhau ở
+đường cắt (cùng x0, x1 và màu). Palette là của lưới gốc nên mọi băng dùng chung
+chỉ số màu.
+"""
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+Rect = Tuple[int, int, int, int, int]  # (x0, y0, x1, y1, color)
+Run = Tuple[int, int, int, int]        # (y, x_start, x_end, color)
+Dot = Tuple[int, int, int]             # (y, x, color)
+
+# Ngưỡng mặc định giống _find_best_rects: rect chỉ đáng khi thay được ≥ 2 hàng
+DEFAULT_MIN_HEIGHT = 2
+DEFAULT_MIN_AREA = 4
+
+DECOMPOSE_MODES = ("fast", "quality")
+
+# Băng thấp hơn → nhiều đường cắt hơn, rect bị chia nhỏ hơn
+MIN_BAND_HEIGHT = 32
+
+# Chỉ chia băng song song khi lưới đủ lớn: gửi kết quả về + stitch_bands tốn
+# ~12% thời gian phân rã tuần tự ở 1024², ~35% ở 256² (nhỏ hơn thì chậm hơn tuần tự)
+MIN_PARALLEL_PIXELS = 512 * 512
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+class Decomposition(NamedTuple):
+    rects: List[Rect]
+    rows: List[Run]
+    dots: List[Dot]
+    elapsed_ms: float
+    bands: int = 1
+
+    @property
+    def tag_count(self) -> int:
+        """Tổng số rect + row + dot (thước đo chất lượng phân rã)."""
+        return len(self.rects) + len(self.rows) + len(self.dots)
+
+    def stats(self) -> dict:
+        stats = {
+            "rects": len(self.rects),
+            "rows": len(self.rows),
+            "dots": len(self.dots),
+            "tags": self.tag_count,
+            "time_ms": round(self.elapsed_ms, 2),
+        }
+        if self.bands > 1:
+            stats["bands"] = self.bands
+        return stats
+
+
+def _histogram_candidates(index: np.ndarray, avail: np.ndarray,
+                          min_h: int, min_area: int) -> List[Tuple[int, Rect]]:
+    """Một lượt quét histogram: trả về [(area, rect)] cho mọi rect cực đại đạt ngưỡng."""
+    gh, gw = index.shape
+    heights = np.zeros(gw, dtype=np.int32)
+    prev_row = np.full(gw, -2, dtype=np.int32)
+    cands = []
+
+    for y in range(gh):
+        row = index[y]
+        heights = np.where(avail[y], np.where(row == prev_row, heights + 1, 1), 0)
+        prev_row = np.where(avail[y], row, -2)
+
+        # Gộp các ô liền kề cùng (chiều cao, màu) thành 1 đoạn để stack chỉ
+        # duyệt theo đoạn thay vì từng ô (ảnh phẳng/upscale có rất ít đoạn)
+        step = np.flatnonzero((heights[1:] != heights[:-1]) | (row[1:] != row[:-1])) + 1
+        starts = [0] + step.tolist()
+        seg_h = heights[starts].tolist()
+        seg_c = row[starts].tolist()
+
+        stack: List[Tuple[int, int]] = []  # (start_x, height), cùng màu với run hiện tại
+        run_color = None
+        for i in range(len(starts) + 1):
+            if i < len(starts):
+                x, h, c = starts[i], seg_h[i], seg_c[i]
+            else:
+                x, h, c = gw, 0, None
+            if c != run_color:
+                # Đổi màu: các cột của màu trước không kéo dài được nữa
+                while stack:
+                    sx, sh = stack.pop()
+                    area = sh * (x - sx)
+                    if sh >= min_h and area >= min_area:
+                        cands.append((area, (sx, y - sh + 1, x - 1, y, run_color)))
+                run_color = c
+            start = x
+            while stack and stack[-1][1] >= h:
+                sx, sh = stack.pop()
+                area = sh * (x - sx)
+                if sh >= min_h and area >= min_area:
+                    cands.append((area, (sx, y - sh + 1, x - 1, y, run_color)))
+                start = sx
+            if h > 0:
+                stack.append((start, h))
+    return cands
+
+
+def _histogram_rects(index: np.ndarray, avail: np.ndarray,
+                     min_h: int, min_area: int) -> List[Rect]:
+    """Nhận rect lớn nhất trước; lặp lại trên phần trống tới khi hết ứng viên."""
+    rects = []
+    while True:
+        cands = _histogram_candidates(index, avail, min_h, min_area)
+        if not cands:
+            break
+        cands.sort(key=lambda item: -item[0])
+        for _, (x0, y0, x1, y1, c) in cands:
+            block = avail[y0:y1 + 1, x0:x1 + 1]
+            if block.all():
+                block[...] = False
+                rects.append((x0, y0, x1, y1, c))
+    return rects
+
+
+def _greedy_rects(index: np.ndarray, avail: np.ndarray,
+                  min_h: int, min_area: int) -> List[Rect]:
+    """Thuật toán cũ (mở rộng phải rồi xuống từ góc trái trên), kiểm tra bằng numpy."""
+    gh, gw = index.shape
+    rects = []
+    for y in range(gh):
+        for x in range(gw):
+            if not avail[y, x]:
+                continue
+            c = index[y, x]
+            mx = x
+            while mx + 1 < gw and avail[y, mx + 1] and index[y, mx + 1] == c:
+                mx += 1
+            my = y
+            while my + 1 < gh:
+                seg = slice(x, mx + 1)
+                if avail[my + 1, seg].all() and (index[my + 1, seg] == c).all():
+                    my += 1
+                else:
+                    break
+            h = my - y + 1
+            if h >= min_h and (mx - x + 1) * h >= min_area:
+                avail[y:my + 1, x:mx + 1] = False
+                rects.append((x, y, mx, my, int(c)))
+    return rects
+
+
+def collect_runs(index: np.ndarray, avail: np.ndarray) -> Tuple[List[Run], List[Dot]]:
+    """Gom các pixel còn lại thành run ngang (theo thứ tự hàng, trái → phải).
+
+    Returns (rows, dots): rows là run ≥ 2 pixel, dots là pixel lẻ.
+    """
+    gh, gw = index.shape
+    masked = np.where(avail, index, -1)
+    pad = np.full((gh, 1), -1, dtype=masked.dtype)
+    padded = np.concatenate([pad, masked, pad], axis=1)
+    ys, xs = np.nonzero(padded[:, 1:] != padded[:, :-1])
+
+    rows: List[Run] = []
+    dots: List[Dot] = []
+    ys_l, xs_l = ys.tolist(), xs.tolist()
+    for i in range(len(ys_l) - 1):
+        y, xs0 = ys_l[i], xs_l[i]
+        if ys_l[i + 1] != y or xs0 >= gw:
+            continue
+        c = int(masked[y, xs0])
+        if c < 0:
+            continue
+        xe = xs_l[i + 1] - 1
+        if xe == xs0:
+            dots.append((y, xs0, c))
+        else:
+            rows.append((y, xs0, xe, c))
+    return rows, dots
+
+
+def _run_strategy(index: np.ndarray, strategy: str, min_h: int, min_area: int):
+    avail = index >= 0
+    finder = _histogram_rects if strategy == "histogram" else _greedy_rects
+    rects = finder(index, avail, min_h, min_area)
+    rows, dots = collect_runs(index, avail)
+    return rects, rows, dots
+
+
+def _decompose_serial(index: np.ndarray, mode: str) -> Tuple[List[Rect], List[Run], List[Dot]]:
+    if mode == "fast":
+        return _run_strategy(index, "histogram", DEFAULT_MIN_HEIGHT, DEFAULT_MIN_AREA)
+    best = None
+    for strategy in ("histogram", "greedy"):
+        for min_area in (DEFAULT_MIN_AREA, 3, 2):
+            result = _run_strategy(index, strategy, DEFAULT_MIN_HEIGHT, min_area)
+            if best is None or sum(map(len, result)) < sum(map(len, best)):
+                best = result
+    return best
+
+
+def band_bounds(gh: int, workers: int, band_height: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Chia [0, gh) thành các băng [y0, y1); mặc định mỗi worker một băng."""
+    if band_height is None:
+        band_height = max(MIN_BAND_HEIGHT, math.ceil(gh / max(1, workers)))
+    band_height = max(1, band_height)
+    return [(y, min(gh, y + band_height)) for y in range(0, gh, band_height)]
+
+
+def stitch_bands(bands: List[Tuple[int, int]],
+                 parts: List[Tuple[List[Rect], List[Run], List[Dot]]]) -> Tuple[List[Rect], List[Run], List[Dot]]:
+    """Ghép kết quả của từng băng (toạ độ cục bộ) thành phân rã của cả lưới.
+
+    Rect (và row ở hàng đầu/cuối băng, coi như rect cao 1) kết thúc ở đáy một
+    băng được nối với rect bắt đầu ở đỉnh băng kế tiếp nếu cùng x0, x1 và màu.
+    Hai row chồng nhau thành rect cao 2, rộng ≥ 2 nên vẫn đạt ngưỡng mặc định.
+    """
+    spans: List[List[int]] = []            # [x0, y0, x1, y1, c]
+    rows: List[Run] = []
+    dots: List[Dot] = []
+    open_spans: Dict[Tuple[int, int, int], List[int]] = {}
+    for (y0, y1), (band_rects, band_rows, band_dots) in zip(bands, parts):
+        last = y1 - y0 - 1
+        edge = [(rx0, ry0 + y0, rx1, ry1 + y0, c) for rx0, ry0, rx1, ry1, c in band_rects]
+        for y, xs, xe, c in band_rows:
+            if y == 0 or y == last:
+                edge.append((xs, y + y0, xe, y + y0, c))
+            else:
+                rows.append((y + y0, xs, xe, c))
+        dots.extend((y + y0, x, c) for y, x, c in band_dots)
+
+        next_open = {}
+        for sx0, sy0, sx1, sy1, c in edge:
+            span = open_spans.get((sx0, sx1, c)) if sy0 == y0 else None
+            if span is not None:
+                span[3] = sy1
+            else:
+                span = [sx0, sy0, sx1, sy1, c]
+                spans.append(span)
+            if sy1 == y1 - 1:
+                next_open[(sx0, sx1, c)] = span
+        open_spans = next_open
+
+    rects: List[Rect] = []
+    for x0, y0, x1, y1, c in spans:
+        if y1 > y0:
+            rects.append((x0, y0, x1, y1, c))
+        else:
+            rows.append((y0, x0, x1, c))
+    rows.sort()
+    dots.sort()
+    return rects, rows, dots
+
+
+def _band_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool dùng lại giữa các lần gọi (tạo pool mới mỗi lần chậm hơn cả phân rã tuần tự)."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers), workers
+    return _pool
+
+
+def _decompose_bands(slices: List[np.ndarray], mode: str, workers: int):
+    global _pool
+    try:
+        return list(_band_pool(workers).map(_decompose_serial, slices, repeat(mode)))
+    except BrokenProcessPool:
+        # Worker chết: bỏ pool hỏng, phân rã tuần tự (kết quả giống hệt)
+        _pool = None
+        return [_decompose_serial(band, mode) for band in slices]
+
+
+def decompose(index: np.ndarray, mode: str = "fast", workers: int = 1,
+              band_height: Optional[int] = None) -> Decomposition:
+    """Phân rã lưới chỉ số màu (-1 = trong suốt) thành rect/row/dot.
+
+    Args:
+        index: mảng int [gh, gw] từ _build_index_grid()
+        mode: 'fast' - một lượt histogram với ngưỡng mặc định
+              'quality' - thử nhiều chiến lược/ngưỡng, chọn tổng số thẻ nhỏ nhất
+        workers: > 1 và lưới ≥ MIN_PARALLEL_PIXELS → chia băng ngang, phân rã song
+                 song trong process pool dùng chung rồi ghép lại (xem stitch_bands).
+                 Kết quả khác phân rã cả lưới (có thể nhiều thẻ hơn một chút) nên
+                 workers là một phần của khoá cache (xem encode_cache.py)
+        band_height: chiều cao mỗi băng (mặc định chia đều cho workers, tối thiểu
+                     MIN_BAND_HEIGHT); đặt tường minh để chia băng cả khi workers = 1
+    """
+    if mode not in DECOMPOSE_MODES:
+        raise ValueError(f"Mode phân rã không hợp lệ: '{mode}'. Hỗ trợ: {', '.join(DECOMPOSE_MODES)}")
+
+    t0 = time.perf_counter()
+    parallel = workers > 1 and index.size >= MIN_PARALLEL_PIXELS
+    bands = band_bounds(index.shape[0], workers, band_height) if parallel or band_height else []
+    if len(bands) > 1:
+        slices = [index[y0:y1] for y0, y1 in bands]
+        if parallel:
+            parts = _decompose_bands(slices, mode, workers)
+        else:
+            parts = [_decompose_serial(band, mode) for band in slices]
+        best = stitch_bands(bands, parts)
+    else:
+        best = _decompose_serial(index, mode)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    return Decomposition(best[0], best[1], best[2], elapsed_ms, max(1, len(bands)))
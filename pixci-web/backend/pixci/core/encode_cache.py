@@ -0,0 +1,273 @@
+"""
+encode_cache.py - Cache kết quả encode theo nội dung ảnh.
+
+Khoá = sha256(kích thước + pixel RGBA đã giải mã + định dạng + tuỳ chọn encoder),
+nên cùng một sprite upload lại (tên file khác, PNG nén khác) vẫn trúng cache.
+Hai tầng:
+  - bộ nhớ: LRU giới hạn số mục và tổng dung lượng text
+  - đĩa (tuỳ chọn): mỗi mục một file JSON, vượt dung lượng thì xoá file cũ nhất
+    (mtime được cập nhật mỗi lần trúng → LRU gần đúng). Tổng dung lượng được
+    cộng dồn khi ghi; chỉ quét thư mục khi vượt ngân sách hoặc sau mỗi
+    DISK_RESCAN_WRITES lần ghi (bắt kịp process khác dùng chung thư mục)
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from .analysis import ImageAnalysis
+
+# Tăng khi output của encoder thay đổi để bỏ qua các mục cũ trên đĩa
+CACHE_VERSION = 1
+
+CACHE_FORMATS = ("grid", "code", "pxvg")
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 256 * 1024 * 1024
+DISK_RESCAN_WRITES = 256
+
+
+class CacheEntry(NamedTuple):
+    result: Tuple[int, int, int, int]   # (grid_w, grid_h, num_colors, block_size)
+    text: str                           # nội dung file output
+    stats: dict
+
+
+class EncodeCache:
+    """LRU trong bộ nhớ + tầng đĩa tuỳ chọn.
+
+    Args:
+        max_entries: số mục tối đa trong bộ nhớ
+        max_bytes: tổng dung lượng text tối đa trong bộ nhớ
+        disk_dir: thư mục cache trên đĩa (None = tắt tầng đĩa)
+        disk_max_bytes: dung lượng tối đa của thư mục cache
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES,
+                 disk_dir: Optional[Path] = None, disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None   # None = chưa quét thư mục lần nào
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(analysis: ImageAnalysis, fmt: str, options: dict) -> str:
+        h = hashlib.sha256()
+        h.update(f"v{CACHE_VERSION}|{fmt}|{analysis.image.size}|".encode())
+        h.update(json.dumps(options, sort_keys=True, default=str).encode())
+        h.update(analysis.image.tobytes())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._memory_put(key, entry)
+        self._disk_put(key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.memory_hits + self.disk_hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_enabled": self.disk_dir is not None,
+            }
+
+    # --- Tầng bộ nhớ (gọi khi đã giữ lock) ---
+
+    def _memory_put(self, key: str, entry: CacheEntry) -> None:
+        size = len(entry.text)
+        if size > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.text)
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.text)
+            self.evictions += 1
+
+    # --- Tầng đĩa ---
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> Optional[CacheEntry]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(tuple(data["result"]), data["text"], data["stats"])
+
+    def _disk_put(self, key: str, entry: CacheEntry) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"result": list(entry.result), "text": entry.text, "stats": entry.stats}, f)
+            size = tmp.stat().st_size
+            try:
+                size -= path.stat().st_size
+            except OSError:
+                pass
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_writes += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes += size
+            rescan = (self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes
+                      or self._disk_writes % DISK_RESCAN_WRITES == 0)
+        if rescan:
+            self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        """Quét thư mục, xoá file cũ nhất tới khi vừa ngân sách và đặt lại tổng dung lượng."""
+        files = []
+        total = 0
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+
+_default_cache: Optional[EncodeCache] = None
+
+# Tham số encoder không thuộc khoá cache
+_NON_OPTIONS = ("image_path", "output_path", "block_size", "auto_detect", "stats", "analysis")
+
+
+def _with_defaults(encoder, options: dict) -> dict:
+    """Bổ sung giá trị mặc định để gọi tường minh hay ngầm định đều ra cùng khoá."""
+    merged = {
+        name: p.default for name, p in inspect.signature(encoder).parameters.items()
+        if name not in _NON_OPTIONS and p.default is not inspect.Parameter.empty
+    }
+    merged.update(options)
+    return merged
+
+
+def default_cache() -> EncodeCache:
+    """Cache dùng chung của process; tầng đĩa bật khi có biến môi trường PIXCI_CACHE_DIR."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EncodeCache(disk_dir=os.environ.get("PIXCI_CACHE_DIR") or None)
+    return _default_cache
+
+
+def encode_cached(fmt: str, image_path: Path, output_path: Path, block_size: int = 1, auto_detect: bool = True,
+                  cache: Optional[EncodeCache] = None, stats: Optional[dict] = None,
+                  analysis: Optional[ImageAnalysis] = None, **options) -> Tuple[int, int, int, int]:
+    """Encode qua cache. Trúng cache → ghi lại output đã lưu, không phân tích lại.
+
+    Args:
+        fmt: 'grid', 'code' hoặc 'pxvg'
+        cache: EncodeCache (mặc định: default_cache())
+        stats: được điền như encoder gốc, thêm stats["cached"]
+        analysis: ImageAnalysis dùng chung khi encode cùng ảnh sang nhiều định dạng
+        options: tham số riêng của encoder (rect_mode, cost_metric, budget, compact, ...)
+    """
+    from .code_engine import encode_code
+    from .grid_engine import encode_image
+    from .smart_encoder import smart_encode_pxvg
+
+    if fmt not in CACHE_FORMATS:
+        raise ValueError(f"Định dạng không hợp lệ: '{fmt}'. Hỗ trợ: {', '.join(CACHE_FORMATS)}")
+    if cache is None:
+        cache = default_cache()
+    output_path = Path(output_path)
+    if analysis is None:
+        analysis = ImageAnalysis(image_path, block_size, auto_detect)
+
+    encoder = {"grid": encode_image, "code": encode_code, "pxvg": smart_encode_pxvg}[fmt]
+    key_options = _with_defaults(encoder, options)
+    key_options.update(block_size=block_size, auto_detect=auto_detect)
+    if fmt == "code":
+        # Script ghi tên ảnh (comment) và tên file PNG khi save
+        key_options["names"] = (analysis.name, output_path.stem)
+    key = cache.make_key(analysis, fmt, key_options)
+
+    entry = cache.get(key)
+    if entry is None:
+        encode_stats: dict = {}
+        if fmt != "grid":
+            options["stats"] = encode_stats
+        result = encoder(image_path, output_path, block_size, auto_detect, analysis=analysis, **options)
+        with open(output_path, "r", encoding="utf-8") as f:
+            entry = CacheEntry(tuple(result), f.read(), encode_stats)
+        cache.put(key, entry)
+        cached = False
+    else:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(entry.text)
+        cached = True
+
+    if stats is not None:
+        stats.update(entry.stats)
+        stats["cached"] = cached
+    return entry.result
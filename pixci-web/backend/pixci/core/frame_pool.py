@@ -0,0 +1,76 @@
+"""
+frame_pool.py - Render các frame animation song song trên process pool.
+
+Các frame của một animation độc lập với nhau. Mỗi worker nhận RenderPlan đúng
+một lần (initializer) và giữ defs + cache sprite riêng cho mọi frame nó xử lý;
+task chỉ là chỉ số frame, kết quả là buffer RGBA thô (row-major) để process cha
+ghép spritesheet và ghi GIF. Kết quả giống hệt render tuần tự từng byte.
+Animation nhỏ (tổng pixel < MIN_PARALLEL_FRAME_PIXELS) render tuần tự: chi phí
+khởi động pool lớn hơn phần tiết kiệm được.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from PIL import Image
+
+from .render_plan import PostprocessPipeline, RenderPlan, render_frame, render_frames
+
+MIN_PARALLEL_FRAME_PIXELS = 256 * 256
+
+# Trạng thái riêng của mỗi worker: (plan, defs, sprites, pipeline)
+_worker_state: Optional[tuple] = None
+
+
+def frame_image(canvas) -> Image.Image:
+    """Canvas → ảnh PIL RGBA kích thước gốc (pixel giống hệt Canvas.save)."""
+    img = Image.new("RGBA", (canvas.width, canvas.height))
+    pixels = img.load()
+    flat = canvas.flatten()
+    for x in range(canvas.width):
+        for y in range(canvas.height):
+            pixels[x, y] = flat[x][y]
+    return img
+
+
+def _init_worker(plan: RenderPlan):
+    global _worker_state
+    _worker_state = (plan, dict(plan.defs), {}, PostprocessPipeline(plan.postprocess))
+
+
+def _render_frame_job(index: int) -> bytes:
+    plan, defs, sprites, pipeline = _worker_state
+    return frame_image(render_frame(plan, plan.frames[index], defs, sprites, pipeline)).tobytes()
+
+
+def _chunksize(jobs: int, workers: int) -> int:
+    return max(1, jobs // (workers * 4))
+
+
+def render_frame_images(plan: RenderPlan, workers: int = 1) -> List[Image.Image]:
+    """Render mọi frame của plan thành ảnh PIL.
+
+    workers > 1: các frame chia cho process pool (postprocess trong mỗi worker
+    chạy tuần tự); chỉ có một frame thì workers dành cho postprocess theo tile.
+    """
+    num_frames = len(plan.frames)
+    if workers <= 1 or num_frames <= 1 or num_frames * plan.width * plan.height < MIN_PARALLEL_FRAME_PIXELS:
+        return [frame_image(fc) for fc in render_frames(plan, workers)]
+    size = (plan.width, plan.height)
+    with ProcessPoolExecutor(max_workers=min(workers, num_frames), initializer=_init_worker,
+                             initargs=(plan,)) as pool:
+        buffers = list(pool.map(_render_frame_job, range(num_frames),
+                                chunksize=_chunksize(num_frames, workers)))
+    return [Image.frombytes("RGBA", size, buf) for buf in buffers]
+
+
+def canvas_images(canvases: list) -> List[Image.Image]:
+    """merge_all + chuyển các Canvas (frame của Animation) thành ảnh PIL.
+
+    Luôn chạy trong process: gửi canvas sang worker phải pickle cả lưới pixel,
+    đắt hơn chính việc chuyển đổi.
+    """
+    images = []
+    for canvas in canvases:
+        canvas.merge_all()
+        images.append(frame_image(canvas))
+    return images
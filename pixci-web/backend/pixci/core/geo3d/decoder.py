@@ -24,8 +24,8 @@ def decode_pxvg_to_texture(
     Returns:
         Path của texture PNG đã tạo
     """
-    from ..pxvg_engine import decode_pxvg
-    from tempfile import NamedTemporaryFile
+    from ..frame_pool import frame_image
+    from ..pxvg_engine import decode_pxvg_to_canvas
     
     pxvg_dir = Path(pxvg_dir)
     
@@ -93,29 +93,26 @@ def decode_pxvg_to_texture(
         if not uv_keys:
             continue
         
-        with NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-            tmp_path = Path(tmp.name)
+        # Decode trong bộ nhớ (texture là ảnh tĩnh)
+        canvas = decode_pxvg_to_canvas(pxvg_path)
+        if isinstance(canvas, list):
+            raise ValueError(f"{pxvg_path.name}: PXVG của texture phải là ảnh tĩnh, không phải animation")
+        combined_img = frame_image(canvas)
         
-        try:
-            decode_pxvg(pxvg_path, tmp_path, scale=1)
-            combined_img = Image.open(tmp_path).convert('RGBA')
-            
-            uv_list = uv_keys.split('|')
-            
-            if len(uv_list) == 1:
-                x, y, w, h = map(int, uv_list[0].split(','))
-                atlas.paste(combined_img, (x, y))
-            else:
-                x_offset = 0
-                for uv_key in uv_list:
-                    x, y, w, h = map(int, uv_key.split(','))
-                    face_img = combined_img.crop((x_offset, 0, x_offset + w, combined_img.height))
-                    if face_img.height != h:
-                        face_img = face_img.crop((0, 0, w, h))
-                    atlas.paste(face_img, (x, y))
-                    x_offset += w
-        finally:
-            tmp_path.unlink(missing_ok=True)
+        uv_list = uv_keys.split('|')
+        
+        if len(uv_list) == 1:
+            x, y, w, h = map(int, uv_list[0].split(','))
+            atlas.paste(combined_img, (x, y))
+        else:
+            x_offset = 0
+            for uv_key in uv_list:
+                x, y, w, h = map(int, uv_key.split(','))
+                face_img = combined_img.crop((x_offset, 0, x_offset + w, combined_img.height))
+                if face_img.height != h:
+                    face_img = face_img.crop((0, 0, w, h))
+                atlas.paste(face_img, (x, y))
+                x_offset += w
     
     # Save texture
     atlas.save(output_texture_path)
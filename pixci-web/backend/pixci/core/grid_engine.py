@@ -3,14 +3,17 @@ grid_engine.py - Encode/Decode giữa Image ↔ Text Grid format.
 Đây là chế độ cơ bản dùng ký tự ASCII biểu diễn pixel.
 """
 import re
+import numpy as np
 from pathlib import Path
 from PIL import Image
-from typing import Tuple
+from typing import Optional, Tuple
+
+from .analysis import ImageAnalysis
 
 # Re-export prompts for backward compatibility
 from .prompts import SYSTEM_PROMPT, AI_CODE_SYSTEM_PROMPT, init_code_canvas
 # Re-export code engine for backward compatibility  
-from .code_engine import encode_code
+from .code_engine import encode_code, detect_grid
 
 
 def rgb2hex(r: int, g: int, b: int, a: int = 255) -> str:
@@ -28,73 +31,29 @@ def hex2rgba(hex_str: str) -> Tuple[int, int, int, int]:
 
 
 def detect_block_size(img: Image.Image) -> int:
-    pixels = img.load()
-    w, h = img.size
-    if w == 0:
-        return 1
-    min_run = w
-    for y in range(0, h, max(1, h // 10)):
-        current_color = pixels[0, y]
-        current_run = 0
-        for x in range(w):
-            if pixels[x, y] == current_color:
-                current_run += 1
-            else:
-                if current_run > 0:
-                    min_run = min(min_run, current_run)
-                current_color = pixels[x, y]
-                current_run = 1
-        if current_run > 0:
-            min_run = min(min_run, current_run)
-    for x in range(0, w, max(1, w // 10)):
-        current_color = pixels[x, 0]
-        current_run = 0
-        for y in range(h):
-            if pixels[x, y] == current_color:
-                current_run += 1
-            else:
-                if current_run > 0:
-                    min_run = min(min_run, current_run)
-                current_color = pixels[x, y]
-                current_run = 1
-        if current_run > 0:
-            min_run = min(min_run, current_run)
-    return max(1, min_run)
+    return detect_grid(img)[0]
 
 
-def encode_image(image_path: Path, output_path: Path, block_size: int, auto_detect: bool) -> Tuple[int, int, int, int]:
-    """Encode image to text grid format ([PALETTE] + [GRID])."""
-    img = Image.open(image_path).convert("RGBA")
+def encode_image(image_path: Path, output_path: Path, block_size: int, auto_detect: bool,
+                 analysis: Optional[ImageAnalysis] = None) -> Tuple[int, int, int, int]:
+    """Encode image to text grid format ([PALETTE] + [GRID]).
     
-    if auto_detect:
-        block_size = detect_block_size(img)
-        
-    width, height = img.size
-    grid_w = width // block_size
-    grid_h = height // block_size
-    pixels = img.load()
+    analysis: ImageAnalysis dùng chung với các encoder khác (khi có thì bỏ qua
+              image_path/block_size/auto_detect)
+    """
+    if analysis is None:
+        analysis = ImageAnalysis(image_path, block_size, auto_detect)
+    grid_w, grid_h = analysis.size
+    # Grid text giữ cả block lẻ ở mép phải/dưới (kích thước trả về vẫn làm tròn xuống)
+    index, colors = analysis.partial_grid
     
     chars = [chr(i) for i in range(ord('A'), ord('Z')+1)] + [str(i) for i in range(10)]
-    palette_mapping = {}
-    char_idx = 0
-    
-    output_grid = []
-    
-    for y in range(0, height, block_size):
-        row = []
-        for x in range(0, width, block_size):
-            r, g, b, a = pixels[x, y]
-            if a == 0:
-                row.append(".")
-            else:
-                hex_val = rgb2hex(r, g, b, a)
-                if hex_val not in palette_mapping:
-                    if char_idx >= len(chars):
-                        raise ValueError("Quá nhiều màu! PixCI chỉ hỗ trợ tối đa 36 màu duy nhất.")
-                    palette_mapping[hex_val] = chars[char_idx]
-                    char_idx += 1
-                row.append(palette_mapping[hex_val])
-        output_grid.append(" ".join(row))
+    if len(colors) > len(chars):
+        raise ValueError("Quá nhiều màu! PixCI chỉ hỗ trợ tối đa 36 màu duy nhất.")
+    # Palette theo thứ tự xuất hiện (quét hàng) → ký tự A-Z, 0-9
+    palette_mapping = dict(zip(colors, chars))
+    lookup = np.array(chars[:len(colors)] + ["."], dtype=object)
+    output_grid = [" ".join(row) for row in lookup[index].tolist()]
         
     with open(output_path, "w", encoding="utf-8") as f:
         f.write("[PALETTE]\n")
@@ -105,7 +64,7 @@ def encode_image(image_path: Path, output_path: Path, block_size: int, auto_dete
         for row_str in output_grid:
             f.write(row_str + "\n")
             
-    return (grid_w, grid_h, len(palette_mapping), block_size)
+    return (grid_w, grid_h, len(palette_mapping), analysis.block_size)
 
 
 def decode_text(text_path: Path, output_path: Path, scale: int) -> Tuple[int, int]:
@@ -0,0 +1,259 @@
+"""
+lossy.py - Encode PXVG có giới hạn ngân sách (bytes, tokens hoặc số thẻ).
+
+Nếu bản lossless vượt ngân sách, lưới chỉ số màu được đơn giản hoá theo các mức
+ngày càng mạnh (mỗi mức luôn áp lên lưới gốc, không cộng dồn sai số):
+  1. gộp các màu gần nhau (khoảng cách RGBA < ngưỡng) về màu phổ biến hơn
+  2. nuốt pixel lẻ / cụm nhỏ (diện tích ≤ ngưỡng) vào màu láng giềng chiếm đa
+     số; láng giềng chủ yếu trong suốt → cụm bị xoá (bỏ chi tiết nhỏ)
+Kích thước (gần như) giảm dần theo mức nên mức vừa ngân sách được tìm nhị phân
+(optimizer chạy lại ở mỗi mức được thử). Sai số pixel so với ảnh gốc được báo
+cáo trong stats.
+"""
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .canvas_base import hex2rgba
+from .decompose import Decomposition, decompose
+from .pxvg_optimizer import (
+    Defs, _plan_from_decomposition, document_text, element_cost, expected_array, optimize_elements,
+)
+
+BUDGET_UNITS = ("bytes", "tokens", "tags")
+
+# (ngưỡng khoảng cách màu RGBA, diện tích cụm tối đa bị nuốt); mức 0 = lossless
+LOSSY_LEVELS = (
+    (0, 0), (0, 1), (8, 1), (16, 1), (24, 2), (32, 3), (48, 4),
+    (64, 6), (96, 9), (128, 16), (160, 25), (192, 36),
+)
+
+
+class LossyResult(NamedTuple):
+    index: np.ndarray          # lưới đã đơn giản hoá (palette đã thu gọn)
+    colors: List[str]
+    keys: List[str]
+    decomposition: Decomposition
+    elements: List[str]
+    defs: Defs
+    stats: dict                # stats của optimizer + ngân sách + sai số pixel
+
+
+def merge_colors(index: np.ndarray, colors: List[str], threshold: float) -> np.ndarray:
+    """Gộp các màu cách nhau < threshold về màu có nhiều pixel hơn.
+
+    Xét các cặp theo khoảng cách tăng dần; hai cụm chỉ gộp khi màu đại diện
+    của chúng còn gần nhau (tránh trôi màu theo chuỗi).
+    """
+    n = len(colors)
+    if threshold <= 0 or n < 2:
+        return index
+    rgba = np.array([hex2rgba(c) for c in colors], dtype=np.float64)
+    dist = np.sqrt(((rgba[:, None, :] - rgba[None, :, :]) ** 2).sum(axis=2))
+    counts = np.bincount(index[index >= 0].ravel(), minlength=n)
+    parent = list(range(n))
+    rep = list(range(n))  # màu đại diện của cụm (theo gốc)
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    ii, jj = np.triu_indices(n, 1)
+    close = dist[ii, jj] < threshold
+    ii, jj = ii[close], jj[close]
+    for k in np.argsort(dist[ii, jj], kind="stable").tolist():
+        ri, rj = find(int(ii[k])), find(int(jj[k]))
+        if ri == rj or dist[rep[ri], rep[rj]] >= threshold:
+            continue
+        keep = rep[ri] if counts[rep[ri]] >= counts[rep[rj]] else rep[rj]
+        parent[rj] = ri
+        rep[ri] = keep
+
+    remap = np.array([rep[find(i)] for i in range(n)] + [-1], dtype=np.int32)
+    return remap[index]
+
+
+def _components(index: np.ndarray) -> Tuple[np.ndarray, List[List[Tuple[int, int]]]]:
+    """Gán nhãn vùng liên thông 4 hướng cùng chỉ số màu (kể cả vùng trong suốt)."""
+    gh, gw = index.shape
+    labels = np.full((gh, gw), -1, dtype=np.int32)
+    grid = index.tolist()
+    lab = labels.tolist()
+    comps: List[List[Tuple[int, int]]] = []
+    for sy in range(gh):
+        for sx in range(gw):
+            if lab[sy][sx] >= 0:
+                continue
+            c, cid = grid[sy][sx], len(comps)
+            lab[sy][sx] = cid
+            pixels = []
+            queue = deque([(sx, sy)])
+            while queue:
+                x, y = queue.popleft()
+                pixels.append((x, y))
+                for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                    if 0 <= nx < gw and 0 <= ny < gh and lab[ny][nx] < 0 and grid[ny][nx] == c:
+                        lab[ny][nx] = cid
+                        queue.append((nx, ny))
+            comps.append(pixels)
+    return np.array(lab, dtype=np.int32), comps
+
+
+def absorb_small_regions(index: np.ndarray, max_area: int) -> np.ndarray:
+    """Thay các cụm diện tích ≤ max_area bằng màu láng giềng chiếm đa số (cụm nhỏ trước)."""
+    if max_area <= 0:
+        return index
+    labels, comps = _components(index)
+    out = index.copy()
+    gh, gw = index.shape
+    for cid in sorted(range(len(comps)), key=lambda i: len(comps[i])):
+        pixels = comps[cid]
+        if len(pixels) > max_area:
+            break
+        votes: Dict[int, int] = {}
+        for x, y in pixels:
+            for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if 0 <= nx < gw and 0 <= ny < gh and labels[ny, nx] != cid:
+                    c = int(out[ny, nx])
+                    votes[c] = votes.get(c, 0) + 1
+        if not votes:
+            continue
+        winner = max(votes, key=lambda c: (votes[c], c))
+        for x, y in pixels:
+            out[y, x] = winner
+    return out
+
+
+def simplify(index: np.ndarray, colors: List[str], distance: float, max_area: int) -> np.ndarray:
+    """Một mức đơn giản hoá: gộp màu gần nhau rồi nuốt cụm nhỏ."""
+    return absorb_small_regions(merge_colors(index, colors, distance), max_area)
+
+
+def compact_palette(index: np.ndarray, colors: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Bỏ các màu không còn pixel nào, đánh lại chỉ số theo thứ tự xuất hiện."""
+    used = index[index >= 0].ravel()
+    order = list(dict.fromkeys(used.tolist()))
+    remap = np.full(len(colors) + 1, -1, dtype=np.int32)
+    remap[order] = np.arange(len(order), dtype=np.int32)
+    return remap[index], [colors[i] for i in order]
+
+
+def pixel_error(original: np.ndarray, simplified: np.ndarray) -> dict:
+    """So hai ảnh RGBA [h, w, 4]: số pixel khác, tỉ lệ (%) và độ lệch RGBA trung bình."""
+    delta = np.sqrt(((original.astype(np.int32) - simplified.astype(np.int32)) ** 2).sum(axis=2))
+    changed = int((delta > 0).sum())
+    return {
+        "changed_pixels": changed,
+        "pixel_error": round(100.0 * changed / max(1, delta.size), 2),
+        "mean_delta": round(float(delta.mean()) if delta.size else 0.0, 3),
+    }
+
+
+def budget_cost(text: str, stats: dict, unit: str) -> int:
+    if unit == "tags":
+        return stats["elements"]
+    return element_cost(text, unit)
+
+
+def fit_budget(index: np.ndarray, colors: List[str], budget: int, unit: str = "bytes",
+               metric: str = "bytes", rect_mode: str = "fast",
+               decomposition: Optional[Decomposition] = None, workers: int = 1) -> LossyResult:
+    """Đơn giản hoá lưới tới khi tài liệu PXVG vừa ngân sách.
+
+    Args:
+        index: lưới chỉ số màu gốc [gh, gw], -1 = trong suốt
+        colors: palette gốc (hex)
+        budget: ngân sách tối đa theo unit
+        unit: 'bytes' / 'tokens' (cả tài liệu) hoặc 'tags' (số thẻ vẽ)
+        metric, rect_mode: truyền cho optimize_elements / decompose
+        decomposition: phân rã sẵn của lưới gốc (dùng lại cho mức 0 - lossless)
+        workers: số process phân rã song song (xem decompose.py)
+
+    Chi phí gần như giảm dần theo mức nên mức vừa ngân sách được tìm nhị phân
+    (sau khi thử lossless); ảnh nhiễu có thể không đơn điệu, khi đó mức trả về
+    vừa ngân sách nhưng không chắc là mức nhỏ nhất. Các mức cho cùng lưới dùng
+    chung một kết quả. Mỗi mức thử trước plan direct: unit trùng metric và
+    direct đã vừa → optimizer chỉ chạy lại cho mức được chọn.
+    Không mức nào vừa → trả về mức mạnh nhất, stats["within_budget"] = False.
+    """
+    from .code_engine import _make_key
+
+    if unit not in BUDGET_UNITS:
+        raise ValueError(f"Đơn vị ngân sách không hợp lệ: '{unit}'. Hỗ trợ: {', '.join(BUDGET_UNITS)}")
+    if budget <= 0:
+        raise ValueError("Ngân sách phải lớn hơn 0")
+
+    gh, gw = index.shape
+    original = expected_array(index, colors)
+    grids: Dict[int, tuple] = {}
+    results: Dict[int, LossyResult] = {}
+    seen: Dict[tuple, int] = {}     # fingerprint lưới → mức đầu tiên cho ra lưới đó
+    alias: Dict[int, int] = {}
+
+    def grid(level: int) -> tuple:
+        level = alias.get(level, level)
+        if level not in grids:
+            if level == 0:
+                simplified, level_colors = compact_palette(index, colors)
+                # Phân rã sẵn chỉ dùng được khi chỉ số màu không bị đánh lại
+                dec = decomposition if level_colors == list(colors) else None
+            else:
+                distance, max_area = LOSSY_LEVELS[level]
+                simplified, level_colors = compact_palette(simplify(index, colors, distance, max_area), colors)
+                dec = None
+            fingerprint = (simplified.tobytes(), tuple(level_colors))
+            if fingerprint in seen:
+                alias[level] = seen[fingerprint]
+                return grids[alias[level]]
+            seen[fingerprint] = level
+            keys = [_make_key(i) for i in range(len(level_colors))]
+            grids[level] = (simplified, level_colors, keys, dec or decompose(simplified, rect_mode, workers))
+        return grids[level]
+
+    def result(level: int) -> LossyResult:
+        grid(level)
+        requested, level = level, alias.get(level, level)
+        if level not in results:
+            simplified, level_colors, keys, dec = grid(level)
+            elements, defs, cost_stats = optimize_elements(simplified, level_colors, keys, metric, rect_mode,
+                                                           decomposition=dec)
+            text = document_text(gw, gh, level_colors, keys, elements, defs)
+            cost = budget_cost(text, cost_stats, unit)
+            cost_stats.update({
+                "budget": budget,
+                "budget_unit": unit,
+                "budget_cost": cost,
+                "lossy_level": level,
+                "within_budget": cost <= budget,
+            })
+            cost_stats.update(pixel_error(original, expected_array(simplified, level_colors)))
+            results[level] = LossyResult(simplified, level_colors, keys, dec, elements, defs, cost_stats)
+        found = results[level]
+        return found._replace(stats={**found.stats, "lossy_level": requested})
+
+    def fits(level: int) -> bool:
+        grid(level)
+        level = alias.get(level, level)
+        if unit == metric and level not in results:
+            # Optimizer luôn chọn plan không đắt hơn direct: direct vừa → mức này vừa
+            simplified, level_colors, keys, dec = grid(level)
+            direct = _plan_from_decomposition(dec, keys, metric)
+            if budget_cost(document_text(gw, gh, level_colors, keys, direct, []), {}, unit) <= budget:
+                return True
+        return result(level).stats["within_budget"]
+
+    if fits(0):
+        return result(0)
+    lo, hi = 1, len(LOSSY_LEVELS) - 1
+    if not fits(hi):
+        return result(hi)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return result(hi)
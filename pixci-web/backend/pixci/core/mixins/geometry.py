@@ -1,4 +1,4 @@
-from typing import Tuple, List, Union
+from typing import Tuple, List, Sequence, Union
 from ..canvas_base import BaseCanvas
 
 class GeometryMixin(BaseCanvas):
@@ -50,6 +50,49 @@ class GeometryMixin(BaseCanvas):
             for x in range(x_start, x_end + 1):
                 self.set_pixel((x, y), color)
 
+    def set_pixels(self, xy: Union[str, Sequence[int]], color: str):
+        """Set many pixels of one color. xy is a flat list [x0, y0, x1, y1, ...]
+        or the same numbers as a comma-separated string.
+        Bulk form of set_pixel (color resolved once) used by `encode --compact`.
+        
+        Example:
+            canvas.set_pixels([3, 4, 10, 2, 11, 7], "K1")
+            canvas.set_pixels("3,4,10,2,11,7", "K1")
+        """
+        if isinstance(xy, str):
+            xy = [int(v) for v in xy.split(",")] if xy.strip() else []
+        rgba = self._get_color(color)
+        grid, w, h, lock = self.grid, self.width, self.height, self.alpha_lock
+        for i in range(0, len(xy) - 1, 2):
+            x, y = xy[i], xy[i + 1]
+            if 0 <= x < w and 0 <= y < h and not (lock and grid[x][y][3] == 0):
+                grid[x][y] = rgba
+
+    def draw_rle(self, data: str, origin: Tuple[int, int] = (0, 0)):
+        """Draw run-length encoded rows. One line per pixel row (starting at origin),
+        runs separated by spaces: "<key>*<count>" or "<key>" (count 1).
+        Key "." skips pixels (leaves them untouched).
+        
+        Example:
+            canvas.draw_rle("A*3 .*2 B\n.*2 A*4")
+        """
+        ox, oy = origin
+        grid, w, h, lock = self.grid, self.width, self.height, self.alpha_lock
+        resolved = {}
+        for dy, line in enumerate(data.split("\n")):
+            y, x = oy + dy, ox
+            for run in line.split():
+                key, _, count = run.partition("*")
+                n = int(count) if count else 1
+                if key != "." and 0 <= y < h:
+                    if key not in resolved:
+                        resolved[key] = self._get_color(key)
+                    rgba = resolved[key]
+                    for px in range(max(0, x), min(w, x + n)):
+                        if not (lock and grid[px][y][3] == 0):
+                            grid[px][y] = rgba
+                x += n
+
     def draw_polyline(self, points: List[Tuple[int, int]], color: str, closed: bool = False, thickness: int = 1):
         """Draw connected line segments through a series of points.
         If closed=True, also connects the last point back to the first.
@@ -172,9 +215,20 @@ class GeometryMixin(BaseCanvas):
     def fill_rect(self, top_left: Tuple[int, int], bottom_right: Tuple[int, int], color: str):
         x0, y0 = top_left
         x1, y1 = bottom_right
-        for x in range(min(x0, x1), max(x0, x1) + 1):
-            for y in range(min(y0, y1), max(y0, y1) + 1):
-                self.set_pixel((x, y), color)
+        if self.alpha_lock:
+            for x in range(min(x0, x1), max(x0, x1) + 1):
+                for y in range(min(y0, y1), max(y0, y1) + 1):
+                    self.set_pixel((x, y), color)
+            return
+        # Không khoá alpha: ghi thẳng từng cột (clip vào canvas, màu tra một lần)
+        ya, yb = max(0, min(y0, y1)), min(self.height - 1, max(y0, y1))
+        if ya > yb:
+            return
+        rgba = self._get_color(color)
+        fill = [rgba] * (yb - ya + 1)
+        grid = self.grid
+        for x in range(max(0, min(x0, x1)), min(self.width - 1, max(x0, x1)) + 1):
+            grid[x][ya:yb + 1] = fill
 
     def fill_rounded_rect(self, top_left: Tuple[int, int], bottom_right: Tuple[int, int], radius: int, color: str):
         """Fill a rectangle with rounded corners. Radius controls corner rounding.
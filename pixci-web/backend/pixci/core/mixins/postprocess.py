@@ -95,10 +95,11 @@ class PostprocessMixin(BaseCanvas):
             darkness: How dark the sel_out outline is (0=black, 1=original, default 0.4)
             saturation_boost: Saturation multiplier for sel_out (default 1.2)
         """
-        outline_color = self._get_color(color)
-        new_grid = [[self.grid[x][y] for y in range(self.height)] for x in range(self.width)]
-        
-        # Flood-fill to find exterior (transparent pixels connected to edges)
+        self._outline_rings(self._find_exterior(), color, thickness, sel_out,
+                            hue_shift_amount, darkness, saturation_boost)
+
+    def _find_exterior(self) -> set:
+        """Flood-fill to find exterior (transparent pixels connected to edges)."""
         exterior = set()
         queue = []
         for x in range(self.width):
@@ -121,6 +122,15 @@ class PostprocessMixin(BaseCanvas):
                     if self.grid[nnx][nny][3] == 0 and (nnx, nny) not in exterior:
                         exterior.add((nnx, nny))
                         queue.append((nnx, nny))
+        return exterior
+
+    def _outline_rings(self, exterior: set, color: str, thickness: int, sel_out: bool,
+                       hue_shift_amount: float, darkness: float, saturation_boost: float):
+        """Vẽ `thickness` vòng outline lên các pixel thuộc `exterior`.
+        Mỗi vòng chỉ đọc 4 pixel lân cận nên có thể chạy theo tile (xem tiling.py).
+        """
+        outline_color = self._get_color(color)
+        new_grid = [[self.grid[x][y] for y in range(self.height)] for x in range(self.width)]
         
         # Track all outline pixels for cleanup_jaggies to use
         self._outline_pixels = set()
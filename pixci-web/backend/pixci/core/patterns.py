@@ -0,0 +1,232 @@
+"""
+patterns.py - Nhận diện vùng dither và gradient trên lưới chỉ số màu.
+
+Các vùng tìm được khớp đúng từng pixel với RenderMixin.fill_dither /
+fill_gradient, để encoder thay hàng trăm dot/row bằng một thẻ <dither> hoặc
+<gradient>.
+
+- Dither: mọi pattern của fill_dither đều là "ô có bayer[y%4][x%4] < k tô c1,
+  còn lại tô c2" ('checkered' = k 8, '25_percent' = k 4, 'bayer' ratio = k/16).
+  Toạ độ pattern là toạ độ tuyệt đối nên lưới được chia block thẳng hàng với
+  chu kỳ pattern (2 với k 4/8/12, 4 với các k khác); block khớp cùng (k, c1, c2)
+  được gom thành hình chữ nhật bằng decompose().
+- Gradient: chồng các run cùng độ rộng trên các hàng liên tiếp (vertical) hoặc
+  cột liên tiếp (horizontal), mỗi hàng một màu, được khớp với công thức chia
+  dải idx = int(t * (n - 1)) của fill_gradient.
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .decompose import decompose
+
+BAYER_4X4 = np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+])
+
+# Thứ tự thử: các mức chu kỳ 2 (phổ biến, rẻ) trước
+DITHER_LEVELS = (8, 4, 12) + tuple(k for k in range(1, 16) if k not in (4, 8, 12))
+
+# Gradient cần ít nhất ngần này hàng/cột
+MIN_GRADIENT_LENGTH = 3
+
+# Giới hạn số phần tử palette khi khớp gradient (tránh O(h^2) trên dải dài)
+MAX_GRADIENT_STOPS = 64
+
+
+class DitherRegion(NamedTuple):
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+    level: int   # k: ô có bayer < k dùng c1
+    c1: int      # chỉ số màu, -1 = trong suốt
+    c2: int
+
+
+class GradientRegion(NamedTuple):
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+    mode: str          # 'vertical' hoặc 'horizontal'
+    stops: List[int]   # chỉ số màu theo thứ tự palette của fill_gradient
+
+
+def dither_period(level: int) -> int:
+    return 2 if level in (4, 8, 12) else 4
+
+
+def _dither_level_regions(index: np.ndarray, avail: np.ndarray, level: int,
+                          allow_transparent: bool) -> List[DitherRegion]:
+    p = dither_period(level)
+    gh, gw = index.shape
+    ny, nx = gh // p, gw // p
+    if ny * nx < 2:
+        return []
+    blocks = index[:ny * p, :nx * p].reshape(ny, p, nx, p).swapaxes(1, 2).reshape(ny, nx, p * p)
+    free = avail[:ny * p, :nx * p].reshape(ny, p, nx, p).swapaxes(1, 2).reshape(ny, nx, p * p).all(axis=2)
+    mask = (BAYER_4X4[:p, :p] < level).ravel()
+
+    first, second = blocks[..., mask], blocks[..., ~mask]
+    c1, c2 = first[..., 0], second[..., 0]
+    ok = free & (first == c1[..., None]).all(axis=2) & (second == c2[..., None]).all(axis=2) & (c1 != c2)
+    if not allow_transparent:
+        ok &= (c1 >= 0) & (c2 >= 0)
+    if ok.sum() < 2:
+        return []
+
+    # Mỗi cặp (c1, c2) một mã; decompose gom block cùng mã thành rect/row
+    pair = np.where(ok, (c1 + 1) * (int(index.max()) + 2) + (c2 + 1), -1)
+    codes, inverse = np.unique(pair, return_inverse=True)
+    code_grid = (inverse.reshape(pair.shape) - int(codes[0] == -1)).astype(np.int32)
+
+    dec = decompose(code_grid)
+    regions = []
+    spans = [(x0, y0, x1, y1) for x0, y0, x1, y1, _ in dec.rects]
+    spans += [(xs, y, xe, y) for y, xs, xe, _ in dec.rows]
+    for bx0, by0, bx1, by1 in spans:
+        regions.append(DitherRegion(bx0 * p, by0 * p, (bx1 + 1) * p - 1, (by1 + 1) * p - 1,
+                                    level, int(c1[by0, bx0]), int(c2[by0, bx0])))
+    return regions
+
+
+def _dither_matches(index: np.ndarray, avail: np.ndarray, r: DitherRegion,
+                    x0: int, y0: int, x1: int, y1: int) -> bool:
+    """Dải [x0..x1]×[y0..y1] còn trống và đúng pattern của r (toạ độ tuyệt đối)."""
+    gh, gw = index.shape
+    if x0 < 0 or y0 < 0 or x1 >= gw or y1 >= gh:
+        return False
+    if not avail[y0:y1 + 1, x0:x1 + 1].all():
+        return False
+    ys, xs = np.mgrid[y0:y1 + 1, x0:x1 + 1]
+    expected = np.where(BAYER_4X4[ys % 4, xs % 4] < r.level, r.c1, r.c2)
+    return bool((index[y0:y1 + 1, x0:x1 + 1] == expected).all())
+
+
+def _grow_dither(index: np.ndarray, avail: np.ndarray, r: DitherRegion) -> DitherRegion:
+    """Nới vùng (đang thẳng hàng theo block) từng pixel ra 4 phía khi pattern vẫn khớp."""
+    grown = True
+    while grown:
+        grown = False
+        if _dither_matches(index, avail, r, r.x0 - 1, r.y0, r.x0 - 1, r.y1):
+            r, grown = r._replace(x0=r.x0 - 1), True
+        if _dither_matches(index, avail, r, r.x1 + 1, r.y0, r.x1 + 1, r.y1):
+            r, grown = r._replace(x1=r.x1 + 1), True
+        if _dither_matches(index, avail, r, r.x0, r.y0 - 1, r.x1, r.y0 - 1):
+            r, grown = r._replace(y0=r.y0 - 1), True
+        if _dither_matches(index, avail, r, r.x0, r.y1 + 1, r.x1, r.y1 + 1):
+            r, grown = r._replace(y1=r.y1 + 1), True
+    return r
+
+
+def find_dither_regions(index: np.ndarray, avail: Optional[np.ndarray] = None,
+                        allow_transparent: bool = True) -> List[DitherRegion]:
+    """Tìm các vùng dither ≥ 2 block, không chồng nhau.
+
+    Args:
+        index: lưới chỉ số màu [gh, gw], -1 = trong suốt
+        avail: mask các pixel còn được phép dùng (mặc định: toàn bộ). Được cập nhật tại chỗ.
+        allow_transparent: cho phép c1/c2 trong suốt (chỉ đúng khi vẽ lên canvas rỗng)
+    """
+    if avail is None:
+        avail = np.ones(index.shape, dtype=bool)
+    regions = []
+    for level in DITHER_LEVELS:
+        found = _dither_level_regions(index, avail, level, allow_transparent)
+        for r in found:
+            avail[r.y0:r.y1 + 1, r.x0:r.x1 + 1] = False
+        for r in found:
+            avail[r.y0:r.y1 + 1, r.x0:r.x1 + 1] = True
+            r = _grow_dither(index, avail, r)
+            avail[r.y0:r.y1 + 1, r.x0:r.x1 + 1] = False
+            regions.append(r)
+    return regions
+
+
+def fit_gradient(colors: List[int]) -> Optional[List[int]]:
+    """Tìm palette ngắn nhất để fill_gradient tái tạo đúng dãy màu theo hàng.
+
+    Dùng đúng biểu thức của fill_gradient: t = i / max(1, h); idx = int(t * (n - 1)).
+    """
+    h = max(1, len(colors) - 1)
+    bands = 1 + sum(1 for a, b in zip(colors, colors[1:]) if a != b)
+    for n in range(bands, min(len(colors), MAX_GRADIENT_STOPS) + 1):
+        stops: List[Optional[int]] = [None] * n
+        for i, c in enumerate(colors):
+            idx = max(0, min(n - 1, int(i / h * (n - 1))))
+            if stops[idx] is None:
+                stops[idx] = c
+            elif stops[idx] != c:
+                break
+        else:
+            # Phần tử palette không được hàng nào dùng: lấy màu liền trước
+            for j in range(n):
+                if stops[j] is None:
+                    stops[j] = stops[j - 1] if j else next(s for s in stops if s is not None)
+            return stops
+    return None
+
+
+def _run_stacks(grid: np.ndarray, avail: np.ndarray) -> List[Tuple[int, int, int, List[int]]]:
+    """Chồng các run (cùng x_start, x_end) trên các hàng liên tiếp.
+
+    Returns [(y_start, x_start, x_end, colors theo hàng)].
+    """
+    stacks = []
+    active: Dict[Tuple[int, int], Tuple[int, List[int]]] = {}
+    h, w = grid.shape
+    for y in range(h + 1):
+        current: Dict[Tuple[int, int], int] = {}
+        if y < h:
+            row = np.where(avail[y], grid[y], -1)
+            edges = np.flatnonzero(np.diff(np.concatenate(([-2], row, [-2]))) != 0)
+            for xs, xe in zip(edges[:-1].tolist(), (edges[1:] - 1).tolist()):
+                if row[xs] >= 0:
+                    current[(xs, xe)] = int(row[xs])
+        nxt = {}
+        for ext, c in current.items():
+            if ext in active:
+                ys, cols = active.pop(ext)
+                nxt[ext] = (ys, cols + [c])
+            else:
+                nxt[ext] = (y, [c])
+        for (xs, xe), (ys, cols) in active.items():
+            stacks.append((ys, xs, xe, cols))
+        active = nxt
+    return stacks
+
+
+def find_gradient_regions(index: np.ndarray, avail: Optional[np.ndarray] = None,
+                          min_length: int = MIN_GRADIENT_LENGTH) -> List[GradientRegion]:
+    """Tìm các vùng gradient dọc/ngang (≥ 2 màu), không chồng nhau, lớn trước.
+
+    avail được cập nhật tại chỗ cho các vùng đã nhận.
+    """
+    if avail is None:
+        avail = index >= 0
+    candidates = []
+    for mode, grid, free in (("vertical", index, avail), ("horizontal", index.T, avail.T)):
+        for ys, xs, xe, cols in _run_stacks(grid, free):
+            if len(cols) < min_length or len(set(cols)) < 2:
+                continue
+            stops = fit_gradient(cols)
+            if stops is None:
+                continue
+            y0, y1 = ys, ys + len(cols) - 1
+            if mode == "vertical":
+                candidates.append(GradientRegion(xs, y0, xe, y1, mode, stops))
+            else:
+                candidates.append(GradientRegion(y0, xs, y1, xe, mode, stops))
+
+    candidates.sort(key=lambda r: -(r.x1 - r.x0 + 1) * (r.y1 - r.y0 + 1))
+    regions = []
+    for r in candidates:
+        block = avail[r.y0:r.y1 + 1, r.x0:r.x1 + 1]
+        if block.all():
+            block[...] = False
+            regions.append(r)
+    return regions
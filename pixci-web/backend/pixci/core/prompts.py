@@ -139,6 +139,7 @@ Tuyệt đối KHÔNG trả về code Python. CHỈ trả về một block XML d
 - Đường thẳng: <line x1="0" y1="0" x2="10" y2="10" c="COLOR_KEY" />
 - Hình tròn (Tĩnh): <circle cx="16" cy="16" r="8" c="COLOR_KEY" />
 - Đa giác: <polygon pts="10,10 20,20 10,20" c="COLOR_KEY" />
+- Tile/bộ phận lặp lại: định nghĩa một lần trong <defs><group id="tile">...</group></defs>, rồi gọi trong layer: <use ref="tile" x="8" y="0" />
 
 Hình khối ngữ nghĩa (Semantic Shapes - RẤT QUAN TRỌNG):
 - Vòm/Nửa elip: <dome cx="16" y="28" w="20" h="12" c="COLOR_KEY" />
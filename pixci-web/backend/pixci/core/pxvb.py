@@ -0,0 +1,576 @@
+"""
+pxvb.py - PXVB: dạng nhị phân gọn của PXVG.
+
+PXVB lưu tài liệu ở mức thuộc tính đã chuyển kiểu (giá trị các Field của
+TAG_HANDLERS), nên nạp lại chỉ còn giải mã nhị phân + handler.build(), không
+parse XML hay chuỗi số. File đọc thẳng từ mmap.
+
+Bố cục (mọi số nguyên là varint LEB128, toạ độ/số có dấu là zigzag varint):
+
+    "PXVB" u8:version u8:flags(bit0 = animation)
+    width height
+    strings:  n, (len, utf-8)*              - tên thẻ, id, key palette, chuỗi thuộc tính
+    colors:   n, (RGBA 4 byte)*             - mọi màu xuất hiện trong tài liệu
+    floats:   n, (f64 little-endian)*
+    tags:     n, (string, nfields, type*)*  - schema từng thẻ lúc ghi (kiểm tra khi nạp)
+    palette:  n, (string key, color)*
+    defs:     n, (string id, block)*
+    layers:   n, (string id, block)*
+    [animation: columns, float fps, n, block*]
+    postprocess: n, (string tag, nattr, (string name, string value)*)*
+
+    block = byte_len, varint*: count, (tag, giá trị theo schema của thẻ)*
+
+Trong khối mọi giá trị đều là varint (số thực → chỉ số bảng floats, màu → chỉ
+số bảng colors, chuỗi → chỉ số bảng strings) nên cả khối được giải một lượt;
+khối toàn giá trị < 128 chỉ là list(bytes).
+
+Chuyển đổi hai chiều không mất mát: pxvg → pxvb → pxvg cho ảnh giống hệt từng
+pixel, và pxvb → pxvg → pxvb cho lại đúng các byte ban đầu.
+"""
+import mmap
+import struct
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .pxvg_stream import PxvgSource, read_source
+from .render_plan import (
+    COLOR, COLORS, TAG_HANDLERS, Field, Op, RenderPlan, _check_cycles, _find, _first, _flag, _optional_point,
+    _point, _points, compile_palette, compile_postprocess, compile_pxvg, strip_ns,
+)
+
+PXVB_MAGIC = b"PXVB"
+PXVB_VERSION = 1
+PXVB_SUFFIX = ".pxvb"
+PXVG_NAMESPACE = "http://pixci.dev/pxvg"
+
+_FLAG_ANIMATION = 1
+_F64 = struct.Struct("<d")
+
+# Kiểu giá trị của một Field (theo converter); bit 0x80 = có thể vắng (None)
+T_INT, T_FLOAT, T_FLAG, T_STR, T_POINT, T_OPT_POINT, T_POINTS, T_COLOR, T_COLORS, T_RAW = range(1, 11)
+_NULLABLE = 0x80
+_CONVERTER_TYPES = {
+    int: T_INT, float: T_FLOAT, _flag: T_FLAG, str: T_STR, _point: T_POINT,
+    _optional_point: T_OPT_POINT, _points: T_POINTS, COLOR: T_COLOR, COLORS: T_COLORS,
+}
+
+
+def _field_type(field: Field) -> int:
+    t = _CONVERTER_TYPES.get(field.convert, T_RAW)   # converter của thẻ tự đăng ký → giữ chuỗi thô
+    return t | (_NULLABLE if field.default is None else 0)
+
+
+def _schema(handler) -> Tuple[int, ...]:
+    return tuple(_field_type(f) for f in handler.fields)
+
+
+def is_pxvb(data: Union[bytes, memoryview, mmap.mmap]) -> bool:
+    return bytes(data[:4]) == PXVB_MAGIC
+
+
+# --- Ghi ---
+
+class _Writer:
+    def __init__(self):
+        self.strings: Dict[str, int] = {}
+        self.colors: Dict[tuple, int] = {}
+        self.tags: Dict[str, int] = {}
+        self.floats: Dict[bytes, int] = {}    # theo f64 đã pack (phân biệt 0.0 / -0.0)
+
+    def string(self, value: str) -> int:
+        idx = self.strings.get(value)
+        if idx is None:
+            idx = self.strings[value] = len(self.strings)
+        return idx
+
+    def color(self, rgba: tuple) -> int:
+        idx = self.colors.get(rgba)
+        if idx is None:
+            idx = self.colors[rgba] = len(self.colors)
+        return idx
+
+    def float(self, value: float) -> int:
+        key = _F64.pack(value)
+        idx = self.floats.get(key)
+        if idx is None:
+            idx = self.floats[key] = len(self.floats)
+        return idx
+
+    def tag(self, name: str) -> int:
+        idx = self.tags.get(name)
+        if idx is None:
+            idx = self.tags[name] = len(self.tags)
+        return idx
+
+
+def _uvarint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _svarint(out: bytearray, n: int):
+    _uvarint(out, (n << 1) if n >= 0 else ((-n << 1) - 1))
+
+
+def _write_value(out: bytearray, w: _Writer, t: int, value):
+    if t & _NULLABLE:
+        if value is None:
+            out.append(0)
+            return
+        out.append(1)
+        t &= ~_NULLABLE
+    if t == T_INT:
+        _svarint(out, value)
+    elif t == T_COLOR:
+        _uvarint(out, w.color(value))
+    elif t == T_POINTS:
+        _uvarint(out, len(value))
+        px = py = 0
+        for x, y in value:   # delta theo điểm trước → phần lớn 1 byte
+            _svarint(out, x - px)
+            _svarint(out, y - py)
+            px, py = x, y
+    elif t == T_FLAG:
+        out.append(1 if value else 0)
+    elif t in (T_POINT, T_OPT_POINT):
+        if t == T_OPT_POINT:
+            if value is None:
+                out.append(0)
+                return
+            out.append(1)
+        _uvarint(out, len(value))
+        for v in value:
+            _svarint(out, v)
+    elif t == T_FLOAT:
+        _uvarint(out, w.float(value))
+    elif t == T_COLORS:
+        _uvarint(out, len(value))
+        for rgba in value:
+            _uvarint(out, w.color(rgba))
+    else:   # T_STR, T_RAW
+        _uvarint(out, w.string(value))
+
+
+def _element_values(handler, attr: Dict[str, str], color) -> list:
+    """Giá trị từng Field của thẻ; converter không thuộc _CONVERTER_TYPES giữ chuỗi thô."""
+    values = []
+    for field, get in zip(handler.fields, handler.getters):
+        if _field_type(field) & ~_NULLABLE == T_RAW:
+            values.append(_first(attr, field.names, field.default))
+        else:
+            values.append(get(attr, color))
+    return values
+
+
+def _write_block(out: bytearray, w: _Writer, elements: List[Tuple[str, list]]):
+    body = bytearray()
+    _uvarint(body, len(elements))
+    for tag, values in elements:
+        _uvarint(body, w.tag(tag))
+        for t, value in zip(_schema(TAG_HANDLERS[tag]), values):
+            _write_value(body, w, t, value)
+    _uvarint(out, len(body))
+    out += body
+
+
+def _collect(parent: ET.Element, color, def_ids) -> List[Tuple[str, list]]:
+    """Như compile_elements() nhưng giữ giá trị Field (trước build)."""
+    elements = []
+    for shape in parent:
+        stag = strip_ns(shape.tag).lower()
+        handler = TAG_HANDLERS.get(stag)
+        if handler is None:
+            continue
+        values = _element_values(handler, shape.attrib, color)
+        if handler.build(*[_typed(f, v) for f, v in zip(handler.fields, values)]) is None:
+            continue
+        if stag == 'use' and values[0] not in def_ids:
+            continue
+        elements.append((stag, values))
+    return elements
+
+
+def _typed(field: Field, value):
+    if value is not None and _field_type(field) & ~_NULLABLE == T_RAW:
+        return field.convert(value)
+    return value
+
+
+def _serialize(width: int, height: int, palette: Dict[str, tuple], defs, layers, animation,
+               postprocess: List[Tuple[str, List[Tuple[str, str]]]]) -> bytes:
+    w = _Writer()
+    # Phần thân ghi trước để thu thập bảng string / màu / thẻ
+    body = bytearray()
+    _uvarint(body, len(palette))
+    for key, rgba in palette.items():
+        _uvarint(body, w.string(key))
+        _uvarint(body, w.color(rgba))
+    for blocks in (defs, layers):
+        _uvarint(body, len(blocks))
+        for block_id, elements in blocks:
+            _uvarint(body, w.string(block_id))
+            _write_block(body, w, elements)
+    if animation is not None:
+        columns, fps, frames = animation
+        _uvarint(body, columns)
+        _uvarint(body, w.float(fps))
+        _uvarint(body, len(frames))
+        for elements in frames:
+            _write_block(body, w, elements)
+    _uvarint(body, len(postprocess))
+    for tag, attrs in postprocess:
+        _uvarint(body, w.string(tag))
+        _uvarint(body, len(attrs))
+        for name, value in attrs:
+            _uvarint(body, w.string(name))
+            _uvarint(body, w.string(value))
+
+    out = bytearray(PXVB_MAGIC)
+    out.append(PXVB_VERSION)
+    out.append(_FLAG_ANIMATION if animation is not None else 0)
+    _uvarint(out, width)
+    _uvarint(out, height)
+    tag_names = list(w.tags)
+    for name in tag_names:
+        w.string(name)
+    _uvarint(out, len(w.strings))
+    for s in w.strings:
+        raw = s.encode("utf-8")
+        _uvarint(out, len(raw))
+        out += raw
+    _uvarint(out, len(w.colors))
+    for rgba in w.colors:
+        out += bytes(rgba)
+    _uvarint(out, len(w.floats))
+    for packed in w.floats:
+        out += packed
+    _uvarint(out, len(tag_names))
+    for name in tag_names:
+        schema = _schema(TAG_HANDLERS[name])
+        _uvarint(out, w.strings[name])
+        _uvarint(out, len(schema))
+        out += bytes(schema)
+    out += body
+    return bytes(out)
+
+
+def pxvg_to_pxvb(source: PxvgSource) -> bytes:
+    """Tài liệu PXVG (nội dung XML str/bytes, Path hoặc file-like) → nội dung PXVB."""
+    data = read_source(source)
+    plan = compile_pxvg(data)   # kiểm tra cú pháp, thẻ, tham chiếu vòng như khi decode
+    root = ET.fromstring(data)
+    palette, resolve = compile_palette(_find(root, 'palette'))
+
+    defs_tag = _find(root, 'defs')
+    groups = [g for g in (defs_tag if defs_tag is not None else ())
+              if strip_ns(g.tag).lower() == 'group' and 'id' in g.attrib]
+    group_tags = {g.attrib['id']: g for g in groups}   # id trùng: group sau thắng (như compile_defs)
+    def_ids = set(group_tags)
+    defs = [(gid, _collect(g, resolve, def_ids)) for gid, g in group_tags.items()]
+
+    animation = None
+    layers = []
+    if plan.is_animation:
+        anim_tag = _find(root, 'animation')
+        frames = [_collect(f, resolve, def_ids) for f in anim_tag if strip_ns(f.tag).lower() == 'frame']
+        animation = (plan.columns, plan.fps, frames)
+    else:
+        layers = [(child.attrib.get('id', 'default'), _collect(child, resolve, def_ids))
+                  for child in root if strip_ns(child.tag).lower() == 'layer']
+
+    post_tag = _find(root, 'postprocess')
+    postprocess = [(strip_ns(pp.tag).lower(), list(pp.attrib.items()))
+                   for pp in (post_tag if post_tag is not None else ())]
+    return _serialize(plan.width, plan.height, palette, defs, layers, animation, postprocess)
+
+
+# --- Đọc ---
+
+def _varints(data: bytes) -> List[int]:
+    """Giải cả dãy varint một lượt; dãy toàn số < 128 (hay gặp nhất) chỉ cần list()."""
+    if not data or max(data) < 0x80:
+        return list(data)
+    out = []
+    n = shift = 0
+    for b in data:
+        if b & 0x80:
+            n |= (b & 0x7F) << shift
+            shift += 7
+        else:
+            out.append(n | (b << shift))
+            n = shift = 0
+    return out
+
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+class _Document:
+    """Nội dung PXVB đã giải mã ở mức thẻ (dùng chung cho load_pxvb và pxvb_to_pxvg)."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        if not is_pxvb(buf):
+            raise ValueError("Không phải file PXVB (sai magic)")
+        version = buf[4]
+        if version != PXVB_VERSION:
+            raise ValueError(f"Phiên bản PXVB không hỗ trợ: {version} (hỗ trợ: {PXVB_VERSION})")
+        self.is_animation = bool(buf[5] & _FLAG_ANIMATION)
+        self.pos = 6
+        self.width = self.uvarint()
+        self.height = self.uvarint()
+        self.strings = [self.raw(self.uvarint()).decode("utf-8") for _ in range(self.uvarint())]
+        self.colors = [tuple(self.raw(4)) for _ in range(self.uvarint())]
+        self.floats = [_F64.unpack(self.raw(8))[0] for _ in range(self.uvarint())]
+        self.tags = []
+        for _ in range(self.uvarint()):
+            name = self.strings[self.uvarint()]
+            schema = tuple(self.raw(self.uvarint()))
+            handler = TAG_HANDLERS.get(name)
+            if handler is None or _schema(handler) != schema:
+                raise ValueError(f"Thẻ <{name}> trong file PXVB không khớp schema thẻ hiện tại")
+            has_raw = any(t & ~_NULLABLE == T_RAW for t in schema)
+            self.tags.append((name, handler, tuple(self._reader(t) for t in schema), has_raw))
+
+    def uvarint(self) -> int:
+        buf, pos = self.buf, self.pos
+        b = buf[pos]
+        pos += 1
+        n = b & 0x7F
+        shift = 7
+        while b & 0x80:
+            b = buf[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            shift += 7
+        self.pos = pos
+        return n
+
+    def raw(self, n: int) -> bytes:
+        if self.pos + n > len(self.buf):
+            raise IndexError
+        data = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return data
+
+    def _reader(self, t: int) -> Callable[[Callable[[], int]], object]:
+        """Hàm đọc một giá trị kiểu t từ dãy varint của khối (nxt: lấy varint kế tiếp)."""
+        colors, strings, floats = self.colors, self.strings, self.floats
+        base = t & ~_NULLABLE
+        if base == T_INT:
+            def read(nxt):
+                n = nxt()
+                return (n >> 1) ^ -(n & 1)
+        elif base == T_COLOR:
+            read = lambda nxt: colors[nxt()]
+        elif base == T_POINTS:
+            def read(nxt):
+                pts = []
+                x = y = 0
+                for _ in range(nxt()):
+                    n = nxt()
+                    x += (n >> 1) ^ -(n & 1)
+                    n = nxt()
+                    y += (n >> 1) ^ -(n & 1)
+                    pts.append((x, y))
+                return pts
+        elif base == T_FLAG:
+            read = lambda nxt: nxt() == 1
+        elif base == T_POINT:
+            read = lambda nxt: tuple(_unzigzag(nxt()) for _ in range(nxt()))
+        elif base == T_OPT_POINT:
+            read = lambda nxt: tuple(_unzigzag(nxt()) for _ in range(nxt())) if nxt() else None
+        elif base == T_FLOAT:
+            read = lambda nxt: floats[nxt()]
+        elif base == T_COLORS:
+            read = lambda nxt: tuple(colors[nxt()] for _ in range(nxt()))
+        else:   # T_STR, T_RAW
+            read = lambda nxt: strings[nxt()]
+        if t & _NULLABLE:
+            inner = read
+            read = lambda nxt: inner(nxt) if nxt() else None
+        return read
+
+    def block(self) -> List[Tuple[str, list]]:
+        """Một khối thẻ → [(tên thẻ, giá trị các Field)]."""
+        nxt = iter(_varints(self.raw(self.uvarint()))).__next__
+        tags = self.tags
+        elements = []
+        for _ in range(nxt()):
+            name, _, readers, _ = tags[nxt()]
+            elements.append((name, [read(nxt) for read in readers]))
+        return elements
+
+    def block_ops(self) -> Tuple[Op, ...]:
+        """Một khối thẻ → op-list (như compile_elements)."""
+        nxt = iter(_varints(self.raw(self.uvarint()))).__next__
+        tags = self.tags
+        ops = []
+        for _ in range(nxt()):
+            name, handler, readers, has_raw = tags[nxt()]
+            values = [read(nxt) for read in readers]
+            if has_raw:
+                values = [_typed(f, v) for f, v in zip(handler.fields, values)]
+            args = handler.build(*values)
+            if args is not None:
+                ops.append(Op(name, args))
+        return tuple(ops)
+
+    def read_all(self, block: Callable[[], object]):
+        """Đọc phần thân; block: self.block (giá trị Field) hoặc self.block_ops (op-list)."""
+        uv = self.uvarint
+        self.palette = [(self.strings[uv()], self.colors[uv()]) for _ in range(uv())]
+        self.defs = [(self.strings[uv()], block()) for _ in range(uv())]
+        self.layers = [(self.strings[uv()], block()) for _ in range(uv())]
+        self.animation = None
+        if self.is_animation:
+            columns = uv()
+            fps = self.floats[uv()]
+            self.animation = (columns, fps, [block() for _ in range(uv())])
+        self.postprocess = []
+        for _ in range(uv()):
+            tag = self.strings[uv()]
+            attrs = [(self.strings[uv()], self.strings[uv()]) for _ in range(uv())]
+            self.postprocess.append((tag, attrs))
+        return self
+
+
+def _postprocess_tag(postprocess) -> Optional[ET.Element]:
+    if not postprocess:
+        return None
+    post_tag = ET.Element('postprocess')
+    for tag, attrs in postprocess:
+        ET.SubElement(post_tag, tag, dict(attrs))
+    return post_tag
+
+
+def _open(source: PxvgSource):
+    """→ (buffer, hàm đóng). Path được mmap (chỉ đọc), còn lại đọc vào bộ nhớ.
+
+    str / bytes luôn là nội dung (str không phải PXVB → lỗi sai magic), không phải đường dẫn.
+    """
+    if isinstance(source, Path):
+        f = open(source, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:   # file rỗng
+            f.close()
+            raise ValueError("Không phải file PXVB (file rỗng)")
+
+        def close():
+            mm.close()
+            f.close()
+        return mm, close
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+    elif hasattr(source, 'read'):
+        source = source.read()
+    return source, lambda: None
+
+
+def _read_document(source: PxvgSource, ops: bool = False) -> _Document:
+    """ops=True: các khối được giải thẳng thành op-list, ngược lại là giá trị Field."""
+    buf, close = _open(source)
+    try:
+        doc = _Document(buf)
+        return doc.read_all(doc.block_ops if ops else doc.block)
+    except (IndexError, StopIteration):
+        raise ValueError("File PXVB bị cắt cụt")
+    finally:
+        close()
+
+
+def load_pxvb(source: PxvgSource) -> RenderPlan:
+    """PXVB (Path - đọc qua mmap, bytes hoặc file-like) → RenderPlan, không parse XML."""
+    doc = _read_document(source, ops=True)
+    defs = dict(doc.defs)
+    _check_cycles(defs)
+    frames, columns, fps = None, 1, 0.0
+    if doc.animation is not None:
+        columns, fps, frames = doc.animation
+        frames = tuple(frames)
+    return RenderPlan(doc.width, doc.height, tuple(doc.palette), tuple(doc.layers), tuple(defs.items()),
+                      frames, columns, fps, compile_postprocess(_postprocess_tag(doc.postprocess)))
+
+
+# --- PXVB → PXVG ---
+
+def _hex(rgba: tuple) -> str:
+    return "#{:02X}{:02X}{:02X}{:02X}".format(*rgba)
+
+
+def _format_value(t: int, value, color_name: Callable[[tuple], str]) -> str:
+    t &= ~_NULLABLE
+    if t == T_COLOR:
+        return color_name(value)
+    if t == T_COLORS:
+        return ",".join(color_name(c) for c in value)
+    if t == T_FLAG:
+        return "true" if value else "false"
+    if t in (T_POINT, T_OPT_POINT):
+        return ",".join(map(str, value))
+    if t == T_POINTS:
+        return " ".join(f"{x},{y}" for x, y in value)
+    if t == T_FLOAT:
+        return repr(value)
+    return str(value)
+
+
+def _xml_elements(parent: ET.Element, elements, color_name: Callable[[tuple], str]):
+    for name, values in elements:
+        handler = TAG_HANDLERS[name]
+        attrs = {}
+        for field, t, value in zip(handler.fields, _schema(handler), values):
+            if value is not None:
+                attrs[field.names[0]] = _format_value(t, value, color_name)
+        ET.SubElement(parent, name, attrs)
+
+
+def pxvb_to_pxvg(source: PxvgSource) -> str:
+    """PXVB → tài liệu PXVG (XML). Màu trùng palette được ghi bằng key, còn lại #RRGGBBAA."""
+    doc = _read_document(source)
+    keys: Dict[tuple, str] = {}
+    for key, rgba in doc.palette:
+        # key "CLEAR" / chứa dấu phẩy không giải ngược được thành đúng màu này
+        if rgba not in keys and key.upper() != "CLEAR" and ',' not in key:
+            keys[rgba] = key
+
+    def color_name(rgba: tuple) -> str:
+        return keys.get(rgba) or _hex(rgba)
+
+    root = ET.Element('pxvg', {'w': str(doc.width), 'h': str(doc.height), 'xmlns': PXVG_NAMESPACE})
+    palette = ET.SubElement(root, 'palette')
+    for key, rgba in doc.palette:
+        ET.SubElement(palette, 'color', {'k': key, 'hex': _hex(rgba)})
+    if doc.defs:
+        defs = ET.SubElement(root, 'defs')
+        for gid, elements in doc.defs:
+            _xml_elements(ET.SubElement(defs, 'group', {'id': gid}), elements, color_name)
+    if doc.animation is not None:
+        columns, fps, frames = doc.animation
+        anim = ET.SubElement(root, 'animation', {'fps': repr(fps), 'columns': str(columns)})
+        for elements in frames:
+            _xml_elements(ET.SubElement(anim, 'frame'), elements, color_name)
+    for layer_id, elements in doc.layers:
+        _xml_elements(ET.SubElement(root, 'layer', {'id': layer_id}), elements, color_name)
+    post_tag = _postprocess_tag(doc.postprocess)
+    if post_tag is not None:
+        root.append(post_tag)
+    ET.indent(root)
+    return '<?xml version="1.0" encoding="utf-8"?>\n' + ET.tostring(root, encoding="unicode") + "\n"
+
+
+def convert_pxvg_file(input_path: Path, output_path: Path) -> Tuple[int, int]:
+    """Chuyển .pxvg/.xml ↔ .pxvb theo nội dung file nguồn. Returns (số byte vào, số byte ra)."""
+    input_path, output_path = Path(input_path), Path(output_path)
+    data = input_path.read_bytes()
+    if is_pxvb(data):
+        output_path.write_text(pxvb_to_pxvg(data), encoding="utf-8")
+    else:
+        output_path.write_bytes(pxvg_to_pxvb(data))
+    return len(data), output_path.stat().st_size
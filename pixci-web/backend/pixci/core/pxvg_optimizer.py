@@ -0,0 +1,539 @@
+"""
+pxvg_optimizer.py - Chọn tập thẻ PXVG rẻ nhất theo cost model.
+
+Mỗi phần tử được giữ dưới dạng chuỗi XML đã serialize nên chi phí (bytes hoặc
+token LLM ước lượng) là chính xác. Optimizer dựng nhiều phương án vẽ (plan),
+trong mỗi plan chọn biểu diễn rẻ nhất cho từng vùng (rect/row/column/line/dots),
+rồi lấy plan rẻ nhất và kiểm chứng bằng cách decode trong bộ nhớ.
+
+Các loại plan:
+  - direct:        phân rã trực tiếp
+  - background:K   vẽ silhouette bằng màu K rồi vẽ đè các màu khác
+  - mirror-x/y/xy: chỉ vẽ nửa (hoặc 1/4) ảnh, <mirror-x>/<mirror-y>, rồi vá
+                   các pixel bất đối xứng
+  - tiles:N        tile NxN lặp lại (kể cả lật ngang) → <defs><group> + <use>
+  - patterns       vùng dither / gradient (xem patterns.py) → <dither> / <gradient>
+"""
+import re
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .canvas import Canvas
+from .canvas_base import hex2rgba
+from .decompose import Decomposition, decompose
+from .patterns import DitherRegion, GradientRegion, find_dither_regions, find_gradient_regions
+
+COST_METRICS = ("bytes", "tokens")
+
+# Số màu phổ biến nhất được thử làm "nền" (vẽ cả silhouette rồi vẽ đè màu khác)
+BACKGROUND_CANDIDATES = 3
+
+# Tổng số pixel được phân rã lại cho các ứng viên nền: lưới lớn thử ít màu hơn
+# (mỗi ứng viên phân rã lại silhouette cả lưới), tối thiểu một màu
+BACKGROUND_PIXEL_BUDGET = 3 * 256 * 256
+
+# Số vùng dither/gradient tối đa được so với vẽ trực tiếp (vùng lớn nhất trước);
+# atlas có hàng nghìn vùng gradient vài pixel không bao giờ rẻ hơn vẽ thẳng
+MAX_PATTERN_REGIONS = 256
+
+# Chỉ thử plan đối xứng khi tỉ lệ pixel cần vá (trên phần được mirror) không quá ngưỡng
+MAX_ASYMMETRY = 0.5
+
+# Màu dùng để xoá pixel khi vá (Canvas._get_color hiểu "CLEAR" = trong suốt)
+ERASE_KEY = "CLEAR"
+
+# Kích thước tile thử khi tìm tile lặp lại (tileset, texture atlas)
+TILE_SIZES = (8, 16)
+
+# Chỉ tìm tile khi tỉ lệ tile (không rỗng) có bản lặp đạt ngưỡng này
+MIN_TILE_REPEAT = 0.25
+
+# Số nhóm tile lặp tối đa được xét (nhóm nhiều vị trí nhất trước)
+MAX_TILE_GROUPS = 1024
+
+# Lưới con (residual của pattern/tile, nửa mirror, vá) có nhiều pixel được vẽ hơn
+# ngưỡng chỉ dùng plan direct: thử background trên mỗi lưới con phân rã lại gần
+# cả lưới nhiều lần, trên atlas lớn chậm hơn hàng chục lần mà lợi rất ít
+MAX_SUBPLAN_PIXELS = 256 * 128
+
+Defs = List[Tuple[str, List[str]]]  # [(group id, elements)]
+
+_INDENT = "    "
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token LLM: từ = 1, số tách nhóm 3 chữ số, dấu câu = 1."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def element_cost(text: str, metric: str = "bytes") -> int:
+    if metric == "tokens":
+        return estimate_tokens(text)
+    return len(text.encode("utf-8"))
+
+
+def plan_cost(elements: List[str], metric: str = "bytes") -> int:
+    """Chi phí của cả layer đúng như smart_encoder ghi ra (kèm thụt lề, xuống dòng)."""
+    return element_cost("".join(f"{_INDENT}{e}\n" for e in elements), metric)
+
+
+def defs_lines(defs: Defs) -> List[str]:
+    """Các dòng của khối <defs> (đã thụt lề, chưa có xuống dòng)."""
+    if not defs:
+        return []
+    lines = ['  <defs>']
+    for gid, elements in defs:
+        lines.append(f'    <group id="{gid}">')
+        lines.extend(f"      {e}" for e in elements)
+        lines.append('    </group>')
+    lines.append('  </defs>')
+    return lines
+
+
+def document_cost(elements: List[str], defs: Defs, metric: str = "bytes") -> int:
+    return plan_cost(elements, metric) + element_cost("".join(f"{l}\n" for l in defs_lines(defs)), metric)
+
+
+def document_text(gw: int, gh: int, colors: List[str], keys: List[str],
+                  elements: List[str], defs: Defs) -> str:
+    """Toàn bộ tài liệu PXVG một layer (header, palette, defs, layer "main")."""
+    lines = ['<?xml version="1.0" encoding="utf-8"?>',
+             f'<pxvg w="{gw}" h="{gh}" xmlns="http://pixci.dev/pxvg">',
+             '  <palette>']
+    lines += [f'    <color k="{k}" hex="{c}" />' for k, c in sorted(zip(keys, colors))]
+    lines.append('  </palette>')
+    lines += defs_lines(defs)
+    lines.append('  <layer id="main">')
+    lines += [f"{_INDENT}{e}" for e in elements]
+    lines.append('  </layer>')
+    lines.append('</pxvg>')
+    return "\n".join(lines) + "\n"
+
+
+# --- Serialize từng thẻ (cùng định dạng với smart_encoder) ---
+
+def rect_xml(x0: int, y0: int, x1: int, y1: int, c: str) -> str:
+    return f'<rect x="{x0}" y="{y0}" w="{x1 - x0 + 1}" h="{y1 - y0 + 1}" c="{c}" />'
+
+
+def row_xml(y: int, x1: int, x2: int, c: str) -> str:
+    return f'<row y="{y}" x1="{x1}" x2="{x2}" c="{c}" />'
+
+
+def column_xml(x: int, y1: int, y2: int, c: str) -> str:
+    return f'<column x="{x}" y1="{y1}" y2="{y2}" c="{c}" />'
+
+
+def line_xml(x1: int, y1: int, x2: int, y2: int, c: str) -> str:
+    return f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" c="{c}" />'
+
+
+def bucket_xml(x: int, y: int, c: str) -> str:
+    return f'<bucket x="{x}" y="{y}" c="{c}" />'
+
+
+def use_xml(ref: str, x: int, y: int, flip_x: bool = False) -> str:
+    flip = ' flip-x="true"' if flip_x else ''
+    return f'<use ref="{ref}" x="{x}" y="{y}"{flip} />'
+
+
+def dither_xml(r: DitherRegion, keys: List[str]) -> str:
+    """<dither> tái tạo đúng vùng; màu trong suốt thì bỏ thuộc tính (mặc định #00000000)."""
+    attrs = f'x="{r.x0}" y="{r.y0}" w="{r.x1 - r.x0 + 1}" h="{r.y1 - r.y0 + 1}"'
+    if r.c1 >= 0:
+        attrs += f' c="{keys[r.c1]}"'
+    if r.c2 >= 0:
+        attrs += f' c2="{keys[r.c2]}"'
+    if r.level == 4:
+        attrs += ' pattern="25_percent"'
+    elif r.level != 8:
+        attrs += f' pattern="bayer" ratio="{r.level / 16:g}"'
+    return f'<dither {attrs} />'
+
+
+def gradient_xml(r: GradientRegion, keys: List[str]) -> str:
+    mode = ' mode="horizontal"' if r.mode == "horizontal" else ''
+    palette = ",".join(keys[c] for c in r.stops)
+    return (f'<gradient x="{r.x0}" y="{r.y0}" w="{r.x1 - r.x0 + 1}" h="{r.y1 - r.y0 + 1}"'
+            f'{mode} palette="{palette}" />')
+
+
+def dots_xml(c: str, points: List[Tuple[int, int]]) -> str:
+    pts_str = " ".join(f"{x},{y}" for x, y in points)
+    return f'<dots c="{c}" pts="{pts_str}" />'
+
+
+def _points_cost(points: List[Tuple[int, int]], metric: str) -> int:
+    """Chi phí biên của các điểm khi nằm trong pts của một thẻ <dots>."""
+    return element_cost("".join(f"{x},{y} " for x, y in points), metric)
+
+
+def _extract_runs(pts: set, step: Tuple[int, int], min_len: int,
+                  order: Optional[List[Tuple[int, int]]] = None) -> List[List[Tuple[int, int]]]:
+    """Tìm các chuỗi điểm liên tiếp theo hướng `step` (dài ≥ min_len).
+
+    order: các điểm đã sắp theo (y, x), có thể chứa điểm không còn trong pts
+    (tránh sắp lại mỗi lần gọi).
+    """
+    dx, dy = step
+    runs = []
+    for x, y in (order if order is not None else sorted(pts, key=lambda p: (p[1], p[0]))):
+        if (x, y) not in pts or (x - dx, y - dy) in pts:
+            continue
+        run = [(x, y)]
+        while (run[-1][0] + dx, run[-1][1] + dy) in pts:
+            run.append((run[-1][0] + dx, run[-1][1] + dy))
+        if len(run) >= min_len:
+            runs.append(run)
+    return runs
+
+
+def _loose_elements(loose: Dict[int, List[Tuple[int, int]]], keys: List[str], metric: str) -> List[str]:
+    """Điểm lẻ: gom thành column / line chéo nếu rẻ hơn, phần còn lại thành <dots>."""
+    elements = []
+    for c in sorted(loose, key=lambda k: keys[k]):
+        key = keys[c]
+        pts = set(loose[c])
+        order = sorted(pts, key=lambda p: (p[1], p[0]))
+        for run in _extract_runs(pts, (0, 1), 2, order):
+            (x, y1), (_, y2) = run[0], run[-1]
+            xml = column_xml(x, y1, y2, key)
+            if element_cost(xml, metric) < _points_cost(run, metric):
+                elements.append(xml)
+                pts.difference_update(run)
+        # Bresenham vẽ đường chéo 45° chính xác từng pixel
+        for step in ((1, 1), (-1, 1)):
+            for run in _extract_runs(pts, step, 3, order):
+                (x1, y1), (x2, y2) = run[0], run[-1]
+                xml = line_xml(x1, y1, x2, y2, key)
+                if element_cost(xml, metric) < _points_cost(run, metric):
+                    elements.append(xml)
+                    pts.difference_update(run)
+        if pts:
+            elements.append(dots_xml(key, [p for p in order if p in pts]))
+    return elements
+
+
+def _plan_from_decomposition(dec: Decomposition, keys: List[str], metric: str) -> List[str]:
+    """Chọn biểu diễn rẻ nhất cho từng rect/row của một phép phân rã."""
+    elements = []
+    loose: Dict[int, List[Tuple[int, int]]] = {}
+
+    for x0, y0, x1, y1, c in dec.rects:
+        key = keys[c]
+        pts = [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+        if x0 == x1:
+            split = [column_xml(x0, y0, y1, key)]
+        else:
+            split = [row_xml(y, x0, x1, key) for y in range(y0, y1 + 1)]
+        options = [
+            (element_cost(rect_xml(x0, y0, x1, y1, key), metric), [rect_xml(x0, y0, x1, y1, key)]),
+            (sum(element_cost(e, metric) for e in split), split),
+            (_points_cost(pts, metric), None),
+        ]
+        cost, chosen = min(options, key=lambda o: o[0])
+        if chosen is None:
+            loose.setdefault(c, []).extend(pts)
+        else:
+            elements.extend(chosen)
+
+    for y, xs, xe, c in dec.rows:
+        xml = row_xml(y, xs, xe, keys[c])
+        pts = [(x, y) for x in range(xs, xe + 1)]
+        if element_cost(xml, metric) <= _points_cost(pts, metric):
+            elements.append(xml)
+        else:
+            loose.setdefault(c, []).extend(pts)
+
+    for y, x, c in dec.dots:
+        loose.setdefault(c, []).append((x, y))
+
+    return elements + _loose_elements(loose, keys, metric)
+
+
+def _background_plan(index: np.ndarray, k: int, keys: List[str], metric: str,
+                     rect_mode: str, direct: List[str], empty_canvas: bool = True) -> List[str]:
+    """Vẽ toàn bộ silhouette bằng màu k trước, sau đó vẽ đè các màu còn lại.
+
+    direct: plan direct của cùng lưới - các màu còn lại lấy thẳng từ đó (mỗi thẻ
+    một màu, phủ đúng pixel màu đó) thay vì phân rã lại.
+    """
+    opaque = index >= 0
+    if opaque.all() and empty_canvas:
+        # Canvas rỗng: bucket tại (0, 0) lấp kín toàn bộ
+        base = [bucket_xml(0, 0, keys[k])]
+    else:
+        silhouette = np.where(opaque, k, -1).astype(np.int32)
+        base = _plan_from_decomposition(decompose(silhouette, rect_mode), keys, metric)
+    color = f' c="{keys[k]}" '
+    return base + [e for e in direct if color not in e]
+
+
+def _pattern_plan(index: np.ndarray, keys: List[str], metric: str, rect_mode: str,
+                  empty_canvas: bool = True) -> Optional[List[str]]:
+    """Vùng dither/gradient thành một thẻ, phần còn lại vẽ bình thường.
+
+    Thẻ pattern tô kín vùng của nó nên được đặt sau cùng (đè lên overdraw của
+    plan background). Vùng chỉ được nhận khi thẻ rẻ hơn vẽ vùng đó trực tiếp.
+    Trên canvas không rỗng, dither có màu trong suốt sẽ xoá pixel bên dưới nên
+    chỉ cho phép khi empty_canvas. Chỉ MAX_PATTERN_REGIONS vùng lớn nhất được xét.
+    """
+    avail = np.ones(index.shape, dtype=bool)
+    regions = [(r, dither_xml(r, keys)) for r in find_dither_regions(index, avail, empty_canvas)]
+    avail &= index >= 0
+    regions += [(r, gradient_xml(r, keys)) for r in find_gradient_regions(index, avail)]
+    if len(regions) > MAX_PATTERN_REGIONS:
+        area = [(r.x1 - r.x0 + 1) * (r.y1 - r.y0 + 1) for r, _ in regions]
+        keep = sorted(sorted(range(len(regions)), key=lambda i: -area[i])[:MAX_PATTERN_REGIONS])
+        regions = [regions[i] for i in keep]
+
+    residual = index.copy()
+    tags = []
+    for r, xml in regions:
+        region = index[r.y0:r.y1 + 1, r.x0:r.x1 + 1]
+        inline = _plan_from_decomposition(decompose(region, rect_mode), keys, metric)
+        if element_cost(xml, metric) < plan_cost(inline, metric):
+            tags.append(xml)
+            residual[r.y0:r.y1 + 1, r.x0:r.x1 + 1] = -1
+    if not tags:
+        return None
+    _, rest = _sub_plan(residual, keys, metric, rect_mode, empty_canvas)
+    return rest + tags
+
+
+def _layer_plans(index: np.ndarray, keys: List[str], metric: str, rect_mode: str,
+                 empty_canvas: bool = True,
+                 decomposition: Optional[Decomposition] = None,
+                 patterns: bool = False) -> List[Tuple[str, List[str]]]:
+    """Plan direct + background (+ patterns) cho một lưới (-1 = không vẽ).
+
+    patterns=True chỉ dùng cho lưới cấp cao nhất (optimize_elements, frame của
+    animation); các lưới con (nửa mirror, vá, tile, residual) không dò lại pattern.
+    """
+    dec = decomposition if decomposition is not None else decompose(index, rect_mode)
+    plans = [("direct", _plan_from_decomposition(dec, keys, metric))]
+
+    drawn = index[index >= 0]
+    if drawn.size == 0:
+        return plans
+    if patterns:
+        pattern_plan = _pattern_plan(index, keys, metric, rect_mode, empty_canvas)
+        if pattern_plan is not None:
+            plans.append(("patterns", pattern_plan))
+    counts = np.bincount(drawn)
+    candidates = min(BACKGROUND_CANDIDATES, max(1, BACKGROUND_PIXEL_BUDGET // drawn.size))
+    for k in np.argsort(-counts, kind="stable")[:candidates]:
+        if counts[k] == 0:
+            continue
+        plans.append((f"background:{keys[k]}",
+                      _background_plan(index, int(k), keys, metric, rect_mode, plans[0][1], empty_canvas)))
+    return plans
+
+
+def _cheapest(plans: List[Tuple[str, List[str]]], metric: str) -> Tuple[str, List[str]]:
+    return min(plans, key=lambda p: plan_cost(p[1], metric))
+
+
+def _sub_plan(index: np.ndarray, keys: List[str], metric: str, rect_mode: str,
+              empty_canvas: bool = True) -> Tuple[str, List[str]]:
+    """Plan rẻ nhất cho một lưới con; lưới con lớn (> MAX_SUBPLAN_PIXELS) chỉ dùng direct."""
+    if int((index >= 0).sum()) > MAX_SUBPLAN_PIXELS:
+        return "direct", _plan_from_decomposition(decompose(index, rect_mode), keys, metric)
+    return _cheapest(_layer_plans(index, keys, metric, rect_mode, empty_canvas), metric)
+
+
+def _mirror_source(shape: Tuple[int, int], axis: str) -> np.ndarray:
+    """Mask phần được vẽ trước khi mirror (nửa trái / nửa trên / góc trái trên)."""
+    gh, gw = shape
+    mask = np.ones(shape, dtype=bool)
+    if "x" in axis:
+        mask[:, (gw + 1) // 2:] = False
+    if "y" in axis:
+        mask[(gh + 1) // 2:, :] = False
+    return mask
+
+
+def _simulate_mirror(half: np.ndarray, axis: str) -> np.ndarray:
+    """Mô phỏng TransformMixin.mirror_x / mirror_y trên lưới chỉ số màu.
+
+    Phần đích đang trống nên phép copy có điều kiện của mirror_x tương đương copy thẳng.
+    """
+    out = half.copy()
+    gh, gw = out.shape
+    if "x" in axis:
+        out[:, gw - gw // 2:] = out[:, :gw // 2][:, ::-1]
+    if "y" in axis:
+        out[gh - gh // 2:, :] = out[:gh // 2, :][::-1]
+    return out
+
+
+def _symmetry_plans(index: np.ndarray, keys: List[str], metric: str,
+                    rect_mode: str) -> List[Tuple[str, List[str]]]:
+    """Chỉ vẽ phần nguồn, mirror, rồi vá các pixel bất đối xứng (kể cả xoá)."""
+    plans = []
+    erase = len(keys)
+    patch_keys = keys + [ERASE_KEY]
+    for axis in ("x", "y", "xy"):
+        source = _mirror_source(index.shape, axis)
+        half = np.where(source, index, -1).astype(np.int32)
+        mirrored = _simulate_mirror(half, axis)
+        diff = mirrored != index
+        covered = int((~source & ((index >= 0) | (mirrored >= 0))).sum())
+        if covered == 0 or diff.sum() > MAX_ASYMMETRY * covered:
+            continue
+
+        base_name, base = _sub_plan(half, keys, metric, rect_mode)
+        tags = ["<mirror-x />"] if "x" in axis else []
+        if "y" in axis:
+            tags.append("<mirror-y />")
+        patches: List[str] = []
+        if diff.any():
+            patch = np.where(diff, np.where(index >= 0, index, erase), -1).astype(np.int32)
+            _, patches = _sub_plan(patch, patch_keys, metric, rect_mode, empty_canvas=False)
+        plans.append((f"mirror-{axis}+{base_name}", base + tags + patches))
+    return plans
+
+
+def _tile_plan(index: np.ndarray, keys: List[str], metric: str, rect_mode: str,
+               t: int, tile_cache: Optional[Dict[bytes, List[str]]] = None) -> Optional[Tuple[List[str], Defs]]:
+    """Tìm tile t×t lặp lại (so khớp cả bản lật ngang) bằng hash bytes của tile.
+
+    Mỗi tile lặp được vẽ một lần trong <defs>, các vị trí dùng <use>; phần còn
+    lại vẽ trực tiếp. <use flip-x> lật theo cả chiều rộng canvas nên offset x
+    của bản lật là vị trí đích trừ đi (gw - t).
+    Group của tile chỉ dùng phân rã trực tiếp (nhớ trong tile_cache theo bytes
+    của tile), tối đa MAX_TILE_GROUPS nhóm; tile ít lặp (< MIN_TILE_REPEAT) → None.
+    """
+    gh, gw = index.shape
+    ny, nx = gh // t, gw // t
+    if ny * nx < 2:
+        return None
+    tiles = index[:ny * t, :nx * t].reshape(ny, t, nx, t).swapaxes(1, 2)
+
+    groups: Dict[bytes, List[Tuple[int, int, bool]]] = {}
+    for ty in range(ny):
+        for tx in range(nx):
+            tile = tiles[ty, tx]
+            if (tile < 0).all():
+                continue
+            raw = tile.tobytes()
+            flipped = np.ascontiguousarray(tile[:, ::-1]).tobytes()
+            if raw in groups:
+                groups[raw].append((tx, ty, False))
+            elif flipped in groups:
+                groups[flipped].append((tx, ty, True))
+            else:
+                groups[raw] = [(tx, ty, False)]
+
+    repeated = [(raw, places) for raw, places in groups.items() if len(places) >= 2]
+    total = sum(len(places) for places in groups.values())
+    if not repeated or sum(len(places) for _, places in repeated) < MIN_TILE_REPEAT * total:
+        return None
+    repeated.sort(key=lambda item: -len(item[1]))
+
+    if tile_cache is None:
+        tile_cache = {}
+    residual = index.copy()
+    defs: Defs = []
+    uses: List[str] = []
+    for raw, places in repeated[:MAX_TILE_GROUPS]:
+        group = tile_cache.get(raw)
+        if group is None:
+            tx0, ty0, _ = places[0]
+            # Phân rã trực tiếp (không bucket: group vẽ trên canvas nháp, bucket sẽ tràn)
+            group = tile_cache[raw] = _plan_from_decomposition(
+                decompose(tiles[ty0, tx0].astype(np.int32), rect_mode), keys, metric)
+        gid = f"t{len(defs)}"
+        refs = [use_xml(gid, tx * t - (gw - t) if flip else tx * t, ty * t, flip)
+                for tx, ty, flip in places]
+        inline = plan_cost(group, metric) * len(places)
+        if document_cost(refs, [(gid, group)], metric) >= inline:
+            continue
+        defs.append((gid, group))
+        uses.extend(refs)
+        for tx, ty, _ in places:
+            residual[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t] = -1
+
+    if not defs:
+        return None
+    _, rest = _sub_plan(residual, keys, metric, rect_mode)
+    return uses + rest, defs
+
+
+def render_elements(elements: List[str], gw: int, gh: int, palette: Dict[str, str],
+                    defs: Optional[Defs] = None) -> Canvas:
+    """Decode danh sách thẻ trong bộ nhớ (không ghi file)."""
+    from .render_plan import compile_elements, execute_ops
+
+    canvas = Canvas(gw, gh)
+    canvas.add_palette(palette)
+    def_ids = {gid for gid, _ in (defs or [])}
+    definitions = {
+        gid: compile_elements(ET.fromstring("<group>" + "".join(group) + "</group>"), canvas._get_color, def_ids)
+        for gid, group in (defs or [])
+    }
+    layer = ET.fromstring("<layer>" + "".join(elements) + "</layer>")
+    execute_ops(canvas, compile_elements(layer, canvas._get_color, def_ids), definitions)
+    return canvas
+
+
+def canvas_to_array(canvas: Canvas) -> np.ndarray:
+    """Flatten canvas → mảng uint8 [h, w, 4]."""
+    return np.array(canvas.flatten(), dtype=np.uint8).reshape(canvas.width, canvas.height, 4).transpose(1, 0, 2)
+
+
+def expected_array(index: np.ndarray, colors: List[str]) -> np.ndarray:
+    """Lưới chỉ số màu → mảng RGBA [h, w, 4] (index -1 → trong suốt)."""
+    table = np.array([hex2rgba(c) for c in colors] + [(0, 0, 0, 0)], dtype=np.uint8)
+    return table[index]
+
+
+def verify_elements(elements: List[str], index: np.ndarray, colors: List[str], keys: List[str],
+                    defs: Optional[Defs] = None) -> bool:
+    """Decode thử danh sách thẻ và so khớp từng pixel với lưới gốc."""
+    gh, gw = index.shape
+    canvas = render_elements(elements, gw, gh, dict(zip(keys, colors)), defs)
+    return bool(np.array_equal(canvas_to_array(canvas), expected_array(index, colors)))
+
+
+def optimize_elements(index: np.ndarray, colors: List[str], keys: List[str],
+                      metric: str = "bytes", rect_mode: str = "fast",
+                      verify: bool = True,
+                      decomposition: Optional[Decomposition] = None) -> Tuple[List[str], Defs, dict]:
+    """Chọn tập thẻ rẻ nhất phủ đúng lưới.
+
+    Lưới con lớn hơn MAX_SUBPLAN_PIXELS chỉ dùng plan direct (xem _sub_plan).
+    verify=True render kiểm tra plan được chọn (lùi về direct nếu sai).
+
+    Returns (elements, defs, stats): elements của layer, các group cho <defs>
+    (rỗng nếu không dùng tile lặp) và stats gồm plan được chọn, bytes, tokens ước lượng.
+    """
+    if metric not in COST_METRICS:
+        raise ValueError(f"Cost metric không hợp lệ: '{metric}'. Hỗ trợ: {', '.join(COST_METRICS)}")
+
+    dec = decomposition if decomposition is not None else decompose(index, rect_mode)
+    direct = ("direct", _plan_from_decomposition(dec, keys, metric), [])
+    plans = [direct] + [(name, elements, []) for name, elements in
+                        _layer_plans(index, keys, metric, rect_mode, decomposition=dec, patterns=True)[1:]
+                        + _symmetry_plans(index, keys, metric, rect_mode)]
+    tile_cache: Dict[bytes, List[str]] = {}
+    for t in TILE_SIZES:
+        tiled = _tile_plan(index, keys, metric, rect_mode, t, tile_cache)
+        if tiled is not None:
+            plans.append((f"tiles:{t}", tiled[0], tiled[1]))
+
+    # Chỉ render kiểm tra plan rẻ nhất; sai thì lùi về direct
+    best = min(plans, key=lambda p: document_cost(p[1], p[2], metric))
+    for name, elements, defs in ([best] if best is direct else [best, direct]):
+        if not verify or verify_elements(elements, index, colors, keys, defs):
+            return elements, defs, {
+                "plan": name,
+                "elements": len(elements) + sum(len(group) for _, group in defs),
+                "defs": len(defs),
+                "bytes": document_cost(elements, defs, "bytes"),
+                "tokens": document_cost(elements, defs, "tokens"),
+            }
+    raise AssertionError("BUG: không có plan PXVG nào decode ra đúng ảnh gốc")
@@ -0,0 +1,222 @@
+"""
+pxvg_stream.py - Decode PXVG theo luồng cho tài liệu rất lớn.
+
+decode_pxvg() dựng cả cây XML rồi biên dịch thành RenderPlan; với tài liệu
+sinh tự động hàng trăm nghìn <row>/<dots> thì cây XML + op-list chiếm phần lớn
+bộ nhớ. Ở đây tài liệu được đọc bằng ET.iterparse: mỗi thẻ vẽ trong <layer> /
+<frame> được biên dịch và vẽ ngay khi thẻ đóng, rồi bị xoá khỏi cây, nên bộ nhớ
+đỉnh chỉ còn canvas (+ palette, defs, postprocess) bất kể tài liệu dài bao nhiêu.
+
+Ràng buộc thứ tự (tài liệu do encoder sinh ra luôn thoả): <palette> phải đứng
+trước mọi thẻ vẽ và <defs>, <defs> phải đứng trước thẻ vẽ đầu tiên. Vi phạm →
+ValueError (dùng decode_pxvg() cho tài liệu như vậy).
+Kết quả giống hệt decode_pxvg() từng byte.
+"""
+import io
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import IO, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .canvas import Canvas
+from .render_plan import (
+    TAG_HANDLERS, Op, PostprocessPipeline, RenderContext, apply_postprocess, compile_defs,
+    compile_element, compile_palette, compile_postprocess, document_size, strip_ns,
+)
+
+PxvgSource = Union[str, bytes, Path, IO]
+
+# Các thẻ được giữ nguyên cây con tới khi đóng (biên dịch một lần cả khối)
+_BLOCK_TAGS = ('palette', 'defs', 'postprocess')
+
+
+class StreamResult(NamedTuple):
+    width: int
+    height: int
+    canvas: Optional[Canvas]          # ảnh tĩnh (None nếu là animation)
+    frames: Optional[List[Canvas]]    # animation: các frame đã postprocess + merge_all
+    columns: int
+    fps: float
+    elements: int                     # số thẻ vẽ đã thực thi
+
+    @property
+    def is_animation(self) -> bool:
+        return self.frames is not None
+
+
+def _open_source(source: PxvgSource) -> Tuple[IO, bool]:
+    """→ (file-like, có cần đóng không).
+
+    str / bytes luôn là nội dung tài liệu (không bao giờ được hiểu là đường dẫn:
+    nội dung từ request không thể khiến server đọc file); đường dẫn phải là Path;
+    đối tượng có .read() → dùng trực tiếp.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source), False
+    if isinstance(source, str):
+        # BOM đầu chuỗi (file đọc bằng encoding="utf-8") không phải là XML
+        return io.StringIO(source.lstrip('\ufeff')), False
+    if isinstance(source, Path):
+        return open(source, 'rb'), True
+    if hasattr(source, 'read'):
+        return source, False
+    raise TypeError(f"Nguồn PXVG không hợp lệ: {type(source).__name__} (cần str/bytes nội dung, Path hoặc file-like)")
+
+
+def read_source(source: PxvgSource) -> Union[str, bytes]:
+    """Toàn bộ nội dung tài liệu (cùng quy ước nguồn với _open_source)."""
+    f, owned = _open_source(source)
+    try:
+        return f.read()
+    finally:
+        if owned:
+            f.close()
+
+
+def stream_render(source: PxvgSource, workers: int = 1) -> StreamResult:
+    """Đọc + vẽ tài liệu PXVG theo luồng.
+
+    Args:
+        source: nội dung XML (str/bytes), đường dẫn (Path) hoặc file-like
+        workers: số worker cho postprocess theo tile (xem tiling.py)
+    """
+    f, owned = _open_source(source)
+    try:
+        return _render_events(ET.iterparse(f, events=('start', 'end')), workers)
+    except ET.ParseError as e:
+        raise ValueError(f"Lỗi cú pháp XML trong file PXVG: {e}")
+    finally:
+        if owned:
+            f.close()
+
+
+def _render_events(events, workers: int) -> StreamResult:
+    stack: List[Tuple[str, ET.Element]] = []   # (tên chuẩn hoá, thẻ) từ gốc tới thẻ hiện tại
+    tag_names: Dict[str, str] = {}
+    blocks: Dict[str, ET.Element] = {}         # thẻ palette/defs/postprocess đầu tiên
+    block_depth: Optional[int] = None          # độ sâu của khối đang được giữ lại
+    width = height = 0
+    canvas: Optional[Canvas] = None
+    palette: Optional[dict] = None
+    resolve = None
+    defs: Dict[str, Tuple[Op, ...]] = {}
+    ctx = RenderContext(defs, {})
+    post_ops: Tuple[Op, ...] = ()
+    anim: Optional[ET.Element] = None
+    frames: Optional[List[Canvas]] = None
+    columns, fps = 1, 0.0
+    target: Optional[Canvas] = None            # canvas nhận thẻ vẽ (layer hoặc frame hiện tại)
+    target_elem: Optional[ET.Element] = None
+    drawn = 0
+    handlers = TAG_HANDLERS
+
+    def ensure_palette():
+        # Lần đầu cần giải màu mà chưa gặp <palette> → palette rỗng (như compile_pxvg)
+        nonlocal palette, resolve
+        if resolve is None:
+            palette, resolve = compile_palette(None)
+            canvas.palette = dict(palette)
+
+    for event, elem in events:
+        name = tag_names.get(elem.tag)
+        if name is None:
+            name = tag_names[elem.tag] = strip_ns(elem.tag).lower()
+
+        if event == 'start':
+            depth = len(stack)
+            stack.append((name, elem))
+            if depth == 0:
+                width, height = document_size(elem)
+                canvas = Canvas(width, height)
+            elif block_depth is not None:
+                continue
+            elif name in _BLOCK_TAGS and name not in blocks:
+                blocks[name] = elem
+                block_depth = depth
+            elif name == 'layer' and depth == 1:
+                ensure_palette()
+                layer_id = elem.attrib.get('id', 'default')
+                canvas.add_layer(layer_id)
+                canvas.set_layer(layer_id)
+                target, target_elem = canvas, elem
+            elif name == 'animation' and anim is None:
+                anim, frames = elem, []
+            elif name == 'frame' and anim is not None and stack[-2][1] is anim:
+                ensure_palette()
+                target, target_elem = Canvas(width, height), elem
+                target.palette = dict(palette)
+                frames.append(target)
+            continue
+
+        # event == 'end'
+        stack.pop()
+        depth = len(stack)
+        if depth == 0:
+            break
+        parent = stack[-1][1]
+        if block_depth is not None:
+            if depth > block_depth:
+                continue   # thẻ con của khối: giữ tới khi khối đóng
+            block_depth = None
+            if name == 'palette':
+                if resolve is not None:
+                    raise ValueError("Decode theo luồng: <palette> phải đứng trước các thẻ vẽ và <defs>")
+                palette, resolve = compile_palette(elem)
+                canvas.palette = dict(palette)
+            elif name == 'defs':
+                if drawn:
+                    raise ValueError("Decode theo luồng: <defs> phải đứng trước các thẻ vẽ")
+                ensure_palette()
+                defs.update(compile_defs(elem, resolve))
+            else:
+                post_ops = compile_postprocess(elem)
+        elif parent is target_elem:
+            handler = handlers.get(name)
+            if handler is not None:
+                try:
+                    op = compile_element(name, elem.attrib, resolve)
+                except ValueError as e:
+                    raise ValueError(f"Thẻ <{name}> không hợp lệ: {e}")
+                if op is not None and (name != 'use' or op.args[0] in defs):
+                    handler.run(target, op.args, ctx)
+                    drawn += 1
+        elif elem is target_elem:
+            target = target_elem = None
+        elif elem is anim:
+            columns = int(elem.attrib.get('columns', len(frames)))
+            fps = float(elem.attrib.get('fps', 10))
+        # Thẻ vừa đóng luôn là con cuối của cha → xoá để cây không lớn dần
+        elem.clear()
+        del parent[-1]
+
+    ensure_palette()
+    if frames is None:
+        if post_ops:
+            canvas.merge_all()
+            apply_postprocess(canvas, post_ops, workers)
+        return StreamResult(width, height, canvas, None, 1, 0.0, drawn)
+
+    if not frames:
+        raise ValueError("Không tìm thấy thẻ <frame> nào trong <animation>")
+    pipeline = PostprocessPipeline(post_ops, workers)
+    for fc in frames:
+        fc.merge_all()
+        if post_ops:
+            pipeline.apply(fc)
+    return StreamResult(width, height, None, frames, columns, fps, drawn)
+
+
+def decode_pxvg_stream(source: PxvgSource, output_path: Path, scale: int = 1,
+                       workers: int = 1) -> Tuple[int, int]:
+    """Như decode_pxvg() nhưng đọc theo luồng (bộ nhớ đỉnh không phụ thuộc độ dài tài liệu).
+
+    source: nội dung XML (str/bytes), đường dẫn (Path) hoặc file-like.
+    """
+    from .frame_pool import frame_image
+    from .pxvg_engine import save_frames
+
+    result = stream_render(source, workers)
+    if not result.is_animation:
+        result.canvas.save(str(output_path), scale=scale)
+        return (result.width, result.height)
+    return save_frames([frame_image(fc) for fc in result.frames], result.width, result.height,
+                       result.columns, result.fps, Path(output_path), scale)
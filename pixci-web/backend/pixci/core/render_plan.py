@@ -0,0 +1,939 @@
+"""
+render_plan.py - Biên dịch tài liệu PXVG thành render plan (parse một lần, render nhiều lần).
+
+compile_pxvg() đọc XML đúng một lần và sinh IR bất biến:
+  - palette đã giải thành RGBA, màu của mọi thẻ vẽ đã tra sẵn (RGBA)
+  - mỗi thẻ vẽ → Op(tag, args) với toạ độ int, cờ bool đã chuyển kiểu; cách đọc
+    và vẽ từng thẻ nằm trong registry TAG_HANDLERS (register_tag() cho thẻ mới)
+  - defs biên dịch thành op-list riêng; <use> tới group không tồn tại bị bỏ,
+    tham chiếu vòng giữa các group bị báo lỗi ngay khi biên dịch
+  - layer / frame / postprocess đã tách sẵn
+compile_cached() nhớ plan theo sha256 nội dung (LRU) nên editor decode lại cùng
+tài liệu với scale khác không phải parse lại. execute_ops() chạy op-list trên
+bất kỳ canvas nào có API vẽ của Canvas (fill_rect, draw_rows, set_pixels, ...).
+"""
+import hashlib
+import itertools
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .canvas import Canvas
+from .tiling import apply_tiled
+
+RGBA = Tuple[int, int, int, int]
+
+DEFAULT_PLAN_CACHE_ENTRIES = 128
+DEFAULT_POSTPROCESS_CACHE_ENTRIES = 64
+
+
+class Op(NamedTuple):
+    tag: str       # tên thẻ đã chuẩn hoá (bỏ namespace, chữ thường)
+    args: tuple    # tham số đã chuyển kiểu, màu là RGBA
+
+
+class RenderPlan(NamedTuple):
+    width: int
+    height: int
+    palette: Tuple[Tuple[str, RGBA], ...]
+    layers: Tuple[Tuple[str, Tuple[Op, ...]], ...]     # ảnh tĩnh: (layer id, ops)
+    defs: Tuple[Tuple[str, Tuple[Op, ...]], ...]       # (group id, ops)
+    frames: Optional[Tuple[Tuple[Op, ...], ...]]       # None = ảnh tĩnh
+    columns: int                                        # số cột spritesheet
+    fps: float
+    postprocess: Tuple[Op, ...]
+
+    @property
+    def is_animation(self) -> bool:
+        return self.frames is not None
+
+
+def strip_ns(tag: str) -> str:
+    if '}' in tag:
+        return tag.split('}', 1)[1]
+    return tag
+
+
+def _find(root: ET.Element, name: str) -> Optional[ET.Element]:
+    """Thẻ con đầu tiên tên `name` (kể cả khi tài liệu có namespace)."""
+    tag = root.find(f'.//{name}')
+    if tag is None:
+        for child in root:
+            if strip_ns(child.tag).lower() == name:
+                return child
+    return tag
+
+
+def _point(value: str) -> Tuple[int, int]:
+    return tuple(map(int, value.split(',')))
+
+
+def _points(value: str) -> List[Tuple[int, int]]:
+    pts = []
+    for pt in value.split():
+        if ',' in pt:
+            px, py = pt.split(',')
+            pts.append((int(px), int(py)))
+    return pts
+
+
+def _optional_point(value: str) -> Optional[Tuple[int, int]]:
+    return _point(value) if value else None
+
+
+def _flag(value, default: str = 'true') -> bool:
+    return str(value if value is not None else default).lower() == 'true'
+
+
+# --- Registry thẻ vẽ ---
+#
+# Mỗi thẻ = TagHandler: schema thuộc tính (tên + alias, converter, mặc định),
+# build (giá trị đã chuyển kiểu → args của Op) và run (thực thi Op trên canvas).
+# Schema được chuẩn hoá một lần khi đăng ký; compile chỉ còn tra dict theo tên thẻ.
+
+# Converter đặc biệt, giải theo palette của từng tài liệu
+COLOR = "color"      # một màu → RGBA
+COLORS = "colors"    # danh sách màu cách nhau bởi dấu phẩy → tuple RGBA
+
+
+class Field(NamedTuple):
+    names: Tuple[str, ...]                 # tên thuộc tính theo thứ tự ưu tiên (alias)
+    convert: Union[Callable[[str], Any], str]
+    default: Optional[str] = None          # giá trị thô khi thiếu; None → giá trị None
+
+
+class RenderContext(NamedTuple):
+    defs: Dict[str, Tuple[Op, ...]]
+    sprites: Dict[tuple, "Sprite"]         # cache sprite của <use> (xem _group_sprite)
+
+
+class TagHandler(NamedTuple):
+    fields: Tuple[Field, ...]
+    build: Callable[..., Optional[tuple]]  # None → bỏ thẻ
+    run: Callable[[Any, tuple, RenderContext], None]
+    getters: tuple                         # fields đã biên dịch (xem _compile_field)
+    coords: Optional[str] = None           # vai trò toạ độ của từng arg (xem _shift_args); None = vẽ phụ
+                                           # thuộc cả canvas → group chứa thẻ raster hoá trên canvas đầy đủ
+
+
+TAG_HANDLERS: Dict[str, TagHandler] = {}
+
+
+def _field(spec) -> Field:
+    if isinstance(spec, Field):
+        return spec
+    names, convert, *default = spec
+    return Field((names,) if isinstance(names, str) else tuple(names), convert, *default)
+
+
+def _args(*values) -> tuple:
+    return values
+
+
+def _add_handler(name: str, fields, run, build=None, coords=None) -> TagHandler:
+    fields = tuple(_field(f) for f in fields)
+    handler = TagHandler(fields, build or _args, run, tuple(_compile_field(f) for f in fields), coords)
+    TAG_HANDLERS[name.lower()] = handler
+    return handler
+
+
+def register_tag(name: str, fields, run: Callable[[Any, tuple, RenderContext], None],
+                 build: Optional[Callable[..., Optional[tuple]]] = None, coords: Optional[str] = None) -> TagHandler:
+    """Đăng ký (hoặc thay) một thẻ vẽ.
+
+    Args:
+        name: tên thẻ (không phân biệt hoa thường)
+        fields: schema thuộc tính, mỗi mục là Field hoặc (tên | (tên, alias...), converter, mặc định)
+                với converter là hàm str → giá trị, COLOR hoặc COLORS
+        run: run(canvas, args, ctx) vẽ Op lên canvas
+        build: build(*giá trị theo fields) → args của Op (mặc định: giữ nguyên), None = bỏ thẻ
+        coords: mỗi ký tự ứng với một arg của Op - 'x' / 'y' toạ độ, 'q' dãy điểm (x, y),
+                'f' dãy phẳng x, y, ..., 'r' bán kính / 't' độ dày (nới bounding box), '.' khác.
+                Chỉ khai báo khi thẻ chỉ vẽ trong bounding box đó và dịch toạ độ thì hình
+                dịch theo; khi đó group chứa thẻ được raster hoá trên canvas nháp cỡ
+                bounding box (xem _raster_group)
+
+    Example - thẻ <cross x y r c> (dấu + bán kính r):
+        def run_cross(canvas, args, ctx):
+            x, y, r, c = args
+            canvas.draw_rows([(y, x - r, x + r, c)])
+            for dy in range(-r, r + 1):
+                canvas.set_pixel((x, y + dy), c)
+
+        register_tag("cross", [("x", int, "0"), ("y", int, "0"), ("r", int, "1"),
+                               (("c", "color"), COLOR, "#00000000")], run_cross, coords="xyr.")
+
+    Plan trong cache mặc định bị xoá để tài liệu đã biên dịch trước đó nhận thẻ mới.
+    """
+    handler = _add_handler(name, fields, run, build, coords)
+    if _default_plan_cache is not None:
+        _default_plan_cache.clear()
+    return handler
+
+
+def _first(attr: Dict[str, str], names: Tuple[str, ...], default: Optional[str]) -> Optional[str]:
+    for name in names:
+        value = attr.get(name)
+        if value is not None:
+            return value
+    return default
+
+
+def _color_list(raw: str, color: Callable[[str], RGBA]) -> Tuple[RGBA, ...]:
+    return tuple(color(p) for p in (raw.split(',') if ',' in raw else [raw]))
+
+
+def _compile_field(field: Field) -> Callable[[Dict[str, str], Callable[[str], RGBA]], Any]:
+    """Field → getter(attr, color) đọc + chuyển kiểu một thuộc tính.
+
+    Trường hợp hay gặp (1-2 tên, có mặc định, màu hoặc converter thường) được gộp
+    thành một lambda duy nhất để compile mỗi thẻ chỉ tốn vài lần tra dict.
+    """
+    names, convert, default = field
+    if default is not None and len(names) <= 2 and convert is not COLORS:
+        n0, n1 = names[0], names[-1]
+        if convert is COLOR:
+            if len(names) == 1:
+                return lambda attr, color: color(attr.get(n0, default))
+            return lambda attr, color: color(attr.get(n0, attr.get(n1, default)))
+        if len(names) == 1:
+            return lambda attr, color: convert(attr.get(n0, default))
+        return lambda attr, color: convert(attr.get(n0, attr.get(n1, default)))
+
+    if convert is COLOR:
+        to_value = lambda raw, color: color(raw)
+    elif convert is COLORS:
+        to_value = _color_list
+    else:
+        to_value = lambda raw, color: convert(raw)
+
+    def get(attr, color):
+        raw = _first(attr, names, default)
+        return None if raw is None else to_value(raw, color)
+    return get
+
+
+def compile_element(stag: str, attr: Dict[str, str], color: Callable[[str], RGBA]) -> Optional[Op]:
+    """Một thẻ vẽ → Op; thẻ chưa đăng ký trả về None.
+
+    color: hàm giải chuỗi màu (key palette, #hex, CLEAR) → RGBA.
+    """
+    handler = TAG_HANDLERS.get(stag)
+    if handler is None:
+        return None
+    args = handler.build(*[get(attr, color) for get in handler.getters])
+    return None if args is None else Op(stag, args)
+
+
+# --- Thẻ dựng sẵn ---
+
+_C = (("c", "color"), COLOR, "#00000000")
+_X = ("x", int, "0")
+_Y = ("y", int, "0")
+_W = ("w", int, "1")
+_H = ("h", int, "1")
+_T = (("thickness", "t"), int, "1")
+
+
+def _box(x: int, y: int, w: int, h: int, *rest) -> tuple:
+    """(x, y, w, h, ...) → (x0, y0, x1, y1, ...)"""
+    return (x, y, x + w - 1, y + h - 1) + rest
+
+
+def _ellipse(cx: int, cy: int, center: Optional[Tuple[int, int]], rx: int, ry: int, fill: bool, c: RGBA) -> tuple:
+    if center:
+        cx, cy = center
+    return (cx, cy, rx, ry, fill, c)
+
+
+def _run_column(canvas, a, ctx):
+    x, y1, y2, c = a
+    for y in range(y1, y2 + 1):
+        canvas.set_pixel((x, y), c)
+
+
+def _run_ellipse(canvas, a, ctx):
+    cx, cy, rx, ry, fill, c = a
+    if fill:
+        canvas.fill_ellipse((cx, cy), rx, ry, c)
+    else:
+        canvas.draw_ellipse((cx, cy), rx, ry, c, pixel_perfect=True)
+
+
+def _set_alpha_lock(canvas, a, ctx):
+    canvas.alpha_lock = a[0]
+
+
+_add_handler('rect', (_X, _Y, (("w", "width"), int, "1"), (("h", "height"), int, "1"), _C),
+             lambda canvas, a, ctx: canvas.fill_rect((a[0], a[1]), (a[2], a[3]), a[4]), _box, "xyxy.")
+_add_handler('row', (_Y, (("x1", "start-x"), int, "0"), (("x2", "end-x"), int, "0"), _C),
+             lambda canvas, a, ctx: canvas.draw_rows([a]), coords="yxx.")
+_add_handler('column', (_X, (("y1", "start-y"), int, "0"), (("y2", "end-y"), int, "0"), _C), _run_column,
+             coords="xyy.")
+_add_handler('circle', (("cx", int, "0"), ("cy", int, "0"), ("center", _optional_point), (("r", "radius"), int, "1"),
+                        ("fill", _flag, "true"), _C),
+             _run_ellipse, lambda cx, cy, center, r, fill, c: _ellipse(cx, cy, center, r, r, fill, c), "xyrr..")
+_add_handler('ellipse', (("cx", int, "0"), ("cy", int, "0"), ("center", _optional_point), ("rx", int, "1"), ("ry", int, "1"),
+                         ("fill", _flag, "true"), _C),
+             _run_ellipse, _ellipse, "xyrr..")
+_add_handler('rounded-rect', (_X, _Y, _W, _H, ("r", int, "0"), _C),
+             lambda canvas, a, ctx: canvas.fill_rounded_rect((a[0], a[1]), (a[2], a[3]), a[4], a[5]), _box, "xyxy..")
+_add_handler('curve', (("start", _point, "0,0"), ("ctrl", _point, "0,0"), ("end", _point, "0,0"), _T, _C),
+             lambda canvas, a, ctx: canvas.draw_curve(a[0], a[1], a[2], a[4], thickness=a[3]))
+_add_handler('cubic-curve', (("p0", _point, "0,0"), ("p1", _point, "0,0"), ("p2", _point, "0,0"),
+                             ("p3", _point, "0,0"), _T, _C),
+             lambda canvas, a, ctx: canvas.draw_cubic_curve(a[0], a[1], a[2], a[3], a[5], thickness=a[4]))
+_add_handler('bucket', (_X, _Y, _C), lambda canvas, a, ctx: canvas.fill_bucket((a[0], a[1]), a[2]))
+_add_handler('dither', (_X, _Y, _W, _H, _C, ("c2", COLOR, "#00000000"), ("pattern", str, "checkered"),
+                        ("ratio", float, "0.5")),
+             lambda canvas, a, ctx: canvas.fill_dither(a[0:4], a[4], a[5], a[6], a[7]), _box, "xyxy....")
+_add_handler('alpha-lock', (("v", _flag, "true"),), _set_alpha_lock, coords=".")
+_add_handler('translate', (("dx", int, "0"), ("dy", int, "0")),
+             lambda canvas, a, ctx: canvas.translate(a[0], a[1]))
+_add_handler('flip-x', (), lambda canvas, a, ctx: canvas.flip_x())
+_add_handler('flip-y', (), lambda canvas, a, ctx: canvas.flip_y())
+_add_handler('mirror-x', (), lambda canvas, a, ctx: canvas.mirror_x())
+_add_handler('mirror-y', (), lambda canvas, a, ctx: canvas.mirror_y())
+_add_handler('polygon', ((("pts", "points"), _points, ""), _C),
+             lambda canvas, a, ctx: canvas.fill_polygon(list(a[0]), a[1]),
+             lambda pts, c: (tuple(pts), c) if pts else None, "q.")
+_add_handler('dot', (_X, _Y, _C), lambda canvas, a, ctx: canvas.set_pixel((a[0], a[1]), a[2]), coords="xy.")
+_add_handler('dots', ((("pts", "points"), _points, ""), _C),
+             lambda canvas, a, ctx: canvas.set_pixels(a[0], a[1]),
+             lambda pts, c: (tuple(v for pt in pts for v in pt), c) if pts else None, "f.")
+_add_handler('line', (("x1", int, "0"), ("y1", int, "0"), ("x2", int, "0"), ("y2", int, "0"), _T, _C),
+             lambda canvas, a, ctx: canvas.draw_line((a[0], a[1]), (a[2], a[3]), a[5], thickness=a[4]),
+             coords="xyxyt.")
+_add_handler('gradient', (_X, _Y, _W, _H, (("palette", "c", "color"), COLORS, "#00000000"),
+                          ("mode", str, "vertical")),
+             lambda canvas, a, ctx: canvas.fill_gradient(a[0:4], list(a[4]), mode=a[5]), _box, "xyxy..")
+_add_handler('noise', (_X, _Y, _W, _H, (("palette", "c", "color"), COLORS, "#00000000"), ("density", float, "0.5")),
+             lambda canvas, a, ctx: canvas.fill_noise(a[0:4], list(a[4]), density=a[5]), _box, "xyxy..")
+_USE_HANDLER = _add_handler('use', (("ref", str), _X, _Y, ("flip-x", _flag, "false")),
+                            lambda canvas, a, ctx: _render_use(canvas, a, ctx))
+
+
+def compile_elements(parent: ET.Element, color: Callable[[str], RGBA],
+                     def_ids: Optional[set] = None) -> Tuple[Op, ...]:
+    """Các thẻ con của layer / group / frame → op-list.
+
+    def_ids: id các group trong defs; <use> tới group khác bị bỏ (không có
+    defs → mọi <use> bị bỏ).
+    """
+    ops = []
+    handlers = TAG_HANDLERS
+    tag_names: Dict[str, str] = {}  # tag thô (có thể kèm namespace) → tên chuẩn hoá
+    for shape in parent:
+        stag = tag_names.get(shape.tag)
+        if stag is None:
+            stag = tag_names[shape.tag] = strip_ns(shape.tag).lower()
+        handler = handlers.get(stag)
+        if handler is None:
+            continue
+        attr = shape.attrib
+        try:
+            args = handler.build(*[get(attr, color) for get in handler.getters])
+        except ValueError as e:
+            raise ValueError(f"Thẻ <{stag}> không hợp lệ: {e}")
+        if args is None or (stag == 'use' and args[0] not in (def_ids or ())):
+            continue
+        ops.append(Op(stag, args))
+    return tuple(ops)
+
+
+def compile_postprocess(post_tag: Optional[ET.Element]) -> Tuple[Op, ...]:
+    if post_tag is None:
+        return ()
+    ops = []
+    for pp in post_tag:
+        ptag = strip_ns(pp.tag).lower()
+        attr = pp.attrib
+        if ptag == 'outline':
+            sel_out = _flag(attr.get('sel-out', attr.get('sel_out')), 'false')
+            ops.append(Op(ptag, (attr.get('color', '#000000FF'), int(attr.get('thickness', 1)), sel_out)))
+        elif ptag in ('shadow', 'directional-shadow'):
+            d = attr.get('dir', attr.get('light-dir', 'top_left'))
+            ops.append(Op('directional-shadow', (d, float(attr.get('intensity', 0.3)))))
+        elif ptag in ('jaggies', 'jaggies-cleanup'):
+            ops.append(Op('jaggies', ()))
+        elif ptag == 'internal-aa':
+            ops.append(Op(ptag, ()))
+        elif ptag == 'shadow-mask':
+            d = attr.get('dir', attr.get('light-dir', 'top_left'))
+            ops.append(Op(ptag, (int(attr.get('cx', 0)), int(attr.get('cy', 0)), int(attr.get('r', 1)),
+                                 d, float(attr.get('intensity', 0.5)))))
+        elif ptag == 'highlight-edge':
+            d = attr.get('dir', attr.get('light-dir', 'top_left'))
+            ops.append(Op(ptag, (d, float(attr.get('intensity', 0.2)))))
+    return tuple(ops)
+
+
+def _use_postorder(defs: Dict[str, Tuple[Op, ...]], roots, done=()) -> List[str]:
+    """Các group đạt tới từ roots qua <use>, group con đứng trước group dùng nó.
+
+    DFS lặp với stack tường minh (chuỗi <use> sâu hàng nghìn tầng không chạm giới
+    hạn đệ quy); group trong done coi như đã xong, không duyệt lại. Vòng → ValueError.
+    """
+    state: Dict[str, int] = dict.fromkeys(done, 2)  # 1 = đang duyệt, 2 = xong
+    order: List[str] = []
+    for root in roots:
+        if root in state:
+            continue
+        state[root] = 1
+        path = [root]
+        stack = [iter(defs[root])]
+        while stack:
+            for op in stack[-1]:
+                if op.tag != 'use':
+                    continue
+                gid = op.args[0]
+                if state.get(gid) == 1:
+                    raise ValueError(f"Vòng tham chiếu trong defs: {' → '.join(path + [gid])}")
+                if gid not in state:
+                    state[gid] = 1
+                    path.append(gid)
+                    stack.append(iter(defs[gid]))
+                    break
+            else:
+                gid = path.pop()
+                state[gid] = 2
+                order.append(gid)
+                stack.pop()
+    return order
+
+
+def _check_cycles(defs: Dict[str, Tuple[Op, ...]]) -> None:
+    """Group dùng lại chính nó (trực tiếp hoặc gián tiếp) → ValueError."""
+    _use_postorder(defs, defs)
+
+
+def compile_palette(pal_tag: Optional[ET.Element]) -> Tuple[Dict[str, RGBA], Callable[[str], RGBA]]:
+    """<palette> (kể cả palette dựng sẵn qua load=...) → (palette RGBA, hàm giải màu có nhớ)."""
+    resolver = Canvas(1, 1)
+    if pal_tag is not None:
+        if 'load' in pal_tag.attrib:
+            resolver.load_palette(pal_tag.attrib['load'])
+        for color in pal_tag.findall('*'):
+            if strip_ns(color.tag).lower() == 'color':
+                k = color.attrib.get('k', color.attrib.get('key'))
+                hx = color.attrib.get('hex')
+                if k and hx:
+                    resolver.add_color(k, hx)
+    resolved: Dict[str, RGBA] = {}
+
+    def resolve(value: str) -> RGBA:
+        rgba = resolved.get(value)
+        if rgba is None:
+            rgba = resolved[value] = resolver._get_color(value)
+        return rgba
+    return resolver.palette, resolve
+
+
+def compile_defs(defs_tag: Optional[ET.Element], color: Callable[[str], RGBA]) -> Dict[str, Tuple[Op, ...]]:
+    """<defs> → {group id: ops}; tham chiếu vòng → ValueError."""
+    group_tags = {}
+    if defs_tag is not None:
+        for group in defs_tag.findall('*'):
+            if strip_ns(group.tag).lower() == 'group' and 'id' in group.attrib:
+                group_tags[group.attrib['id']] = group
+    def_ids = set(group_tags)
+    defs = {gid: compile_elements(group, color, def_ids) for gid, group in group_tags.items()}
+    _check_cycles(defs)
+    return defs
+
+
+def document_size(root: ET.Element) -> Tuple[int, int]:
+    return (int(root.attrib.get('w', root.attrib.get('width', '32'))),
+            int(root.attrib.get('h', root.attrib.get('height', '32'))))
+
+
+def compile_pxvg(source: Union[str, bytes]) -> RenderPlan:
+    """Parse + kiểm tra tài liệu PXVG (nội dung XML) → RenderPlan."""
+    try:
+        root = ET.fromstring(source)
+    except ET.ParseError as e:
+        raise ValueError(f"Lỗi cú pháp XML trong file PXVG: {e}")
+
+    width, height = document_size(root)
+    palette, resolve = compile_palette(_find(root, 'palette'))
+    defs = compile_defs(_find(root, 'defs'), resolve)
+    def_ids = set(defs)
+
+    anim_tag = _find(root, 'animation')
+    if anim_tag is None:
+        layers = tuple(
+            (child.attrib.get('id', 'default'), compile_elements(child, resolve, def_ids))
+            for child in root if strip_ns(child.tag).lower() == 'layer'
+        )
+        frames, columns, fps = None, 1, 0.0
+    else:
+        frame_tags = [f for f in anim_tag if strip_ns(f.tag).lower() == 'frame']
+        if not frame_tags:
+            raise ValueError("Không tìm thấy thẻ <frame> nào trong <animation>")
+        layers = ()
+        frames = tuple(compile_elements(f, resolve, def_ids) for f in frame_tags)
+        columns = int(anim_tag.attrib.get('columns', len(frame_tags)))
+        fps = float(anim_tag.attrib.get('fps', 10))
+
+    return RenderPlan(width, height, tuple(palette.items()), layers, tuple(defs.items()),
+                      frames, columns, fps, compile_postprocess(_find(root, 'postprocess')))
+
+
+# --- Thực thi ---
+
+class Sprite(NamedTuple):
+    """Group đã raster hoá, cắt theo bounding box phần không trong suốt.
+
+    columns: ((x, ((y, pixels), ...)), ...) - mỗi cột là các đoạn pixel đục liên
+    tiếp, toạ độ theo canvas gốc (chưa cộng offset của <use>).
+    """
+    left: int
+    top: int
+    right: int      # không tính
+    bottom: int     # không tính
+    columns: Tuple[Tuple[int, Tuple[Tuple[int, list], ...]], ...]
+
+
+_EMPTY_SPRITE = Sprite(0, 0, 0, 0, ())
+
+
+def _trim_sprite(grid: List[list], origin_x: int = 0, origin_y: int = 0) -> Sprite:
+    """Grid (canvas nháp đặt tại origin trên canvas gốc) → Sprite theo toạ độ canvas gốc."""
+    columns = []
+    top, bottom = None, 0
+    for x, col in enumerate(grid):
+        runs = []
+        start = None
+        for y, pixel in enumerate(col):
+            if pixel[3] != 0:
+                if start is None:
+                    start = y
+            elif start is not None:
+                runs.append((start, col[start:y]))
+                start = None
+        if start is not None:
+            runs.append((start, col[start:]))
+        if runs:
+            if origin_y:
+                runs = [(y + origin_y, pixels) for y, pixels in runs]
+            columns.append((x + origin_x, tuple(runs)))
+            first, last = runs[0][0], runs[-1][0] + len(runs[-1][1])
+            top = first if top is None else min(top, first)
+            bottom = max(bottom, last)
+    if not columns:
+        return _EMPTY_SPRITE
+    return Sprite(columns[0][0], top, columns[-1][0] + 1, bottom, tuple(columns))
+
+
+def _flip_sprite(sprite: Sprite, width: int) -> Sprite:
+    """Lật ngang theo cả chiều rộng canvas (như Canvas.flip_x)."""
+    if not sprite.columns:
+        return sprite
+    columns = tuple((width - 1 - x, runs) for x, runs in reversed(sprite.columns))
+    return Sprite(width - sprite.right, sprite.top, width - sprite.left, sprite.bottom, columns)
+
+
+class CanvasPool:
+    """Canvas nháp dùng lại theo kích thước (raster hoá group, xem _raster_group).
+
+    acquire() trả canvas trong suốt, alpha_lock tắt; release() trả canvas về pool.
+    Giữ tối đa `max_sizes` kích thước (LRU), mỗi kích thước `per_size` canvas.
+    """
+
+    def __init__(self, max_sizes: int = 32, per_size: int = 2):
+        self.max_sizes = max_sizes
+        self.per_size = per_size
+        self._free: "OrderedDict[Tuple[int, int], List[Canvas]]" = OrderedDict()
+
+    def acquire(self, width: int, height: int) -> Canvas:
+        free = self._free.get((width, height))
+        if not free:
+            return Canvas(width, height)
+        canvas = free.pop()
+        blank = [(0, 0, 0, 0)] * height
+        for col in canvas.grid:
+            col[:] = blank
+        canvas.alpha_lock = False
+        return canvas
+
+    def release(self, canvas: Canvas) -> None:
+        size = (canvas.width, canvas.height)
+        free = self._free.get(size)
+        if free is None:
+            free = self._free[size] = []
+            while len(self._free) > self.max_sizes:
+                self._free.popitem(last=False)
+        else:
+            self._free.move_to_end(size)
+        if len(free) < self.per_size:
+            free.append(canvas)
+
+
+_scratch_local = threading.local()   # mỗi luồng một CanvasPool (render_session chạy trong threadpool)
+
+
+def scratch_pool() -> CanvasPool:
+    pool = getattr(_scratch_local, "pool", None)
+    if pool is None:
+        pool = _scratch_local.pool = CanvasPool()
+    return pool
+
+
+# Gốc canvas nháp làm tròn xuống bội số của 4 để thẻ có hoạ tiết theo toạ độ tuyệt
+# đối (dither: checkered chu kỳ 2, bayer chu kỳ 4) cho đúng pixel như trên canvas gốc
+_SCRATCH_ALIGN = 4
+
+
+def _op_bounds(args: tuple, coords: str) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (x0, y0, x1, y1, tính cả biên) mọi pixel Op có thể vẽ; None = không vẽ gì."""
+    xs, ys = [], []
+    pad = 0
+    for kind, v in zip(coords, args):
+        if kind == 'x':
+            xs.append(v)
+        elif kind == 'y':
+            ys.append(v)
+        elif kind == 'q':
+            xs.extend(p[0] for p in v)
+            ys.extend(p[1] for p in v)
+        elif kind == 'f':
+            xs.extend(v[0::2])
+            ys.extend(v[1::2])
+        elif kind in 'rt':
+            pad = max(pad, abs(v))
+    if not xs or not ys:
+        return None
+    return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+
+
+def _shift_args(args: tuple, coords: str, dx: int, dy: int) -> tuple:
+    """Dịch các arg toạ độ của Op đi (dx, dy) theo coords của thẻ."""
+    shifted = []
+    for kind, v in zip(coords, args):
+        if kind == 'x':
+            v += dx
+        elif kind == 'y':
+            v += dy
+        elif kind == 'q':
+            v = tuple((px + dx, py + dy) for px, py in v)
+        elif kind == 'f':
+            v = tuple(c + (dy if i & 1 else dx) for i, c in enumerate(v))
+        shifted.append(v)
+    return tuple(shifted)
+
+
+def _group_bounds(canvas: Canvas, ops: Tuple[Op, ...], ctx: RenderContext) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (x0, y0, x1, y1 không tính) phần group có thể vẽ, tính tĩnh từ các
+    thẻ; group rỗng → (0, 0, 0, 0), có thẻ không khai báo coords → None."""
+    left = top = right = bottom = None
+    handlers = TAG_HANDLERS
+    for op in ops:
+        handler = handlers.get(op.tag)
+        if handler is None:
+            continue
+        if handler is _USE_HANDLER:
+            ref, offset_x, offset_y, flip_x = op.args
+            sprite = _group_sprite(canvas, ref, flip_x, ctx)
+            if not sprite.columns:
+                continue
+            box = (sprite.left + offset_x, sprite.top + offset_y,
+                   sprite.right - 1 + offset_x, sprite.bottom - 1 + offset_y)
+        elif handler.coords is None:
+            return None
+        else:
+            box = _op_bounds(op.args, handler.coords)
+            if box is None:
+                continue
+        if left is None:
+            left, top, right, bottom = box
+        else:
+            left, top = min(left, box[0]), min(top, box[1])
+            right, bottom = max(right, box[2]), max(bottom, box[3])
+    if left is None:
+        return (0, 0, 0, 0)
+    return (left, top, right + 1, bottom + 1)
+
+
+def _raster_group(canvas: Canvas, ops: Tuple[Op, ...], ctx: RenderContext) -> Sprite:
+    """Raster hoá op-list của group thành Sprite cho canvas cùng kích thước.
+
+    Group có bounding box tĩnh (xem _group_bounds) được vẽ - dịch về gốc - trên
+    canvas nháp chỉ cỡ bounding box (lấy từ scratch_pool()), rồi chỉ cắt sprite
+    trong vùng đó; còn lại vẽ trên canvas nháp đầy đủ như trước.
+    """
+    width, height = canvas.width, canvas.height
+    box = _group_bounds(canvas, ops, ctx)
+    if box is None:
+        temp_c = Canvas(width, height)
+        temp_c.palette = canvas.palette
+        execute_ops(temp_c, ops, ctx.defs, ctx.sprites)
+        return _trim_sprite(temp_c.grid)
+
+    left, top = max(box[0], 0), max(box[1], 0)
+    right, bottom = min(box[2], width), min(box[3], height)
+    if left >= right or top >= bottom:
+        return _EMPTY_SPRITE   # mọi pixel nằm ngoài canvas
+    origin_x, origin_y = left - left % _SCRATCH_ALIGN, top - top % _SCRATCH_ALIGN
+    pool = scratch_pool()
+    scratch = pool.acquire(right - origin_x, bottom - origin_y)
+    scratch.palette = canvas.palette
+    try:
+        handlers = TAG_HANDLERS
+        for op in ops:
+            handler = handlers.get(op.tag)
+            if handler is None:
+                continue
+            if handler is _USE_HANDLER:
+                # Sprite con luôn lấy theo canvas gốc (flip-x lật theo cả chiều rộng canvas)
+                ref, offset_x, offset_y, flip_x = op.args
+                _blit_sprite(scratch, _group_sprite(canvas, ref, flip_x, ctx),
+                             offset_x - origin_x, offset_y - origin_y)
+            else:
+                handler.run(scratch, _shift_args(op.args, handler.coords, -origin_x, -origin_y), ctx)
+        return _trim_sprite(scratch.grid, origin_x, origin_y)
+    finally:
+        pool.release(scratch)
+
+
+def _group_sprite(canvas: Canvas, ref: str, flip_x: bool, ctx: RenderContext) -> Sprite:
+    """Sprite của group `ref` cho canvas cùng kích thước; mỗi group chỉ raster hoá
+    một lần cho cả tài liệu, bản lật được suy ra từ bản gốc."""
+    key = (ref, flip_x, canvas.width, canvas.height)
+    sprite = ctx.sprites.get(key)
+    if sprite is None:
+        if flip_x:
+            sprite = _flip_sprite(_group_sprite(canvas, ref, False, ctx), canvas.width)
+        else:
+            # Raster hoá group con trước (hậu thứ tự) để chuỗi <use> sâu không đệ quy
+            size = (canvas.width, canvas.height)
+            done = [k[0] for k in ctx.sprites if not k[1] and k[2:] == size]
+            for gid in _use_postorder(ctx.defs, [ref], done):
+                sprite = ctx.sprites[(gid, False) + size] = _raster_group(canvas, ctx.defs[gid], ctx)
+        ctx.sprites[key] = sprite
+    return sprite
+
+
+def _render_use(canvas: Canvas, args: tuple, ctx: RenderContext):
+    """Vẽ <use ref x y flip-x> lên canvas.
+
+    Group được raster hoá theo canvas cùng kích thước (flip-x lật theo cả chiều
+    rộng canvas), rồi dán các pixel không trong suốt với offset x, y - tương đương
+    paste_region(..., skip_transparent=True), nhưng dán theo đoạn cột đã cắt
+    sẵn trong sprite (xem _group_sprite).
+    """
+    ref, offset_x, offset_y, flip_x = args
+    _blit_sprite(canvas, _group_sprite(canvas, ref, flip_x, ctx), offset_x, offset_y)
+
+
+def _blit_sprite(canvas: Canvas, sprite: Sprite, offset_x: int, offset_y: int):
+    """Dán sprite lên canvas với offset, clip theo canvas; tôn trọng alpha_lock."""
+    width, height = canvas.width, canvas.height
+    if (not sprite.columns or sprite.right + offset_x <= 0 or sprite.left + offset_x >= width
+            or sprite.bottom + offset_y <= 0 or sprite.top + offset_y >= height):
+        return
+
+    grid = canvas.grid
+    lock = canvas.alpha_lock
+    for x, runs in sprite.columns:
+        tx = x + offset_x
+        if not 0 <= tx < width:
+            continue
+        col = grid[tx]
+        for y, pixels in runs:
+            ty = y + offset_y
+            a = -ty if ty < 0 else 0
+            b = min(len(pixels), height - ty)
+            if a >= b:
+                continue
+            if lock:
+                for i in range(a, b):
+                    if col[ty + i][3] != 0:
+                        col[ty + i] = pixels[i]
+            else:
+                col[ty + a:ty + b] = pixels[a:b]
+
+
+def execute_ops(canvas: Canvas, ops: Tuple[Op, ...], defs: Dict[str, Tuple[Op, ...]],
+                sprites: Optional[Dict[tuple, Sprite]] = None):
+    """Chạy op-list trên canvas (layer đang active) qua TAG_HANDLERS.
+
+    sprites: cache Sprite của <use>, truyền cùng một dict cho mọi layer/frame.
+    """
+    ctx = RenderContext(defs, {} if sprites is None else sprites)
+    handlers = TAG_HANDLERS
+    for op in ops:
+        handler = handlers.get(op.tag)
+        if handler is not None:
+            handler.run(canvas, op.args, ctx)
+
+
+def apply_postprocess(canvas: Canvas, ops: Tuple[Op, ...], workers: int = 1):
+    """Chạy các hiệu ứng <postprocess> đã biên dịch (canvas đã merge_all).
+
+    workers > 1: hiệu ứng cục bộ (outline, AA, jaggies, highlight) chạy theo tile
+    song song (xem tiling.py).
+    """
+    for tag, a in ops:
+        if tag == 'outline':
+            apply_tiled(canvas, "outline", workers, color=a[0], thickness=a[1], sel_out=a[2])
+        elif tag == 'directional-shadow':
+            canvas.apply_directional_shadow(light_dir=a[0], intensity=a[1])
+        elif tag in ('jaggies', 'internal-aa'):
+            apply_tiled(canvas, tag, workers)
+        elif tag == 'shadow-mask':
+            canvas.apply_shadow_mask((a[0], a[1]), a[2], light_dir=a[3], intensity=a[4])
+        elif tag == 'highlight-edge':
+            apply_tiled(canvas, "highlight-edge", workers, light_dir=a[0], intensity=a[1])
+
+
+class PostprocessPipeline:
+    """Postprocess đã biên dịch của một tài liệu, dùng lại cho mọi frame.
+
+    Kết quả được nhớ (LRU, tối đa max_entries frame) theo digest nội dung pixel
+    của frame trước postprocess: các frame giống hệt nhau (vòng idle, frame giữ
+    nguyên) chỉ postprocess một lần.
+    """
+
+    def __init__(self, ops: Tuple[Op, ...], workers: int = 1,
+                 max_entries: int = DEFAULT_POSTPROCESS_CACHE_ENTRIES):
+        self.ops = ops
+        self.workers = workers
+        self.max_entries = max_entries
+        self._results: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(grid) -> bytes:
+        chain = itertools.chain.from_iterable
+        return hashlib.blake2b(bytes(chain(chain(grid))), digest_size=16).digest()
+
+    def apply(self, canvas: Canvas):
+        """Canvas đã merge_all → postprocess + merge_all (tại chỗ)."""
+        key = self._digest(canvas.grid)
+        cached = self._results.get(key)
+        if cached is not None:
+            self._results.move_to_end(key)
+            self.hits += 1
+            grid, outline = cached
+            canvas.grid = [list(col) for col in grid]
+            canvas._outline_pixels = set(outline)
+            return
+        self.misses += 1
+        apply_postprocess(canvas, self.ops, self.workers)
+        canvas.merge_all()
+        self._results[key] = (tuple(map(tuple, canvas.grid)), frozenset(canvas._outline_pixels))
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+
+def render_static(plan: RenderPlan, workers: int = 1) -> Canvas:
+    """Ảnh tĩnh: vẽ các layer rồi chạy postprocess."""
+    canvas = Canvas(plan.width, plan.height)
+    canvas.palette = dict(plan.palette)
+    defs = dict(plan.defs)
+    sprites: Dict[tuple, Sprite] = {}
+    for layer_id, ops in plan.layers:
+        canvas.add_layer(layer_id)
+        canvas.set_layer(layer_id)
+        execute_ops(canvas, ops, defs, sprites)
+    if plan.postprocess:
+        canvas.merge_all()
+        apply_postprocess(canvas, plan.postprocess, workers)
+    return canvas
+
+
+def render_frame(plan: RenderPlan, ops: Tuple[Op, ...], defs: Dict[str, Tuple[Op, ...]],
+                 sprites: Dict[tuple, Sprite], pipeline: Optional[PostprocessPipeline] = None) -> Canvas:
+    """Một frame animation: vẽ op-list, postprocess (qua pipeline) rồi merge_all."""
+    fc = Canvas(plan.width, plan.height)
+    fc.palette = dict(plan.palette)
+    execute_ops(fc, ops, defs, sprites)
+    fc.merge_all()
+    if pipeline is not None and pipeline.ops:
+        pipeline.apply(fc)
+    return fc
+
+
+def render_frames(plan: RenderPlan, workers: int = 1) -> List[Canvas]:
+    """Animation: mỗi frame một canvas độc lập (đã postprocess và merge_all).
+
+    Render song song theo frame: xem frame_pool.render_frame_images().
+    """
+    defs = dict(plan.defs)
+    sprites: Dict[tuple, Sprite] = {}
+    pipeline = PostprocessPipeline(plan.postprocess, workers)
+    return [render_frame(plan, ops, defs, sprites, pipeline) for ops in plan.frames]
+
+
+# --- Cache ---
+
+class PlanCache:
+    """LRU RenderPlan theo sha256 nội dung tài liệu."""
+
+    def __init__(self, max_entries: int = DEFAULT_PLAN_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._plans: "OrderedDict[str, RenderPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key: str) -> Optional[RenderPlan]:
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                self.misses += 1
+                return None
+            self._plans.move_to_end(key)
+            self.hits += 1
+            return plan
+
+    def put(self, key: str, plan: RenderPlan) -> None:
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._plans),
+            }
+
+
+_default_plan_cache: Optional[PlanCache] = None
+
+
+def default_plan_cache() -> PlanCache:
+    global _default_plan_cache
+    if _default_plan_cache is None:
+        _default_plan_cache = PlanCache()
+    return _default_plan_cache
+
+
+def compile_cached(source: Union[str, bytes], cache: Optional[PlanCache] = None) -> RenderPlan:
+    """compile_pxvg() qua cache (mặc định: default_plan_cache())."""
+    if cache is None:
+        cache = default_plan_cache()
+    data = source.encode("utf-8") if isinstance(source, str) else source
+    key = cache.make_key(data)
+    plan = cache.get(key)
+    if plan is None:
+        plan = compile_pxvg(data)
+        cache.put(key, plan)
+    return plan
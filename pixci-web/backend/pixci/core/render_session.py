@@ -0,0 +1,208 @@
+"""
+render_session.py - Decode PXVG tăng dần cho chỉnh sửa trực tiếp (live preview).
+
+Editor gửi lại toàn bộ tài liệu sau mỗi lần sửa. RenderSession giữ kết quả lần
+render trước và so sánh tài liệu mới theo từng layer (animation: từng frame):
+  - op-list không đổi → dùng lại buffer đã raster hoá
+  - op-list cũ là tiền tố của op-list mới (thêm thẻ ở cuối layer) → vẽ tiếp
+    các thẻ mới lên buffer cũ
+  - còn lại → raster hoá lại layer đó
+Ảnh ghép (composite) được nhớ theo từng tiền tố layer nên chỉ ghép lại từ layer
+đổi đầu tiên trở lên; postprocess chỉ chạy lại khi ảnh ghép hoặc <postprocess>
+đổi. Đổi kích thước / palette / defs → render lại toàn bộ.
+Ảnh xuất ra giống hệt decode_pxvg() từng byte.
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image
+
+from .canvas import Canvas
+from .frame_pool import frame_image
+from .render_plan import (
+    Op, PostprocessPipeline, RenderPlan, Sprite, apply_postprocess, compile_cached, execute_ops,
+    render_frame, render_static,
+)
+
+Grid = Tuple[Tuple[tuple, ...], ...]   # grid bất biến (tuple các cột)
+
+
+class _LayerEntry(NamedTuple):
+    layer_id: str
+    ops: Tuple[Op, ...]
+    lock_in: bool        # alpha_lock khi bắt đầu layer (do layer trước để lại)
+    grid: Grid
+    lock_out: bool
+    composite: Grid      # ảnh ghép các layer 0..i
+
+
+class _FrameEntry(NamedTuple):
+    ops: Tuple[Op, ...]
+    grid: Grid           # frame đã postprocess + merge_all
+
+
+class SessionResult(NamedTuple):
+    width: int
+    height: int
+    canvas: Optional[Canvas]          # ảnh tĩnh (None nếu là animation)
+    frames: Optional[List[Canvas]]    # animation: các frame đã postprocess + merge_all
+    columns: int
+    fps: float
+    stats: Dict[str, int]             # reused / resumed / rendered (số layer hoặc frame)
+
+    @property
+    def is_animation(self) -> bool:
+        return self.frames is not None
+
+    def image(self) -> Image.Image:
+        """Ảnh RGBA kích thước gốc: ảnh tĩnh hoặc spritesheet của animation."""
+        if not self.is_animation:
+            return frame_image(self.canvas)
+        from .pxvg_engine import spritesheet_image
+        return spritesheet_image([frame_image(fc) for fc in self.frames], self.width, self.height,
+                                 self.columns)
+
+
+def _freeze(grid: List[list]) -> Grid:
+    return tuple(map(tuple, grid))
+
+
+def _canvas_from(plan: RenderPlan, grid: Optional[Grid]) -> Canvas:
+    canvas = Canvas(plan.width, plan.height)
+    canvas.palette = dict(plan.palette)
+    if grid is not None:
+        canvas.grid = [list(col) for col in grid]
+    return canvas
+
+
+def _composite(plan: RenderPlan, below: Optional[Grid], grid: Grid) -> Grid:
+    """Ghép `grid` lên ảnh ghép các layer bên dưới (cùng phép trộn với Canvas.flatten)."""
+    temp = Canvas(plan.width, plan.height)
+    if below is None:
+        temp.layers = {"top": grid}
+        temp.layer_order = ["top"]
+    else:
+        temp.layers = {"below": below, "top": grid}
+        temp.layer_order = ["below", "top"]
+    return _freeze(temp.flatten())
+
+
+class RenderSession:
+    """Phiên decode tăng dần: gọi render() với từng phiên bản của tài liệu.
+
+    Một phiên phục vụ một tài liệu đang được sửa (một tab editor / một kết nối
+    WebSocket); không dùng chung giữa các luồng.
+
+    Args:
+        workers: số worker cho postprocess theo tile (xem tiling.py)
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.reset()
+
+    def reset(self) -> None:
+        """Bỏ mọi buffer đã nhớ (lần render sau vẽ lại từ đầu)."""
+        self._base: Optional[tuple] = None     # (w, h, palette, defs) của lần render trước
+        self._defs: Dict[str, Tuple[Op, ...]] = {}
+        self._sprites: Dict[tuple, Sprite] = {}
+        self._layers: List[_LayerEntry] = []
+        self._post: Optional[Tuple[Tuple[Op, ...], Grid, Grid]] = None   # (ops, composite, kết quả)
+        self._frames: List[_FrameEntry] = []
+        self._frame_post: Optional[Tuple[Op, ...]] = None   # postprocess đã áp cho self._frames
+
+    def render(self, source: Union[str, bytes]) -> SessionResult:
+        """Render phiên bản mới của tài liệu (nội dung XML), dùng lại phần không đổi."""
+        plan = compile_cached(source)
+        base = (plan.width, plan.height, plan.palette, plan.defs)
+        if base != self._base:
+            self.reset()
+            self._base = base
+            self._defs = dict(plan.defs)
+        stats = {"reused": 0, "resumed": 0, "rendered": 0}
+        if plan.is_animation:
+            self._layers, self._post = [], None
+            frames = self._render_frames(plan, stats)
+            return SessionResult(plan.width, plan.height, None, frames, plan.columns, plan.fps, stats)
+        self._frames, self._frame_post = [], None
+        return SessionResult(plan.width, plan.height, self._render_static(plan, stats), None, 1, 0.0, stats)
+
+    # --- Ảnh tĩnh ---
+
+    def _draw(self, plan: RenderPlan, ops: Tuple[Op, ...], grid: Optional[Grid],
+              lock: bool) -> Tuple[Grid, bool]:
+        canvas = _canvas_from(plan, grid)
+        canvas.alpha_lock = lock
+        execute_ops(canvas, ops, self._defs, self._sprites)
+        return _freeze(canvas.grid), canvas.alpha_lock
+
+    def _render_static(self, plan: RenderPlan, stats: Dict[str, int]) -> Canvas:
+        ids = [layer_id for layer_id, _ in plan.layers]
+        if len(set(ids)) != len(ids) or 'default' in ids[1:]:
+            # Layer trùng id (vẽ tiếp lên layer cũ) / 'default' không đứng đầu:
+            # thứ tự vẽ khác thứ tự ghép → không nhớ theo layer
+            self._layers, self._post = [], None
+            stats["rendered"] = len(ids)
+            return render_static(plan, self.workers)
+
+        old_layers = self._layers
+        layers: List[_LayerEntry] = []
+        lock = False
+        composite: Optional[Grid] = None
+        stale = False    # có layer đổi ở dưới → phải ghép lại từ đây
+        for i, (layer_id, ops) in enumerate(plan.layers):
+            old = old_layers[i] if i < len(old_layers) else None
+            if old is not None and (old.layer_id != layer_id or old.lock_in != lock):
+                old = None
+            if old is not None and old.ops == ops:
+                grid, lock_out = old.grid, old.lock_out
+                stats["reused"] += 1
+            elif old is not None and len(ops) > len(old.ops) and ops[:len(old.ops)] == old.ops:
+                grid, lock_out = self._draw(plan, ops[len(old.ops):], old.grid, old.lock_out)
+                stats["resumed"] += 1
+                stale = True
+            else:
+                grid, lock_out = self._draw(plan, ops, None, lock)
+                stats["rendered"] += 1
+                stale = True
+            composite = _composite(plan, composite, grid) if stale else old.composite
+            layers.append(_LayerEntry(layer_id, ops, lock, grid, lock_out, composite))
+            lock = lock_out
+        self._layers = layers
+
+        if not plan.postprocess:
+            self._post = None
+            return _canvas_from(plan, composite)
+        if composite is None:
+            composite = _freeze(Canvas(plan.width, plan.height).grid)
+        if self._post is not None and self._post[0] == plan.postprocess and self._post[1] == composite:
+            return _canvas_from(plan, self._post[2])
+        canvas = _canvas_from(plan, composite)
+        apply_postprocess(canvas, plan.postprocess, self.workers)
+        canvas.merge_all()
+        self._post = (plan.postprocess, composite, _freeze(canvas.grid))
+        return canvas
+
+    # --- Animation ---
+
+    def _render_frames(self, plan: RenderPlan, stats: Dict[str, int]) -> List[Canvas]:
+        if self._frame_post != plan.postprocess:
+            # Kết quả frame cũ đã gồm postprocess cũ
+            self._frame_post = plan.postprocess
+            self._frames = []
+        old_frames = self._frames
+        pipeline = PostprocessPipeline(plan.postprocess, self.workers)
+        entries: List[_FrameEntry] = []
+        canvases = []
+        for i, ops in enumerate(plan.frames):
+            old = old_frames[i] if i < len(old_frames) else None
+            if old is not None and old.ops == ops:
+                entry = old
+                stats["reused"] += 1
+            else:
+                fc = render_frame(plan, ops, self._defs, self._sprites, pipeline)
+                entry = _FrameEntry(ops, _freeze(fc.grid))
+                stats["rendered"] += 1
+            entries.append(entry)
+            canvases.append(_canvas_from(plan, entry.grid))
+        self._frames = entries
+        return canvases
@@ -2,17 +2,37 @@
 smart_encoder.py - Simplified PXVG encoder
 Tự động phát hiện block size và encode tối ưu
 """
-import numpy as np
 from pathlib import Path
-from PIL import Image
-from typing import Tuple
+from typing import List, Optional, Tuple
 
+from .analysis import ImageAnalysis
+
+
+def _fixed_order_elements(result, keys: List[str]) -> List[str]:
+    """Thứ tự cũ: toàn bộ rect, rồi row, rồi dots gom theo màu."""
+    from .pxvg_optimizer import rect_xml, row_xml, dots_xml
+
+    elements = [rect_xml(x0, y0, x1, y1, keys[c]) for x0, y0, x1, y1, c in result.rects]
+    elements += [row_xml(y, xs, xe, keys[c]) for y, xs, xe, c in result.rows]
+    dots_by_color = {}
+    for y, x, c in result.dots:
+        dots_by_color.setdefault(keys[c], []).append((x, y))
+    for color in sorted(dots_by_color):
+        elements.append(dots_xml(color, dots_by_color[color]))
+    return elements
 
 def smart_encode_pxvg(
     image_path: Path, 
     output_path: Path, 
     block_size: int = 1, 
-    auto_detect: bool = True
+    auto_detect: bool = True,
+    rect_mode: str = "fast",
+    stats: Optional[dict] = None,
+    cost_metric: Optional[str] = "bytes",
+    budget: Optional[int] = None,
+    budget_unit: str = "bytes",
+    analysis: Optional[ImageAnalysis] = None,
+    workers: int = 1
 ) -> Tuple[int, int, int, int]:
     """
     Smart PXVG encoder - đơn giản và hiệu quả
@@ -22,78 +42,56 @@ def smart_encode_pxvg(
         output_path: Đường dẫn PXVG output
         block_size: Kích thước block (1-16)
         auto_detect: Tự động phát hiện block size tối ưu
+        rect_mode: 'fast' hoặc 'quality' (xem decompose.py)
+        stats: dict tuỳ chọn, được điền số thẻ đã emit và thời gian phân rã
+        cost_metric: 'bytes' hoặc 'tokens' - chọn thẻ theo cost model (xem
+                     pxvg_optimizer.py). None → thứ tự cố định rect → row → dots
+        budget: Ngân sách tối đa (lossy). Vượt ngân sách → gộp màu gần nhau, nuốt
+                pixel lẻ / chi tiết nhỏ cho tới khi vừa (xem lossy.py); sai số
+                pixel được ghi vào stats. None → lossless
+        budget_unit: 'bytes', 'tokens' hoặc 'tags' (số thẻ vẽ)
+        analysis: ImageAnalysis dùng chung với các encoder khác (khi có thì bỏ
+                  qua image_path/block_size/auto_detect)
+        workers: Số process phân rã song song theo băng ngang (chỉ với lưới lớn,
+                 xem MIN_PARALLEL_PIXELS trong decompose.py; output khác một chút so
+                 với phân rã cả lưới). 1 = phân rã cả lưới trong process hiện tại
     
     Returns:
         (grid_width, grid_height, num_colors, final_block_size)
     """
-    from .code_engine import _detect_block_size, _build_grid, _find_best_rects, _collect_all_runs
-    
-    # Load image
-    img = Image.open(image_path).convert("RGBA")
-    
-    # Auto detect block size
-    if auto_detect:
-        block_size = _detect_block_size(img)
+    from .pxvg_optimizer import optimize_elements, document_text
     
-    # Build grid
-    gw, gh, grid, palette = _build_grid(img, block_size)
+    # Load image, block size (và gốc lưới nếu ảnh có viền lệch), grid
+    if analysis is None:
+        analysis = ImageAnalysis(image_path, block_size, auto_detect)
+    block_size = analysis.block_size
+    gw, gh = analysis.size
+    index, colors, keys = analysis.index, analysis.colors, analysis.keys
     
-    # Find rectangles
-    rects, used = _find_best_rects(grid, gw, gh)
-    
-    # Collect remaining runs (rows)
-    runs = _collect_all_runs(grid, gw, gh, used)
-    
-    # Separate single pixels and multi-pixel runs
-    single_pixels = []
-    rows = []
-    
-    for y, x_start, x_end, color in runs:
-        if x_start == x_end:
-            single_pixels.append((y, x_start, color))
+    if budget is not None:
+        # Lossy: đơn giản hoá lưới tới khi vừa ngân sách
+        from .lossy import fit_budget
+        lossy = fit_budget(index, colors, budget, budget_unit, cost_metric or "bytes", rect_mode,
+                           analysis.decomposition(rect_mode, workers), workers)
+        index, colors, keys = lossy.index, lossy.colors, lossy.keys
+        result, elements, defs, cost_stats = lossy.decomposition, lossy.elements, lossy.defs, lossy.stats
+    else:
+        # Rectangles, rows and single pixels
+        result = analysis.decomposition(rect_mode, workers)
+        if cost_metric is not None:
+            elements, defs, cost_stats = optimize_elements(index, colors, keys, cost_metric, rect_mode,
+                                                           decomposition=result)
         else:
-            rows.append((y, x_start, x_end, color))
+            elements, defs = _fixed_order_elements(result, keys), []
+            cost_stats = {"plan": "fixed", "elements": len(elements)}
     
-    # Group single pixels by color for dots
-    dots_by_color = {}
-    for y, x, color in single_pixels:
-        if color not in dots_by_color:
-            dots_by_color[color] = []
-        dots_by_color[color].append((x, y))
-    
-    # Write PXVG file
+    # Write PXVG file (header, palette, defs cho tile lặp lại, layer)
     with open(output_path, "w", encoding="utf-8") as f:
-        # Header
-        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
-        f.write(f'<pxvg w="{gw}" h="{gh}" xmlns="http://pixci.dev/pxvg">\n')
-        
-        # Palette
-        f.write('  <palette>\n')
-        for hex_color, color_key in sorted(palette.items(), key=lambda x: x[1]):
-            f.write(f'    <color k="{color_key}" hex="{hex_color}" />\n')
-        f.write('  </palette>\n')
-        
-        # Layer
-        f.write('  <layer id="main">\n')
-        
-        # Rectangles (most efficient)
-        for x0, y0, x1, y1, color in rects:
-            w = x1 - x0 + 1
-            h = y1 - y0 + 1
-            f.write(f'    <rect x="{x0}" y="{y0}" w="{w}" h="{h}" c="{color}" />\n')
-        
-        # Rows (horizontal lines)
-        for y, x_start, x_end, color in rows:
-            f.write(f'    <row y="{y}" x1="{x_start}" x2="{x_end}" c="{color}" />\n')
-        
-        # Dots (single pixels grouped by color)
-        for color in sorted(dots_by_color.keys()):
-            points = dots_by_color[color]
-            pts_str = " ".join([f"{x},{y}" for x, y in points])
-            f.write(f'    <dots c="{color}" pts="{pts_str}" />\n')
-        
-        f.write('  </layer>\n')
-        f.write('</pxvg>\n')
+        f.write(document_text(gw, gh, colors, keys, elements, defs))
+    
+    if stats is not None:
+        stats.update(result.stats())
+        stats.update(cost_stats)
     
-    return (gw, gh, len(palette), block_size)
+    return (gw, gh, len(colors), block_size)
 
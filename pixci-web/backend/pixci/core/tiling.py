@@ -0,0 +1,174 @@
+"""
+tiling.py - Chạy postprocess theo tile song song cho canvas lớn (atlas, tilemap).
+
+Canvas được chia thành các tile có viền đệm (halo). Mỗi tile được xử lý độc lập
+trên thread/process pool, sau đó chỉ phần lõi được ghép lại vào canvas gốc.
+Các hiệu ứng ở đây đều là stencil cục bộ nên kết quả giống hệt chạy tuần tự.
+Process pool được dùng lại giữa các hiệu ứng/lần gọi (như decompose.py); canvas
+nhỏ hơn MIN_TILED_PIXELS chạy tuần tự.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
+
+DEFAULT_TILE_SIZE = 128
+MIN_TILED_PIXELS = 256 * 256
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+# Tên hiệu ứng (trùng tên thẻ trong <postprocess>) → method tuần tự của Canvas
+TILEABLE_EFFECTS: Dict[str, str] = {
+    "outline": "add_outline",
+    "internal-aa": "apply_internal_aa",
+    "jaggies": "cleanup_jaggies",
+    "highlight-edge": "add_highlight_edge",
+}
+
+_OUTLINE_DEFAULTS = {
+    "color": "#000000FF",
+    "thickness": 1,
+    "sel_out": False,
+    "hue_shift_amount": 0.05,
+    "darkness": 0.4,
+    "saturation_boost": 1.2,
+}
+
+
+def _effect_halo(effect: str, kwargs: dict) -> int:
+    """Số pixel viền đệm cần để lõi tile cho kết quả chính xác."""
+    if effect == "outline":
+        # Mỗi vòng outline đọc lân cận 4 hướng → mỗi vòng cần thêm 1 pixel
+        return max(1, int(kwargs.get("thickness", 1)))
+    return 1
+
+
+def _iter_tiles(width: int, height: int, tile_size: int):
+    """Sinh (x0, y0, x1, y1) với x1/y1 exclusive."""
+    for x0 in range(0, width, tile_size):
+        for y0 in range(0, height, tile_size):
+            yield (x0, y0, min(width, x0 + tile_size), min(height, y0 + tile_size))
+
+
+def _local_subset(points: Set[Tuple[int, int]], box: Tuple[int, int, int, int]) -> Set[Tuple[int, int]]:
+    """Lấy các điểm nằm trong box và chuyển về toạ độ cục bộ của tile."""
+    sx0, sy0, sx1, sy1 = box
+    if not points:
+        return set()
+    return {
+        (x - sx0, y - sy0)
+        for x in range(sx0, sx1)
+        for y in range(sy0, sy1)
+        if (x, y) in points
+    }
+
+
+def _run_tile(job: tuple):
+    """Worker: dựng canvas con cho 1 tile, chạy hiệu ứng, trả về phần lõi.
+
+    Phải là hàm cấp module để ProcessPoolExecutor pickle được.
+    """
+    effect, columns, core, palette, exterior, outline_pixels, use_outline_set, kwargs = job
+    from .canvas import Canvas
+
+    cx0, cy0, cx1, cy1 = core
+    sub = Canvas(len(columns), len(columns[0]))
+    sub.grid = columns
+    sub.palette = palette
+    sub._outline_pixels = outline_pixels
+
+    if effect == "outline":
+        params = {**_OUTLINE_DEFAULTS, **kwargs}
+        sub._outline_rings(exterior, **params)
+    elif effect == "jaggies" and use_outline_set and not outline_pixels:
+        # Canvas gốc đang dùng tập outline đã track nhưng tile này không có
+        # pixel outline nào → không được fallback sang so khớp màu.
+        pass
+    else:
+        getattr(sub, TILEABLE_EFFECTS[effect])(**kwargs)
+
+    core_cols = [sub.grid[x][cy0:cy1] for x in range(cx0, cx1)]
+    core_outline = {
+        (x, y) for (x, y) in sub._outline_pixels
+        if cx0 <= x < cx1 and cy0 <= y < cy1
+    }
+    return core_cols, core_outline
+
+
+def _tile_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool dùng lại giữa các hiệu ứng và các lần gọi (tạo pool mới mỗi lần quá đắt)."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool, _pool_workers = ProcessPoolExecutor(max_workers=workers), workers
+    return _pool
+
+
+def _run_tiles(jobs: list, workers: int, executor: str) -> list:
+    global _pool
+    if executor != "process":
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_run_tile, jobs))
+    try:
+        return list(_tile_pool(workers).map(_run_tile, jobs))
+    except BrokenProcessPool:
+        # Worker chết: bỏ pool hỏng, chạy tuần tự (kết quả giống hệt)
+        _pool = None
+        return [_run_tile(job) for job in jobs]
+
+
+def apply_tiled(canvas, effect: str, workers: int = 1, tile_size: int = DEFAULT_TILE_SIZE,
+                executor: str = "process", **kwargs):
+    """Chạy một hiệu ứng postprocess cục bộ trên active layer theo tile song song.
+
+    Args:
+        canvas: Canvas cần xử lý (sửa tại chỗ)
+        effect: 'outline', 'internal-aa', 'jaggies' hoặc 'highlight-edge'
+        workers: Số worker. <= 1, canvas nhỏ hơn 1 tile hoặc ít hơn MIN_TILED_PIXELS
+                 pixel → chạy tuần tự
+        tile_size: Kích thước cạnh của mỗi tile (chưa tính halo)
+        executor: 'process' (tránh GIL, mặc định) hoặc 'thread'
+        **kwargs: Tham số truyền cho method tương ứng của Canvas
+
+    Example:
+        apply_tiled(canvas, "outline", workers=8, color="#000000FF", thickness=2)
+    """
+    if effect not in TILEABLE_EFFECTS:
+        raise ValueError(f"Hiệu ứng '{effect}' không hỗ trợ chạy theo tile. "
+                         f"Hỗ trợ: {', '.join(TILEABLE_EFFECTS)}")
+
+    width, height = canvas.width, canvas.height
+    if (workers <= 1 or (width <= tile_size and height <= tile_size)
+            or width * height < MIN_TILED_PIXELS):
+        getattr(canvas, TILEABLE_EFFECTS[effect])(**kwargs)
+        return
+
+    halo = _effect_halo(effect, kwargs)
+    grid = canvas.grid
+    exterior: Optional[Set[Tuple[int, int]]] = canvas._find_exterior() if effect == "outline" else None
+    outline_pixels = getattr(canvas, "_outline_pixels", set())
+    use_outline_set = bool(outline_pixels)
+
+    tiles: List[Tuple[int, int, int, int, int, int]] = []
+    jobs = []
+    for x0, y0, x1, y1 in _iter_tiles(width, height, tile_size):
+        sx0, sy0 = max(0, x0 - halo), max(0, y0 - halo)
+        sx1, sy1 = min(width, x1 + halo), min(height, y1 + halo)
+        box = (sx0, sy0, sx1, sy1)
+        columns = [grid[x][sy0:sy1] for x in range(sx0, sx1)]
+        core = (x0 - sx0, y0 - sy0, x1 - sx0, y1 - sy0)
+        tile_exterior = _local_subset(exterior, box) if exterior is not None else set()
+        tile_outline = _local_subset(outline_pixels, box)
+        tiles.append((x0, y0, x1, y1, sx0, sy0))
+        jobs.append((effect, columns, core, canvas.palette, tile_exterior,
+                     tile_outline, use_outline_set, kwargs))
+
+    results = _run_tiles(jobs, workers, executor)
+
+    merged_outline = set()
+    for (x0, y0, x1, y1, sx0, sy0), (core_cols, core_outline) in zip(tiles, results):
+        for dx, col in enumerate(core_cols):
+            grid[x0 + dx][y0:y1] = col
+        merged_outline.update((x + sx0, y + sy0) for x, y in core_outline)
+    canvas._outline_pixels = merged_outline
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixci.core import encode_cache
+from pixci.core.analysis import ALL_FORMATS, encode_all
+from pixci.core.batch import encode_batch
+from pixci.core.encode_cache import EncodeCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(encode_cache, "_default_cache", EncodeCache())
+
+
+def _sprite(shift: int = 0) -> Image.Image:
+    rgba = np.zeros((12, 12, 4), dtype=np.uint8)
+    rgba[2:8, 2 + shift:9 + shift] = (200, 40, 40, 255)
+    rgba[5:10, 4:7] = (40, 40, 200, 255)
+    return Image.fromarray(rgba)
+
+
+def test_all_goes_through_cache(tmp_path):
+    src = tmp_path / "in" / "hero.png"
+    src.parent.mkdir()
+    _sprite().save(src)
+
+    first = encode_batch([src], tmp_path / "out", form="all", workers=1)["files"][0]
+    second = encode_batch([src], tmp_path / "out", form="all", workers=1)["files"][0]
+    assert first["ok"] and not first["cached"]
+    assert second["ok"] and second["cached"]
+
+    (tmp_path / "ref").mkdir()
+    expected = encode_all(src, tmp_path / "ref" / "hero")
+    for form, suffix in ALL_FORMATS.items():
+        got = (tmp_path / "out" / f"hero{suffix}").read_text(encoding="utf-8")
+        assert got == expected[form][0].read_text(encoding="utf-8"), form
+
+
+def test_all_keeps_gif_frames(tmp_path):
+    src = tmp_path / "walk.gif"
+    frames = [_sprite(i) for i in range(3)]
+    frames[0].save(src, save_all=True, append_images=frames[1:], duration=100, loop=0, disposal=2)
+
+    record = encode_batch([src], tmp_path / "out", form="all", workers=1)["files"][0]
+    assert record["ok"], record.get("error")
+    assert record["frames"] == 3
+    assert "<frame" in (tmp_path / "out" / "walk.pxvg.xml").read_text(encoding="utf-8")
@@ -0,0 +1,59 @@
+import io
+from pathlib import Path
+
+import pytest
+
+from pixci.core.pxvg_engine import decode_pxvg, decode_pxvg_to_bytes, decode_pxvg_to_canvas
+from pixci.core.pxvg_stream import decode_pxvg_stream, stream_render
+from pixci.core.render_session import RenderSession
+
+DOCS = sorted((Path(__file__).parent / "data").glob("*.pxvg.xml"))
+
+
+def _pixels(result) -> list:
+    """Canvas / danh sách frame / kết quả stream-session → danh sách lưới đã flatten."""
+    if hasattr(result, "is_animation"):
+        result = result.frames if result.is_animation else result.canvas
+    canvases = result if isinstance(result, list) else [result]
+    return [canvas.flatten() for canvas in canvases]
+
+
+def _sources(doc: Path) -> dict:
+    data = doc.read_bytes()
+    return {"path": doc, "bytes": data, "str": data.decode("utf-8"), "file": io.BytesIO(data)}
+
+
+@pytest.mark.parametrize("doc", DOCS, ids=lambda p: p.name)
+def test_in_memory_and_stream_agree(doc):
+    expected = _pixels(decode_pxvg_to_canvas(doc))
+    for kind, source in _sources(doc).items():
+        assert _pixels(decode_pxvg_to_canvas(source)) == expected, kind
+    for kind, source in _sources(doc).items():
+        assert _pixels(stream_render(source)) == expected, kind
+
+
+@pytest.mark.parametrize("doc", DOCS, ids=lambda p: p.name)
+def test_session_matches_fresh_decode(doc):
+    text = doc.read_text(encoding="utf-8")
+    # Sửa thẻ cuối cùng của layer/frame cuối rồi quay lại bản gốc
+    cut = max(text.rfind("</layer>"), text.rfind("</frame>"))
+    edited = text[:cut] + '<dot x="0" y="0" c="#12345678"/>' + text[cut:]
+
+    session = RenderSession()
+    for version in (text, edited, text, text):
+        assert _pixels(session.render(version)) == _pixels(decode_pxvg_to_canvas(version))
+    assert session.render(text).stats["rendered"] == 0
+
+
+@pytest.mark.parametrize("scale", [1, 3])
+@pytest.mark.parametrize("doc", DOCS, ids=lambda p: p.name)
+def test_file_outputs_agree(tmp_path, doc, scale):
+    decode_pxvg(doc, tmp_path / "file.png", scale)
+    decode_pxvg_stream(doc.read_bytes(), tmp_path / "stream.png", scale)
+    png = (tmp_path / "file.png").read_bytes()
+    assert (tmp_path / "stream.png").read_bytes() == png
+    assert decode_pxvg_to_bytes(doc, "png", scale) == png
+    if (tmp_path / "file.gif").exists():
+        gif = (tmp_path / "file.gif").read_bytes()
+        assert (tmp_path / "stream.gif").read_bytes() == gif
+        assert decode_pxvg_to_bytes(doc, "gif", scale) == gif
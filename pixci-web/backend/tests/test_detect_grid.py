@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixci.core.code_engine import _build_index_grid, detect_grid
+
+RED, BLUE, GREEN, CLEAR = (255, 0, 0, 255), (0, 0, 255, 255), (0, 255, 0, 255), (0, 0, 0, 0)
+
+
+def _image(rows):
+    return Image.fromarray(np.array(rows, dtype=np.uint8))
+
+
+def _upscale(native: np.ndarray, factor: int) -> np.ndarray:
+    return np.kron(native, np.ones((factor, factor, 1), dtype=np.uint8))
+
+
+def test_leading_run_is_not_dropped():
+    # Cột đỏ đầu (1 px) không khớp block 2 của phần còn lại → không được coi là viền lệch
+    img = _image([[RED, BLUE, BLUE, GREEN, GREEN]] * 2)
+    assert detect_grid(img) == (1, 0, 0)
+
+
+@pytest.mark.parametrize("factor", [2, 3, 4])
+def test_upscaled_sprite(factor):
+    native = np.array([[RED, BLUE, CLEAR], [GREEN, RED, BLUE]], dtype=np.uint8)
+    assert detect_grid(Image.fromarray(_upscale(native, factor))) == (factor, 0, 0)
+
+
+def test_transparent_border_offset():
+    native = np.array([[RED, BLUE], [BLUE, GREEN]], dtype=np.uint8)
+    canvas = np.zeros((11, 11, 4), dtype=np.uint8)
+    canvas[1:9, 1:9] = _upscale(native, 4)
+    assert detect_grid(Image.fromarray(canvas)) == (4, 1, 1)
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_detected_grid_is_lossless(seed):
+    rng = np.random.default_rng(seed)
+    palette = np.array([RED, BLUE, GREEN, CLEAR], dtype=np.uint8)
+    w, h = rng.integers(1, 41, 2)
+    factor = int(rng.integers(1, 5))
+    big = _upscale(palette[rng.integers(0, 4, (h, w))], factor)
+    img = Image.fromarray(big)
+
+    block, ox, oy = detect_grid(img)
+    gw, gh, index, colors = _build_index_grid(img, block, (ox, oy))
+    table = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5, 7)] for c in colors] + [CLEAR], dtype=np.uint8)
+    rebuilt = np.zeros_like(big)
+    rebuilt[oy:oy + gh * block, ox:ox + gw * block] = _upscale(table[index], block)
+    opaque = big[..., 3] != 0
+    assert np.array_equal(rebuilt[opaque], big[opaque])
+    assert not rebuilt[~opaque][..., 3].any()
@@ -0,0 +1,39 @@
+from pixci.core import encode_cache
+from pixci.core.encode_cache import CacheEntry, EncodeCache
+
+
+def _entry(size: int) -> CacheEntry:
+    return CacheEntry((1, 1, 1, 1), "x" * size, {})
+
+
+def _disk_size(cache: EncodeCache) -> int:
+    return sum(p.stat().st_size for p in cache.disk_dir.glob("*/*.json"))
+
+
+def test_disk_stays_within_budget(tmp_path):
+    cache = EncodeCache(disk_dir=tmp_path, disk_max_bytes=5000)
+    for i in range(40):
+        cache.put(f"{i:064x}", _entry(1000))
+    assert _disk_size(cache) <= 5000
+    assert cache._disk_bytes == _disk_size(cache)
+    assert cache.get(f"{39:064x}") is not None
+
+
+def test_disk_scan_only_when_needed(tmp_path, monkeypatch):
+    cache = EncodeCache(disk_dir=tmp_path, disk_max_bytes=10 ** 9)
+    scans = []
+    evict = cache._disk_evict
+    monkeypatch.setattr(cache, "_disk_evict", lambda: scans.append(1) or evict())
+    for i in range(2 * encode_cache.DISK_RESCAN_WRITES):
+        cache.put(f"{i:064x}", _entry(100))
+    # Lần ghi đầu quét để biết tổng dung lượng, sau đó mỗi DISK_RESCAN_WRITES lần ghi
+    assert len(scans) == 3
+    assert cache._disk_bytes == _disk_size(cache)
+
+
+def test_overwrite_keeps_running_total(tmp_path):
+    cache = EncodeCache(disk_dir=tmp_path)
+    key = "ab" * 32
+    cache.put(key, _entry(100))
+    cache.put(key, _entry(300))
+    assert cache._disk_bytes == _disk_size(cache)
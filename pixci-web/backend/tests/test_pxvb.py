@@ -0,0 +1,21 @@
+from pathlib import Path
+
+import pytest
+
+from pixci.core.pxvb import is_pxvb, load_pxvb, pxvb_to_pxvg, pxvg_to_pxvb
+from pixci.core.pxvg_engine import decode_pxvg_to_bytes
+from pixci.core.render_plan import compile_pxvg
+
+DOCS = sorted((Path(__file__).parent / "data").glob("*.pxvg.xml"))
+
+
+@pytest.mark.parametrize("doc", DOCS, ids=lambda p: p.name)
+def test_pxvb_round_trip(doc):
+    source = doc.read_bytes()
+    binary = pxvg_to_pxvb(source)
+    assert is_pxvb(binary) and not is_pxvb(source)
+    # PXVB → plan giống hệt biên dịch XML; PXVB → PXVG → PXVB giữ nguyên từng byte
+    assert load_pxvb(binary) == compile_pxvg(source)
+    text = pxvb_to_pxvg(binary)
+    assert pxvg_to_pxvb(text) == binary
+    assert decode_pxvg_to_bytes(binary) == decode_pxvg_to_bytes(source) == decode_pxvg_to_bytes(text)
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixci.core.code_engine import _build_index_grid, _make_key
+from pixci.core.pxvg_engine import decode_pxvg_to_canvas
+from pixci.core.pxvg_optimizer import (
+    TILE_SIZES, _layer_plans, _symmetry_plans, _tile_plan, canvas_to_array, verify_elements,
+)
+from pixci.core.smart_encoder import smart_encode_pxvg
+
+PALETTE = np.array([(0, 0, 0, 0), (200, 40, 40, 255), (40, 40, 200, 255), (40, 160, 40, 255),
+                    (240, 220, 80, 255), (90, 60, 30, 128)], dtype=np.uint8)
+
+
+def _rgba(index: np.ndarray) -> np.ndarray:
+    return PALETTE[index]
+
+
+def _noise(rng, h, w, colors=6):
+    return rng.integers(0, colors, (h, w))
+
+
+def _tileset(rng):
+    tile = _noise(rng, 8, 8)
+    index = np.tile(tile, (4, 4))
+    index[3, 5] = 4    # một pixel lệch → residual
+    return index
+
+
+def _mirror_x(rng):
+    half = _noise(rng, 20, 10)
+    index = np.hstack([half, half[:, ::-1]])
+    index[4, 15] = 0   # xoá một pixel bên phải → vá bằng CLEAR
+    return index
+
+
+def _mirror_y(rng):
+    return _mirror_x(rng).T.copy()
+
+
+def _mirror_xy(rng):
+    quarter = _noise(rng, 10, 10)
+    top = np.hstack([quarter, quarter[:, ::-1]])
+    return np.vstack([top, top[::-1]])
+
+
+def _patterns(rng):
+    index = np.zeros((24, 24), dtype=np.int64)
+    yy, xx = np.mgrid[:12, :24]
+    index[:12] = np.where((xx + yy) % 2 == 0, 1, 2)        # dither bàn cờ
+    index[12:] = 3 + (np.arange(24) // 8)[None, :] % 3        # dải gradient
+    return index
+
+
+def _background(rng):
+    index = np.full((24, 24), 2)
+    pts = rng.integers(0, 24, (30, 2))
+    index[pts[:, 0], pts[:, 1]] = rng.integers(0, 6, 30)
+    return index
+
+
+def _sparse(rng):
+    index = _noise(rng, 17, 13)
+    index[rng.random(index.shape) < 0.6] = 0
+    return index
+
+
+IMAGES = {f.__name__.lstrip("_"): f for f in (_tileset, _mirror_x, _mirror_y, _mirror_xy, _patterns,
+                                              _background, _sparse)}
+
+
+def _grid(image: np.ndarray):
+    gw, gh, index, colors = _build_index_grid(Image.fromarray(image), 1)
+    return index, colors, [_make_key(i) for i in range(len(colors))]
+
+
+def _candidate_plans(index, keys):
+    """Mọi plan optimize_elements cân nhắc: (tên, elements, defs)."""
+    plans = [(name, elements, []) for name, elements in
+             _layer_plans(index, keys, "bytes", "fast", patterns=True)
+             + _symmetry_plans(index, keys, "bytes", "fast")]
+    for t in TILE_SIZES:
+        tiled = _tile_plan(index, keys, "bytes", "fast", t, {})
+        if tiled is not None:
+            plans.append((f"tiles:{t}", tiled[0], tiled[1]))
+    return plans
+
+
+def _normalized(rgba: np.ndarray) -> np.ndarray:
+    rgba = rgba.copy()
+    rgba[rgba[..., 3] == 0] = 0
+    return rgba
+
+
+@pytest.mark.parametrize("name", IMAGES)
+def test_every_candidate_plan_is_lossless(name):
+    index, colors, keys = _grid(_rgba(IMAGES[name](np.random.default_rng(7))))
+    for plan, elements, defs in _candidate_plans(index, keys):
+        assert verify_elements(elements, index, colors, keys, defs), plan
+
+
+def test_candidates_cover_every_plan_kind():
+    kinds = set()
+    for name, make in IMAGES.items():
+        index, colors, keys = _grid(_rgba(make(np.random.default_rng(7))))
+        kinds.update(plan.split(":")[0].split("+")[0] for plan, _, _ in _candidate_plans(index, keys))
+    assert kinds >= {"direct", "patterns", "background", "mirror-x", "mirror-y", "mirror-xy", "tiles"}
+
+
+@pytest.mark.parametrize("metric", [None, "bytes", "tokens"])
+@pytest.mark.parametrize("name", IMAGES)
+def test_encode_decode_round_trip(tmp_path, name, metric):
+    source = _rgba(IMAGES[name](np.random.default_rng(11)))
+    src, out = tmp_path / "in.png", tmp_path / "out.pxvg.xml"
+    Image.fromarray(source).save(src)
+    stats: dict = {}
+    smart_encode_pxvg(src, out, 1, False, stats=stats, cost_metric=metric)
+    decoded = canvas_to_array(decode_pxvg_to_canvas(out))
+    assert np.array_equal(decoded, _normalized(source)), stats.get("plan")
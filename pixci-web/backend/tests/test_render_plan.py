@@ -0,0 +1,55 @@
+import pytest
+
+from pixci.core.pxvb import load_pxvb, pxvg_to_pxvb
+from pixci.core.render_plan import PostprocessPipeline, compile_pxvg, render_frame, render_frames, render_static
+
+DEPTH = 3000
+
+
+def _chain(depth: int, cycle: bool = False) -> str:
+    # g0 vẽ 1 pixel, g{i} dùng lại g{i-1}; cycle → g0 dùng lại g{depth-1}
+    groups = [f'<group id="g0"><rect x="0" y="0" w="1" h="1" c="#ff0000"/>'
+              f'{f"<use ref=\"g{depth - 1}\"/>" if cycle else ""}</group>']
+    groups += [f'<group id="g{i}"><use ref="g{i - 1}" x="{1 if i % 2 else -1}"/></group>' for i in range(1, depth)]
+    return (f'<pxvg w="4" h="2"><defs>{"".join(groups)}</defs>'
+            f'<layer><use ref="g{depth - 1}"/></layer></pxvg>')
+
+
+def test_deep_use_chain_compiles_and_renders():
+    plan = compile_pxvg(_chain(DEPTH))
+    canvas = render_static(plan)
+    # Offset xen kẽ +1/-1 qua DEPTH - 1 tầng → pixel cuối cùng nằm ở x=1
+    assert [x for x in range(4) if canvas.grid[x][0][3]] == [1]
+    assert load_pxvb(pxvg_to_pxvb(_chain(DEPTH))).defs == plan.defs
+
+
+def test_deep_use_cycle_is_rejected():
+    with pytest.raises(ValueError, match="Vòng tham chiếu"):
+        compile_pxvg(_chain(DEPTH, cycle=True))
+
+
+def _animation(frames: int, postprocess: str) -> str:
+    body = "".join(f'<frame id="{i}"><rect x="{i % 3}" y="1" w="2" h="2" c="#00ff00"/></frame>'
+                   for i in range(frames))
+    return (f'<pxvg w="8" h="8"><animation name="a" columns="{frames}">{body}</animation>'
+            f'<postprocess>{postprocess}</postprocess></pxvg>')
+
+
+def test_postprocess_cache_reuses_identical_frames():
+    plan = compile_pxvg(_animation(9, '<outline sel-out="true"/>'))
+    pipeline = PostprocessPipeline(plan.postprocess)
+    defs, sprites = dict(plan.defs), {}
+    frames = [render_frame(plan, ops, defs, sprites, pipeline) for ops in plan.frames]
+    assert (pipeline.misses, pipeline.hits) == (3, 6)
+    assert [f.grid for f in frames] == [f.grid for f in render_frames(plan)]
+
+
+def test_postprocess_cache_is_bounded():
+    plan = compile_pxvg(_animation(9, '<outline sel-out="true"/>'))
+    pipeline = PostprocessPipeline(plan.postprocess, max_entries=2)
+    defs, sprites = dict(plan.defs), {}
+    for ops in plan.frames:
+        render_frame(plan, ops, defs, sprites, pipeline)
+    # Chu kỳ 3 frame > 2 mục LRU → không frame nào trúng cache
+    assert (pipeline.misses, pipeline.hits) == (9, 0)
+    assert len(pipeline._results) == 2
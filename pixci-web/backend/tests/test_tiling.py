@@ -0,0 +1,36 @@
+import pytest
+
+from pixci.core import tiling
+from pixci.core.canvas import Canvas
+from pixci.core.tiling import TILEABLE_EFFECTS, apply_tiled
+
+
+def _scene(size: int) -> Canvas:
+    canvas = Canvas(size, size)
+    canvas.add_palette({"A": "#d04040", "B": "#40a0d0"})
+    for i in range(0, size - 40, 37):
+        canvas.fill_circle((i + 20, (i * 7) % (size - 40) + 20), 15, "A")
+        canvas.fill_rect((i, size - i - 30), (i + 25, size - i - 10), "B")
+    return canvas
+
+
+@pytest.mark.parametrize("effect", list(TILEABLE_EFFECTS))
+def test_tiled_matches_serial(effect):
+    serial, tiled = _scene(300), _scene(300)
+    getattr(serial, TILEABLE_EFFECTS[effect])()
+    apply_tiled(tiled, effect, workers=2)
+    assert tiled.grid == serial.grid
+
+
+def test_pool_is_reused_and_small_canvas_runs_serially():
+    big = _scene(300)
+    apply_tiled(big, "outline", workers=2)
+    pool = tiling._pool
+    apply_tiled(big, "internal-aa", workers=2)
+    assert pool is not None and tiling._pool is pool
+
+    # Nhỏ hơn MIN_TILED_PIXELS (dù lớn hơn 1 tile) → không đụng tới pool
+    tiling._pool = None
+    apply_tiled(_scene(200), "outline", workers=2, tile_size=64)
+    assert tiling._pool is None
+    tiling._pool = pool
@@ -10,8 +10,10 @@ import traceback
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from pixci.core.grid_engine import encode_image, encode_code, decode_text
-    from pixci.core.pxvg_engine import encode_pxvg, decode_pxvg
+    from pixci.core.grid_engine import decode_text
+    from pixci.core.pxvg_engine import decode_pxvg
+    from pixci.core.analysis import encode_all
+    from pixci.core.encode_cache import encode_cached
 except ImportError as e:
     messagebox.showerror("Import Error", f"Failed to import pixci modules: {e}")
 
@@ -66,7 +68,7 @@ class PixCIGUI(tk.Tk):
         # Format
         ttk.Label(self.encode_frame, text="Định dạng:").grid(row=2, column=0, sticky="w", padx=5, pady=10)
         self.enc_format_var = tk.StringVar(value="grid")
-        formats = ["grid", "code", "code (minecraft)", "pxvg"]
+        formats = ["grid", "code", "code (minecraft)", "pxvg", "all"]
         ttk.Combobox(self.encode_frame, textvariable=self.enc_format_var, values=formats, state="readonly").grid(row=2, column=1, sticky="w", padx=5)
         
         # Auto Block Size
@@ -162,19 +164,24 @@ class PixCIGUI(tk.Tk):
             return
             
         try:
-            if fmt == "pxvg":
+            if fmt == "all":
+                results = encode_all(in_p, out_d / in_p.stem, block_size=1, auto_detect=auto)
+                out_p = ", ".join(path.name for path, _ in results.values())
+                grid_w, grid_h, num_colors, final_block = results["pxvg"][1]
+            elif fmt == "pxvg":
                 out_p = out_d / (in_p.stem + ".pxvg.xml")
-                grid_w, grid_h, num_colors, final_block = encode_pxvg(in_p, out_p, block_size=1, auto_detect=auto)
+                # Cache theo nội dung ảnh: encode lại cùng asset trong phiên GUI không phân tích lại
+                grid_w, grid_h, num_colors, final_block = encode_cached("pxvg", in_p, out_p, block_size=1, auto_detect=auto)
             elif fmt == "code (minecraft)":
                 out_p = out_d / (in_p.stem + ".txt")
                 from pixci.styles.minecraft import MinecraftStyle
                 grid_w, grid_h, num_colors, final_block = MinecraftStyle.encode(in_p, out_p, block_size=1, auto_detect=auto)
             elif fmt == "code":
                 out_p = out_d / (in_p.stem + ".txt")
-                grid_w, grid_h, num_colors, final_block = encode_code(in_p, out_p, block_size=1, auto_detect=auto)
+                grid_w, grid_h, num_colors, final_block = encode_cached("code", in_p, out_p, block_size=1, auto_detect=auto)
             else: # grid
                 out_p = out_d / (in_p.stem + ".txt")
-                grid_w, grid_h, num_colors, final_block = encode_image(in_p, out_p, block_size=1, auto_detect=auto)
+                grid_w, grid_h, num_colors, final_block = encode_cached("grid", in_p, out_p, block_size=1, auto_detect=auto)
                 
             msg = f"Đã encode thành công!\nFile: {out_p}\nKích thước: {grid_w}x{grid_h}\nSố màu: {num_colors}\nBlock size: {final_block}"
             messagebox.showinfo("Thành công", msg)